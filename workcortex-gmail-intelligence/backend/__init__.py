@@ -1,19 +1,37 @@
 """
 Backend package for WorkCortex Gmail Intelligence.
+
+Public names are loaded lazily on first access, so `import backend`
+does not pull in google-auth, NumPy/scikit-learn or pandas until the
+stage that needs them is actually used.
 """
 
-from .events import emit, listen, clear, get_all
-from .engine import Engine
-from .gmail import fetch_emails, authenticate
-from .ml import resolve_identities, normalize_email
-from .excel import save_excel
-from .api import run_pipeline
-
-__all__ = [
-    'emit', 'listen', 'clear', 'get_all',
-    'Engine',
-    'fetch_emails', 'authenticate',
-    'resolve_identities', 'normalize_email',
-    'save_excel'
-    'run_pipeline'
-]
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    'emit': 'events', 'listen': 'events', 'clear': 'events', 'get_all': 'events',
+    'format_timestamp': 'events', 'add_sink': 'events', 'remove_sink': 'events',
+    'EventSink': 'sink',
+    'Engine': 'engine',
+    'fetch_emails': 'gmail', 'authenticate': 'gmail',
+    'resolve_identities': 'ml', 'normalize_email': 'ml',
+    'save_excel': 'excel',
+    'RecipientTable': 'store', 'as_table': 'store',
+    'run_pipeline': 'api',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,201 @@
+"""
+accounts.py - Multi-Account Extraction
+
+Fetches the same sender from several Gmail accounts (one token file per
+account) in parallel, each drawing on its own account's budget in the
+process-wide QuotaManager, then merges the recipients into one
+deduplicated table for identity resolution and export.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .cancel import Cancelled, check_cancelled
+from .events import emit
+from .gmail import fetch_emails, start_cooccurrence, start_traffic, verify_domains
+from .store import RecipientTable
+
+# Context keys copied from the parent context into each account's context
+_SHARED_KEYS = ("sender", "fetch_strategy", "api_retries", "retry_backoff", "shared_quota", "run_id",
+                "auto_tune", "fetch_concurrency", "page_size", "traffic_analytics", "analytics_top_k",
+                "enable_ml", "export_groups", "recipient_graph", "cooccurrence_max_recipients", "cancel")
+
+
+def account_paths(context):
+    """
+    Token files to extract from.
+
+    Reads context["accounts"] (list of token paths), else the
+    GMAIL_TOKEN_PATHS environment variable (os.pathsep-separated).
+    A token listed twice is only fetched once.
+    """
+    accounts = context.get("accounts")
+    if not accounts:
+        accounts = [p for p in os.environ.get("GMAIL_TOKEN_PATHS", "").split(os.pathsep) if p]
+    unique = {}
+    for path in accounts:
+        unique.setdefault(os.path.abspath(path), path)
+    return list(unique.values())
+
+
+def _account_name(token_path):
+    return os.path.splitext(os.path.basename(token_path))[0]
+
+
+def account_labels(paths):
+    """
+    Unique label per token path: the file name, qualified by its
+    directory when file names collide (work/token, home/token).
+
+    Returns:
+        dict of token path -> label
+    """
+    names = [_account_name(path) for path in paths]
+    labels = {}
+    for path, name in zip(paths, names):
+        label = name
+        if names.count(name) > 1:
+            parent = os.path.basename(os.path.dirname(os.path.abspath(path)))
+            label = f"{parent}/{name}" if parent else name
+        base, n = label, 2
+        while label in labels.values():
+            label = f"{base}#{n}"
+            n += 1
+        labels[path] = label
+    return labels
+
+
+def _fetch_account(token_path, name, context):
+    """
+    Fetch one account into its own context; returns (sub_context, seconds).
+    A cancelled fetch returns its partial results with sub["cancelled"] set.
+    """
+    sub = {key: context[key] for key in _SHARED_KEYS if key in context}
+    sub["verify_mx"] = False  # verified once on the merged table
+    if not context.get("shared_quota", True):
+        from .quota import RateLimiter
+        sub["limiter"] = RateLimiter()
+
+    emit(1, f"Fetching account {name}", "Gmail API", "STARTED")
+    started = time.perf_counter()
+    try:
+        # fetch_emails authenticates (once per fetch thread) from the token
+        sub["token_path"] = token_path
+        fetch_emails(sub)
+    except Cancelled as e:
+        sub["cancelled"] = e.reason
+        sub.setdefault("emails", RecipientTable())
+        emit(1, f"Fetching account {name}", "Gmail API", f"CANCELLED: {e.reason}")
+        return sub, time.perf_counter() - started
+    except Exception as e:
+        emit(1, f"Fetching account {name}", "Gmail API", f"FAILED: {e}")
+        raise
+    seconds = time.perf_counter() - started
+    emit(1, f"Fetching account {name} - {len(sub['emails'])} recipients in {seconds:.1f}s",
+         "Gmail API", "SUCCESS")
+    return sub, seconds
+
+
+def fetch_accounts(context):
+    """
+    Fetch recipients from every configured account in parallel.
+
+    Args:
+        context: Execution context
+            Must contain: sender, accounts (token paths) or GMAIL_TOKEN_PATHS
+            Optional: account_workers (default: one per account),
+                      shared_quota (False: private limiter per account
+                                    instead of the shared QuotaManager)
+            Will populate: emails (merged RecipientTable),
+                           message_ids (prefixed with the account label),
+                           accounts_summary (per-account counts/timing,
+                                             keyed by account_labels),
+                           account_errors (token path -> error),
+                           analytics (merged traffic aggregates),
+                           cooccurrence (merged co-occurrence matrix),
+                           fetch_failures (skipped messages, all accounts),
+                           partial (True if cancelled mid-fetch or any
+                                    message was skipped)
+
+    Raises:
+        Exception: If every account fails
+        cancel.Cancelled: If the run is cancelled (partial results kept)
+    """
+    paths = account_paths(context)
+    if not paths:
+        raise ValueError("no accounts configured (context['accounts'] or GMAIL_TOKEN_PATHS)")
+
+    labels = account_labels(paths)
+    merged = RecipientTable()
+    message_ids = []
+    summary = {}
+    errors = {}
+    api_stats = context.setdefault("api_stats", {"calls": 0, "retries": 0, "quota_units": 0, "by_method": {}})
+    workers = int(context.get("account_workers") or len(paths))
+    traffic = start_traffic(context)
+    cooccurrence = start_cooccurrence(context)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_fetch_account, path, labels[path], context): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                sub, seconds = future.result()
+            except Exception as e:
+                errors[path] = str(e)
+                continue
+            merged.merge(sub["emails"])
+            if traffic is not None and sub.get("traffic") is not None:
+                traffic.merge(sub["traffic"])
+            if cooccurrence is not None and sub.get("cooccurrence") is not None:
+                cooccurrence.merge(sub["cooccurrence"])
+            message_ids.extend(f"{labels[path]}:{m}" for m in sub.get("message_ids", []))
+            stats = sub.get("api_stats", {})
+            for key in ("calls", "retries", "quota_units"):
+                api_stats[key] += stats.get(key, 0)
+            summary[labels[path]] = {
+                "token_path": path,
+                "receiver": sub.get("receiver"),
+                "messages": sub.get("message_count", 0),
+                "recipients": len(sub["emails"]),
+                "seconds": round(seconds, 3),
+                "quota_units": stats.get("quota_units", 0),
+                "limiter_wait_seconds": round(getattr(sub.get("limiter"), "waited", 0.0), 3),
+                "strategy": (sub.get("api_usage") or {}).get("strategy"),
+                "tuning": {k: (sub.get("fetch_tuning") or {}).get(k) for k in ("concurrency", "page_size")},
+                "cancelled": sub.get("cancelled"),
+                "fetch_failures": sub.get("fetch_failures", 0),
+            }
+
+    context["accounts_summary"] = summary
+    context["account_errors"] = errors
+    if not summary:
+        raise Exception(f"all {len(paths)} accounts failed: {errors}")
+
+    # Each account already dropped its own address; drop the others' too
+    receivers = {s["receiver"] for s in summary.values() if s["receiver"]}
+    for receiver in receivers:
+        if traffic is not None:
+            traffic.discard(receiver, sum(merged.counts[row] for row in range(len(merged))
+                                          if merged.address(row).casefold() == receiver.casefold()))
+        if cooccurrence is not None:
+            cooccurrence.discard(receiver)
+        merged = merged.exclude(receiver)
+    if traffic is not None:
+        context["analytics"] = traffic.summary()
+
+    failures = sum(s["fetch_failures"] for s in summary.values())
+    if failures:
+        context["fetch_failures"] = failures
+        context["partial"] = True
+    context["message_count"] = sum(s["messages"] for s in summary.values())
+    context["message_ids"] = message_ids
+    print(f"[DEBUG] Merged {len(summary)} accounts: {len(merged)} unique recipients"
+          f" ({len(errors)} account(s) failed)")
+    if any(s["cancelled"] for s in summary.values()):
+        # Keep what the accounts fetched before the cancel
+        context["emails"] = merged
+        context["partial"] = True
+        check_cancelled(context)
+    verify_domains(merged, context)
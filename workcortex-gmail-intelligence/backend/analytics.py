@@ -0,0 +1,173 @@
+"""
+analytics.py - Streaming Traffic Analytics
+
+Aggregates computed while the fetch stage extracts recipients, in a
+single pass and bounded memory: exact occurrence and message counts per
+domain (one entry per domain), plus approximate top recipients from a
+Space-Saving summary whose counts are tightened with a Count-Min sketch
+(see sketch.py). The result is context["analytics"]; the export writes
+it as "Domains" / "Top Recipients" sheets (or CSV sidecars) when
+context["export_analytics"] is set.
+"""
+
+from .sketch import CountMinSketch, SpaceSaving
+
+DOMAIN_COLUMNS = ["domain", "occurrences", "messages", "share"]
+TOP_COLUMNS = ["rank", "recipient_email", "count", "lower_bound"]
+
+
+class TrafficAnalytics:
+    """
+    Single-pass recipient traffic aggregates.
+
+    Args:
+        top_k: Recipients reported by summary()
+        capacity: Space-Saving counters (default 4 * top_k)
+        cms_width, cms_depth: Count-Min sketch dimensions
+    """
+
+    def __init__(self, top_k=25, capacity=None, cms_width=2048, cms_depth=4):
+        self.top_k = int(top_k)
+        self.heavy = SpaceSaving(capacity or 4 * self.top_k)
+        self.cms = CountMinSketch(cms_width, cms_depth)
+        self.domains = {}
+        self.messages = 0
+        self.occurrences = 0
+        self._ignored = set()
+
+    def ignore(self, address):
+        """Leave an address (e.g. the mailbox owner) out of every aggregate."""
+        if address:
+            self._ignored.add(address.casefold())
+
+    @staticmethod
+    def _key(address):
+        # Addresses are compared case-insensitively (like RecipientTable.exclude)
+        return address.lower()
+
+    def _count(self, address, count):
+        address = self._key(address)
+        self.occurrences += count
+        self.heavy.add(address, count)
+        self.cms.add(address, count)
+        domain = address.rpartition("@")[2]
+        entry = self.domains.get(domain)
+        if entry is None:
+            entry = self.domains[domain] = [0, 0]
+        entry[0] += count
+        return domain
+
+    def add_message(self, addresses):
+        """Count the recipients of one message."""
+        self.messages += 1
+        seen = set()
+        for address in addresses:
+            if address.casefold() in self._ignored:
+                continue
+            seen.add(self._count(address, 1))
+        for domain in seen:
+            self.domains[domain][1] += 1
+
+    def add_counts(self, counts, domain_messages=None, messages=0):
+        """
+        Count pre-aggregated results (e.g. from the mbox scanner).
+
+        Args:
+            counts: {address: occurrences}
+            domain_messages: {domain: messages with a recipient there}
+            messages: Messages the counts came from
+        """
+        self.messages += messages
+        for address, count in counts.items():
+            if address.casefold() not in self._ignored:
+                self._count(address, count)
+        for domain, n in (domain_messages or {}).items():
+            entry = self.domains.get(domain.lower())
+            if entry is not None:
+                entry[1] += n
+
+    def merge(self, other):
+        """Fold another account's aggregates into this one."""
+        self.messages += other.messages
+        self.occurrences += other.occurrences
+        for domain, (occurrences, messages) in other.domains.items():
+            entry = self.domains.setdefault(domain, [0, 0])
+            entry[0] += occurrences
+            entry[1] += messages
+        self.heavy.merge(other.heavy)
+        self.cms.merge(other.cms)
+        self._ignored |= other._ignored
+
+    def discard(self, address, count):
+        """
+        Remove `count` known occurrences of an address after the fact
+        (another account's owner in a multi-account run).
+
+        The domain's message count is only known to be at most its
+        remaining occurrences, so it is clamped to that (exact, 0, when
+        the address was the domain's only recipient).
+        """
+        if not count:
+            return
+        self.ignore(address)
+        address = self._key(address)
+        self.occurrences -= count
+        entry = self.domains.get(address.rpartition("@")[2])
+        if entry is not None:
+            entry[0] -= count
+            entry[1] = min(entry[1], entry[0])
+        self._drop_heavy(lambda value: value == address)
+
+    def discard_domain(self, domain):
+        """Remove a whole domain (e.g. one that failed MX verification)."""
+        domain = domain.lower()
+        entry = self.domains.pop(domain, None)
+        if entry is None:
+            return
+        self.occurrences -= entry[0]
+        self._drop_heavy(lambda value: value.rpartition("@")[2] == domain)
+
+    def _drop_heavy(self, matches):
+        for value in [v for v in self.heavy.counts if matches(v)]:
+            del self.heavy.counts[value], self.heavy.errors[value]
+
+    def summary(self):
+        """
+        Plain-data aggregates.
+
+        Returns:
+            dict with messages, occurrences, domain_count, domains (list
+            of DOMAIN_COLUMNS dicts, most occurrences first) and
+            top_recipients (TOP_COLUMNS dicts; the true count lies in
+            [lower_bound, count])
+        """
+        total = self.occurrences or 1
+        domains = [
+            {"domain": domain, "occurrences": occurrences, "messages": messages,
+             "share": round(occurrences / total, 4)}
+            for domain, (occurrences, messages) in sorted(self.domains.items(), key=lambda d: (-d[1][0], d[0]))
+            if occurrences > 0
+        ]
+        top = []
+        for value, count, error in self.heavy.top(self.top_k):
+            # Both sketches overestimate; the smaller bound is the better one
+            upper = min(count, self.cms.estimate(value))
+            top.append({"recipient_email": value, "count": upper, "lower_bound": max(0, count - error)})
+        top.sort(key=lambda row: (-row["count"], row["recipient_email"]))
+        for rank, row in enumerate(top, 1):
+            row["rank"] = rank
+        return {
+            "messages": self.messages,
+            "occurrences": self.occurrences,
+            "domain_count": len(domains),
+            "domains": domains,
+            "top_recipients": top,
+        }
+
+
+def analytics_sheets(analytics):
+    """(sheet name, CSV sidecar suffix, columns, rows) for an analytics summary."""
+    return [
+        ("Domains", ".domains.csv", DOMAIN_COLUMNS, analytics.get("domains", [])),
+        ("Top Recipients", ".top_recipients.csv", TOP_COLUMNS, analytics.get("top_recipients", [])),
+    ]
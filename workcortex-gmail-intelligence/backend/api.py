@@ -8,8 +8,83 @@ can call to execute the engine without duplicating wiring logic.
 from .events import clear
 from .engine import Engine
 from .gmail import fetch_emails
+from .accounts import account_paths, fetch_accounts
+from .mbox import fetch_mbox
+from .preview import preview_sender
 from .ml import resolve_identities
 from .excel import save_excel
+from .cache import check_result_cache, store_result_cache, cache_miss
+from .results import new_run_id
+
+# Context fields every fetch source sets (see Engine.add_step provides=)
+FETCH_OUTPUTS = ("emails", "message_count", "message_ids")
+
+
+def build_engine(context):
+    """
+    Create an Engine with the standard steps for a context.
+    
+    Also assigns context["run_id"] if the caller did not.
+    
+    Args:
+        context: dict of pipeline options (reads `enable_ml`, `accounts`,
+                 `mbox_path`, `preview`, `result_cache`, `incremental`)
+    
+    Returns:
+        Configured Engine
+    
+    Raises:
+        ValueError: If the options name conflicting sources (mbox_path
+                    with preview, or with accounts)
+    """
+    if context.get("mbox_path"):
+        if context.get("preview"):
+            raise ValueError("preview samples the Gmail API; it cannot be combined with mbox_path")
+        if context.get("accounts"):
+            raise ValueError("mbox_path and accounts are alternative sources; set only one")
+    context.setdefault("run_id", new_run_id())
+    engine = Engine()
+    if context.get("preview"):
+        # Estimate only: no full fetch, ML or export
+        engine.add_step(1, "Previewing Sender", "Gmail API", preview_sender,
+                        requires=("sender",), provides=("preview_result",))
+        return engine
+
+    accounts = account_paths(context)
+    if context.get("mbox_path"):
+        # Offline source: local mbox / Takeout export instead of the API
+        engine.add_step(1, "Reading Mbox Export", "Mbox", fetch_mbox,
+                        requires=("sender", "mbox_path"), provides=FETCH_OUTPUTS)
+    elif accounts:
+        engine.add_step(1, f"Fetching Gmail Emails ({len(accounts)} accounts)", "Gmail API", fetch_accounts,
+                        requires=("sender",), provides=FETCH_OUTPUTS)
+    else:
+        engine.add_step(1, "Fetching Gmail Emails", "Gmail API", fetch_emails,
+                        requires=("sender",), provides=FETCH_OUTPUTS)
+
+    # With the result cache on, ML and export only run on a cache miss.
+    # Incremental exports depend on the previous output, so never cache them.
+    use_cache = context.get("result_cache", True) and not context.get("incremental")
+    when = cache_miss if use_cache else None
+    order = 2
+    if use_cache:
+        engine.add_step(order, "Checking Result Cache", "Cache", check_result_cache, provides=("cache_hit",))
+        order += 1
+
+    if context.get("enable_ml", True):
+        engine.add_step(order, "Resolving Duplicate Identities", "ML Engine", resolve_identities, when=when,
+                        requires=("emails",), provides=("emails", "identity_count"))
+        order += 1
+    # After a cancel the export still writes what was fetched (to a .partial file)
+    engine.add_step(order, "Saving to Excel", "Pandas/Excel", save_excel, when=when,
+                    requires=("emails", "output_path"), provides=("excel_path", "recipient_count"),
+                    after_cancel=True)
+
+    if use_cache:
+        engine.add_step(order + 1, "Storing Result Cache", "Cache", store_result_cache, when=when,
+                        requires=("excel_path",))
+
+    return engine
 
 
 def run_pipeline(context):
@@ -17,7 +92,9 @@ def run_pipeline(context):
     Run the full pipeline using the Engine.
 
     Args:
-        context: dict with at least `sender` and `output_path` keys.
+        context: dict or context.PipelineContext with at least `sender`
+                 and `output_path` keys (only `sender` when `preview` is
+                 set; the estimate is returned in context["preview_result"]).
 
     Returns:
         success (bool)
@@ -25,19 +102,5 @@ def run_pipeline(context):
     # Ensure events are cleared before running
     clear()
 
-    engine = Engine()
-    engine.add_step(1, "Fetching Gmail Emails", "Gmail API", fetch_emails)
-
-    if context.get("enable_ml", True):
-        engine.add_step(2, "Resolving Duplicate Identities", "ML Engine", resolve_identities)
-        engine.add_step(3, "Saving to Excel", "Pandas/Excel", save_excel)
-    else:
-        engine.add_step(2, "Saving to Excel", "Pandas/Excel", save_excel)
-
-    success = engine.run(context)
-
-    # Populate helpful metrics if available
-    if "emails" in context:
-        context.setdefault("identity_count", len(context.get("emails", [])))
-
-    return success
+    engine = build_engine(context)
+    return engine.run(context)
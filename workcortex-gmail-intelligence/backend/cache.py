@@ -0,0 +1,208 @@
+"""
+cache.py - Result Cache
+
+Content-addressed cache of exported results. The key is a digest of the
+fetched message ids plus the options that shape the output, so when a
+sender's messages and the run options are unchanged the ML and export
+steps are skipped and the previous output files are reused (hardlinked
+when possible, else copied).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from . import metrics
+from .events import emit
+from .settings import cache_dir
+
+# Bump when the output format changes so stale entries are ignored
+CACHE_VERSION = 2
+
+# Context options that change what the export contains (the source -
+# accounts / mbox files - is keyed separately, see _source_key)
+KEY_OPTIONS = ("sender", "enable_ml", "verify_mx", "export_clusters", "traffic_analytics",
+               "export_analytics", "export_groups", "recipient_graph", "analytics_top_k",
+               "cooccurrence_max_recipients", "alias_max_cooccurrence", "group_min_cooccurrence")
+
+
+def _source_key(context):
+    """Where the messages came from: account token files or mbox files."""
+    from .accounts import account_paths
+    from .mbox import mbox_files
+
+    if context.get("mbox_path"):
+        return {"mbox": [os.path.abspath(p) for p in mbox_files(context["mbox_path"])]}
+    return {"accounts": sorted(os.path.abspath(p) for p in account_paths(context))}
+
+
+def result_digest(context):
+    """
+    Digest of the fetched message ids and output-shaping options.
+
+    Args:
+        context: Execution context with message_ids (list of str)
+
+    Returns:
+        Hex digest, or None if the fetch did not record message ids
+    """
+    message_ids = context.get("message_ids")
+    if message_ids is None:
+        return None
+    h = hashlib.sha256()
+    config = {key: context.get(key) for key in KEY_OPTIONS}
+    config["source"] = _source_key(context)
+    config["version"] = CACHE_VERSION
+    config["format"] = os.path.splitext(context.get("output_path") or "")[1].lower()
+    h.update(json.dumps(config, sort_keys=True, default=str).encode())
+    for message_id in sorted(message_ids):
+        h.update(b"\0")
+        h.update(str(message_id).encode())
+    return h.hexdigest()
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _entry_dir(digest):
+    return cache_dir("results", digest[:2])
+
+
+def _meta_path(digest):
+    return os.path.join(_entry_dir(digest), f"{digest}.json")
+
+
+def _place(src, dest):
+    """Put `src` at `dest` atomically, hardlinking when possible."""
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    if os.path.exists(dest) and os.path.samefile(src, dest):
+        # Already linked (rename onto the same inode would be a no-op)
+        return "hardlink"
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest)), suffix=".tmp")
+    os.close(fd)
+    os.remove(tmp)
+    try:
+        os.link(src, tmp)
+        how = "hardlink"
+    except OSError:
+        shutil.copy2(src, tmp)
+        how = "copy"
+    os.replace(tmp, dest)
+    return how
+
+
+def _suffixes(output_path, files):
+    """Map each output file to its suffix relative to the output's stem."""
+    stem = os.path.splitext(output_path)[0]
+    return [f[len(stem):] for f in files if f.startswith(stem)]
+
+
+def check_result_cache(context):
+    """
+    Reuse a previous export if nothing changed.
+
+    Args:
+        context: Execution context
+            Must contain: output_path, message_ids (set by the fetch stage)
+            Will populate: result_digest, cache_hit (bool) and on a hit:
+                           excel_path, output_files, recipient_count,
+                           identity_count, results_run_id
+    """
+    context["cache_hit"] = False
+    digest = context["result_digest"] = result_digest(context)
+    if digest is None or not os.path.exists(_meta_path(digest)):
+        metrics.record_cache(False)
+        emit(995, "Result cache - miss", "Cache", "SUCCESS")
+        return
+
+    with open(_meta_path(digest)) as f:
+        meta = json.load(f)
+    if meta.get("partial"):
+        # Never serve the output of a run that skipped messages
+        metrics.record_cache(False)
+        emit(995, "Result cache - partial entry ignored", "Cache", "SUCCESS")
+        return
+
+    # Verify cached files are intact (a hardlinked output may have been edited)
+    entries = []
+    for suffix, sha in meta["files"].items():
+        cached = os.path.join(_entry_dir(digest), digest + suffix)
+        if not os.path.exists(cached) or _file_sha256(cached) != sha:
+            metrics.record_cache(False)
+            emit(995, "Result cache - stale entry ignored", "Cache", "SUCCESS")
+            return
+        entries.append((suffix, cached))
+
+    output_path = context["output_path"]
+    stem = os.path.splitext(output_path)[0]
+    files = []
+    how = None
+    for suffix, cached in entries:
+        how = _place(cached, stem + suffix)
+        files.append(stem + suffix)
+
+    context["cache_hit"] = True
+    metrics.record_cache(True)
+    context["excel_path"] = output_path
+    context["output_files"] = files
+    context["recipient_count"] = meta.get("recipient_count")
+    if meta.get("identity_count") is not None:
+        context["identity_count"] = meta["identity_count"]
+    if meta.get("results_run_id"):
+        # Browse the indexed recipients of the run that produced the files
+        context["results_run_id"] = meta["results_run_id"]
+    emit(995, f"Result cache - reused previous output ({how})", "Cache", "CACHE HIT")
+
+
+def store_result_cache(context):
+    """
+    Save this run's output files under its result digest.
+
+    Partial runs (cancelled, or messages skipped - context["partial"] /
+    fetch_failures) are not stored, and drop any entry under the digest.
+
+    Args:
+        context: Execution context
+            Must contain: result_digest, output_path, output_files
+    """
+    digest = context.get("result_digest")
+    files = context.get("output_files") or []
+    if not digest or not files:
+        return
+    if context.get("partial") or context.get("fetch_failures"):
+        if os.path.exists(_meta_path(digest)):
+            os.remove(_meta_path(digest))
+        emit(995, "Result cache - partial run not stored", "Cache", "SKIPPED")
+        return
+
+    hashes = {}
+    for suffix, path in zip(_suffixes(context["output_path"], files), files):
+        _place(path, os.path.join(_entry_dir(digest), digest + suffix))
+        hashes[suffix] = _file_sha256(path)
+
+    meta = {
+        "version": CACHE_VERSION,
+        "files": hashes,
+        "recipient_count": context.get("recipient_count"),
+        "identity_count": context.get("identity_count"),
+        "results_run_id": context.get("results_run_id"),
+        "message_count": len(context.get("message_ids") or []),
+        "partial": False,
+    }
+    fd, tmp = tempfile.mkstemp(dir=_entry_dir(digest), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, _meta_path(digest))
+    emit(995, "Result cache - stored", "Cache", "SUCCESS")
+
+
+def cache_miss(context):
+    """Step predicate: run ML/export only when the result cache missed."""
+    return not context.get("cache_hit")
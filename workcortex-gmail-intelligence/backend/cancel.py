@@ -0,0 +1,118 @@
+"""
+cancel.py - Cooperative Cancellation
+
+A CancelToken travels in context["cancel"] (Engine.run creates one if
+the caller did not) and carries both an explicit cancel request (Ctrl-C,
+UI button, job cancel) and the run's overall deadline. Long-running
+steps call check() at page/batch granularity; it raises Cancelled, which
+the engine reports as a CANCELLED event while the step's partial results
+stay in the context.
+
+Cancelled derives from BaseException (like asyncio.CancelledError) so
+the many `except Exception` handlers that skip one bad message or
+domain do not swallow it.
+"""
+
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Cancelled(BaseException):
+    """Raised by CancelToken.check() once a run is cancelled or out of time."""
+
+    def __init__(self, reason="cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Thread-safe cancel flag with an optional deadline.
+
+    Args:
+        deadline: Seconds from now the run may take (None: no limit)
+    """
+
+    def __init__(self, deadline=None):
+        self.deadline = time.monotonic() + float(deadline) if deadline else None
+        self._event = threading.Event()
+        self._reason = None
+
+    def cancel(self, reason="cancelled"):
+        """Request cancellation (the first reason given is kept)."""
+        if self._reason is None:
+            self._reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        """True once cancel() was called or the deadline has passed."""
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+        return self._event.is_set()
+
+    @property
+    def reason(self):
+        return self._reason if self.cancelled else None
+
+    def remaining(self):
+        """Seconds left before the deadline (None without one)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """
+        Raises:
+            Cancelled: If the run was cancelled or its deadline passed
+        """
+        if self.cancelled:
+            raise Cancelled(self._reason)
+
+    def sleep(self, seconds):
+        """
+        Sleep like time.sleep, waking early on cancellation.
+
+        Raises:
+            Cancelled: If the run is cancelled before or during the sleep
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self._event.wait(remaining)
+        else:
+            self._event.wait(seconds)
+        self.check()
+
+
+def check_cancelled(context):
+    """Raise Cancelled if the context's run was cancelled or ran out of time."""
+    token = context.get("cancel")
+    if token is not None:
+        token.check()
+
+
+@contextmanager
+def cancel_on_sigint(token):
+    """
+    While active, the first Ctrl-C (SIGINT) cancels `token` so the run
+    stops at its next check and still reports; a second one raises
+    KeyboardInterrupt as usual. A no-op outside the main thread (e.g.
+    under Streamlit), where signal handlers cannot be installed.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield token
+        return
+
+    def handle(_signum, _frame):
+        if token.cancelled:
+            raise KeyboardInterrupt
+        print("\nCancelling... (press Ctrl-C again to abort)")
+        token.cancel("interrupted")
+
+    previous = signal.signal(signal.SIGINT, handle)
+    try:
+        yield token
+    finally:
+        signal.signal(signal.SIGINT, previous)
@@ -0,0 +1,871 @@
+"""
+cli.py - Headless Command Line Interface
+
+Non-interactive entry point for scheduled and batch runs.
+
+Usage:
+    python -m backend.cli run --sender a@b.com --output out.xlsx
+    python -m backend.cli run --config run.toml --summary summary.json
+    python -m backend.cli resume
+    python -m backend.cli benchmark --recipients 2000
+    python -m backend.cli --fake-gmail messages=5000,latency=0.01 benchmark --fetch
+    python -m backend.cli run --sender a@b.com --output out.xlsx --record snapshot.json.gz
+    python -m backend.cli benchmark --fetch --replay snapshot.json.gz --fetch-strategy threads
+    python -m backend.cli cache info | cache clear
+    python -m backend.cli submit --sender a@b.com --output out.xlsx --priority 5
+    python -m backend.cli worker --concurrency 4 --account-cap 1
+    python -m backend.cli job status 12 | job events 12 | job result 12 | job cancel 12
+    python -m backend.cli --quota-db quota.db quota
+    python -m backend.cli --metrics-file /var/lib/node_exporter/workcortex.prom run ...
+
+Options can come from flags or a TOML/YAML config file (flags win).
+A JSON summary (counts, step durations, cache stats) is written on exit.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from .events import listen, clear, format_timestamp
+from .settings import cache_dir, file_mode, last_run_path
+
+logger = logging.getLogger("workcortex")
+
+# Pipeline options accepted from a config file or flags, with defaults
+RUN_DEFAULTS = {
+    "sender": None,
+    "output_path": None,
+    "enable_ml": True,
+    "verify_mx": False,
+    "export_clusters": False,
+    "export_groups": False,
+    "export_analytics": False,
+    "recipient_graph": None,
+    "fetch_strategy": "auto",
+    "auto_tune": True,
+    "fetch_concurrency": None,
+    "page_size": None,
+    "traffic_analytics": True,
+    "accounts": None,
+    "mbox_path": None,
+    "record_path": None,
+    "replay_path": None,
+    "replay_scale": 1.0,
+    "preview": False,
+    "result_cache": True,
+    "incremental": False,
+    "deadline": None,
+}
+
+# Config file key aliases -> context keys
+CONFIG_ALIASES = {"output": "output_path"}
+
+
+def load_config(path):
+    """
+    Load run options from a TOML, YAML or JSON file.
+
+    A `[run]` table/section is used if present, else the top level.
+
+    Args:
+        path: .toml, .yaml, .yml or .json file
+
+    Returns:
+        dict of options
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".toml":
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    elif ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("YAML config requires PyYAML (pip install pyyaml)")
+        with open(path) as f:
+            data = yaml.safe_load(f) or {}
+    elif ext == ".json":
+        with open(path) as f:
+            data = json.load(f)
+    else:
+        raise ValueError(f"Unsupported config format: {path} (use .toml, .yaml or .json)")
+
+    data = data.get("run", data)
+    return {CONFIG_ALIASES.get(k, k.replace("-", "_")): v for k, v in data.items()}
+
+
+def setup_logging(level="WARNING", log_file=None, sink=None):
+    """
+    Configure the `workcortex` logger.
+
+    Nothing is written to a file unless `log_file` or `sink` is given, and
+    the level gates everything else, so per-event logging can be turned off.
+    """
+    logger.handlers.clear()
+    logger.setLevel(getattr(logging, str(level).upper(), logging.WARNING))
+    logger.propagate = False
+    formatter = logging.Formatter('%(asctime)s | %(levelname)-8s | %(message)s')
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, mode="a"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    if sink is not None:
+        from .sink import SinkLogHandler
+        logger.addHandler(SinkLogHandler(sink))
+
+
+def open_event_log(path):
+    """Start a rotating JSONL sink at `path` and route every event to it."""
+    from .events import add_sink
+    from .sink import EventSink
+
+    sink = EventSink(path)
+    add_sink(sink)
+    return sink
+
+
+def print_events(events):
+    """Print the event log table (same layout as the interactive entry points)."""
+    print("-" * 100)
+    print(f"{'Timestamp':<20} | {'Order':<5} | {'Step':<35} | {'Tool':<20} | {'Status':<15}")
+    print("-" * 100)
+    for event in events:
+        timestamp = format_timestamp(event)
+        order = event.get("order", "?")
+        step = event.get("step", "?")[:35]
+        tool = event.get("tool", "?")[:20]
+        status = event.get("status", "?")
+        print(f"{timestamp:<20} | {order:<5} | {step:<35} | {tool:<20} | {status:<15}")
+    print("-" * 100)
+
+
+def echo_events(events, mode):
+    """
+    Report events once, according to `mode`.
+
+    Args:
+        events: list of event dicts
+        mode: "table" (print table), "log" (logger.info per event) or "none"
+    """
+    if mode == "table":
+        print_events(events)
+    elif mode == "log":
+        for event in events:
+            logger.info(f"Step {event.get('order')}: {event.get('step')} ({event.get('tool')}) - {event.get('status')}")
+
+
+def cache_stats():
+    """Number of files and bytes under the cache directory."""
+    files = 0
+    size = 0
+    for root, _dirs, names in os.walk(cache_dir()):
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+                files += 1
+            except OSError:
+                continue
+    return {"path": cache_dir(), "files": files, "bytes": size}
+
+
+def quota_utilization():
+    """Utilization of the shared quota manager (see quota.py)."""
+    from .quota import get_manager
+    return get_manager().utilization()
+
+
+def write_summary(path, summary):
+    """Write a JSON summary atomically (temp file + rename)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(summary, f, indent=2, default=str)
+    os.chmod(tmp, file_mode(path))
+    os.replace(tmp, path)
+
+
+def execute(options, summary_path=None, events_mode="table", command="run"):
+    """
+    Run the pipeline for a set of options and write its summary.
+
+    Args:
+        options: dict with RUN_DEFAULTS keys
+        summary_path: Extra location for the JSON summary (the last-run
+                      summary used by `resume` is always written)
+        events_mode: See echo_events
+        command: Name recorded in the summary
+
+    Returns:
+        Process exit code (130 if cancelled with Ctrl-C / job cancel,
+        124 if the deadline passed)
+    """
+    from .api import build_engine
+    from .cancel import CancelToken, cancel_on_sigint
+    from .context import PipelineContext
+
+    required = ("sender",) if options.get("preview") else ("sender", "output_path")
+    missing = [k for k in required if not options.get(k)]
+    if missing:
+        logger.error(f"Missing required option(s): {', '.join(missing)}")
+        return 2
+
+    try:
+        context = PipelineContext({k: options.get(k, v) for k, v in RUN_DEFAULTS.items()})
+        if options.get("run_id"):
+            context["run_id"] = options["run_id"]
+    except TypeError as e:
+        logger.error(f"Invalid run option: {e}")
+        return 2
+    logger.info(f"Starting pipeline with sender: {context['sender']}")
+
+    # Ctrl-C (or a job cancel, which sends SIGINT) stops the run at its
+    # next check and still writes the summary
+    context["cancel"] = CancelToken(context.get("deadline"))
+    clear()
+    try:
+        engine = build_engine(context)
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+    started = time.time()
+    exit_code = 1
+    try:
+        with cancel_on_sigint(context["cancel"]):
+            success = engine.run(context)
+        if success:
+            exit_code = 0
+        elif context.get("cancelled"):
+            exit_code = 124 if context["cancelled"] == "deadline exceeded" else 130
+    except KeyboardInterrupt:
+        logger.warning("Pipeline interrupted by user")
+        exit_code = 130
+    finally:
+        events = list(listen())
+        echo_events(events, events_mode)
+        summary = {
+            "command": command,
+            "run_id": context.get("run_id"),
+            "results_run_id": context.get("results_run_id"),
+            "status": "CANCELLED" if context.get("cancelled") else {0: "SUCCESS", 130: "INTERRUPTED"}.get(exit_code, "FAILED"),
+            "cancelled": context.get("cancelled"),
+            "partial": bool(context.get("partial")),
+            "started_at": started,
+            "duration_seconds": round(time.time() - started, 4),
+            "config": context_options(context),
+            "counts": {
+                "messages": context.get("message_count"),
+                "recipients": context.get("recipient_count"),
+                "fetched_recipients": len(context.get("emails") or []),
+                "fetch_failures": context.get("fetch_failures", 0),
+                "identities": context.get("identity_count"),
+                "cooccurrence_splits": context.get("cooccurrence_splits"),
+                "groups": context.get("group_count"),
+                "verification_failures": len(context.get("verification_failures", [])),
+            },
+            "steps": engine.timings,
+            "preview": context.get("preview_result"),
+            "api": {"stats": context.get("api_stats"), "usage": context.get("api_usage"),
+                    "tuning": context.get("fetch_tuning")},
+            "accounts": context.get("accounts_summary"),
+            "account_errors": context.get("account_errors"),
+            "output_path": context.get("excel_path"),
+            "export": context.get("export_delta"),
+            "analytics": _analytics_summary(context.get("analytics")),
+            "cache": dict(cache_stats(), result_hit=context.get("cache_hit"), result_digest=context.get("result_digest")),
+            "quota": quota_utilization(),
+            "events": len(events),
+        }
+        write_summary(last_run_path(), summary)
+        if summary_path:
+            write_summary(summary_path, summary)
+
+    if context.get("preview_result"):
+        print(json.dumps(context["preview_result"], indent=2))
+    if exit_code == 0:
+        logger.info(f"Pipeline completed: {context.get('recipient_count', 0)} recipients -> {context.get('excel_path')}")
+        if context.get("fetch_failures"):
+            logger.warning(f"{context['fetch_failures']} message(s) could not be fetched and were skipped")
+    elif context.get("cancelled"):
+        logger.warning(f"Pipeline cancelled ({context['cancelled']}) with "
+                       f"{len(context.get('emails') or [])} recipients in hand"
+                       + (f" -> {context['excel_path']}" if context.get("excel_path") else ""))
+    else:
+        failures = [e["status"] for e in events if str(e.get("status", "")).startswith("FAILED")]
+        logger.error(f"Pipeline failed{': ' + failures[-1] if failures else ''}")
+    return exit_code
+
+
+def _analytics_summary(analytics, limit=25):
+    """Run-summary view of context["analytics"] (top `limit` domains only)."""
+    if not analytics:
+        return None
+    return dict(analytics, domains=analytics["domains"][:limit])
+
+
+def context_options(context):
+    """The RUN_DEFAULTS subset of a context (what `resume` needs to re-run)."""
+    return {k: context.get(k, v) for k, v in RUN_DEFAULTS.items()}
+
+
+def run_options(args):
+    """Run options from --config plus flags (flags win)."""
+    options = dict(RUN_DEFAULTS)
+    if args.config:
+        options.update(load_config(args.config))
+    flags = {
+        "sender": args.sender,
+        "output_path": args.output,
+        "enable_ml": args.enable_ml,
+        "verify_mx": args.verify_mx,
+        "export_clusters": args.export_clusters,
+        "export_groups": args.export_groups,
+        "export_analytics": args.export_analytics,
+        "recipient_graph": args.recipient_graph,
+        "fetch_strategy": args.fetch_strategy,
+        "auto_tune": args.auto_tune,
+        "fetch_concurrency": args.fetch_concurrency,
+        "page_size": args.page_size,
+        "traffic_analytics": args.traffic_analytics,
+        "accounts": args.accounts,
+        "mbox_path": args.mbox,
+        "record_path": args.record,
+        "replay_path": args.replay,
+        "replay_scale": args.replay_scale,
+        "preview": args.preview,
+        "result_cache": args.result_cache,
+        "incremental": args.incremental,
+        "deadline": args.deadline,
+    }
+    options.update({k: v for k, v in flags.items() if v is not None})
+    return options
+
+
+def cmd_run(args):
+    return execute(run_options(args), args.summary, args.events)
+
+
+def cmd_submit(args):
+    from .jobs import JobQueue
+
+    options = run_options(args)
+    required = ("sender",) if options.get("preview") else ("sender", "output_path")
+    missing = [k for k in required if not options.get(k)]
+    if missing:
+        logger.error(f"Missing required option(s): {', '.join(missing)}")
+        return 2
+    if options.get("output_path"):
+        # The worker runs from another directory
+        options["output_path"] = os.path.abspath(options["output_path"])
+    if options.get("mbox_path"):
+        options["mbox_path"] = [os.path.abspath(p) for p in options["mbox_path"]]
+    for key in ("record_path", "replay_path"):
+        if options.get(key):
+            options[key] = os.path.abspath(options[key])
+    job_id = JobQueue().submit(options, args.priority)
+    print(json.dumps({"job_id": job_id, "status": "QUEUED"}))
+    return 0
+
+
+def cmd_worker(args):
+    from .jobs import JobQueue, Worker
+
+    worker = Worker(JobQueue(), args.concurrency, args.account_cap, args.poll)
+    try:
+        count = worker.run(exit_when_idle=args.exit_when_idle)
+    except KeyboardInterrupt:
+        # Jobs left RUNNING are requeued when a worker starts again
+        logger.warning("Worker interrupted")
+        return 130
+    logger.info(f"Worker ran {count} job(s)")
+    return 0
+
+
+def cmd_job(args):
+    from .jobs import JobQueue
+
+    queue = JobQueue()
+    if args.action == "list":
+        jobs = [
+            {k: j[k] for k in ("id", "status", "priority", "created", "started", "finished", "error")}
+            for j in queue.list()
+        ]
+        print(json.dumps(jobs, indent=2, default=str))
+        return 0
+    if args.job_id is None:
+        logger.error(f"job {args.action} needs a job id")
+        return 2
+    job = queue.get(args.job_id)
+    if job is None:
+        logger.error(f"No job {args.job_id}")
+        return 2
+    if args.action == "status":
+        job.pop("result")
+        print(json.dumps(job, indent=2, default=str))
+    elif args.action == "events":
+        print_events(queue.events(args.job_id))
+    elif args.action == "result":
+        print(json.dumps(job["result"], indent=2, default=str))
+    elif args.action == "cancel":
+        ok = queue.cancel(args.job_id)
+        print(json.dumps({"job_id": args.job_id, "cancelled": ok}))
+        return 0 if ok else 1
+    return 0
+
+
+def cmd_resume(args):
+    path = args.from_summary or last_run_path()
+    if not os.path.exists(path):
+        logger.error(f"No previous run summary at {path}")
+        return 2
+    with open(path) as f:
+        previous = json.load(f)
+    if previous.get("status") == "SUCCESS" and not args.force:
+        print(f"Last run succeeded ({previous.get('output_path')}); use --force to run it again")
+        return 0
+    return execute(previous.get("config", {}), args.summary, args.events, command="resume")
+
+
+def synthetic_emails(count, seed=0):
+    """Deterministic synthetic recipient addresses for benchmarks."""
+    import random
+
+    rng = random.Random(seed)
+    firsts = ["alice", "bob", "carol", "dave", "eve", "frank", "grace", "heidi", "ivan", "judy"]
+    lasts = ["smith", "jones", "brown", "lee", "garcia", "khan", "ng", "rossi"]
+    domains = ["gmail.com", "company.com", "example.org", "startup.io", "research.edu"]
+    seps = [".", "_", ""]
+    return [
+        f"{rng.choice(firsts)}{rng.choice(seps)}{rng.choice(lasts)}{rng.randrange(count)}@{rng.choice(domains)}"
+        for _ in range(count)
+    ]
+
+
+# Startup scenarios: (name, statement, modules that must NOT be imported)
+IMPORT_SCENARIOS = [
+    ("package", "import backend", ["pandas", "sklearn", "numpy", "googleapiclient"]),
+    ("pipeline wiring", "import backend.api", ["pandas", "sklearn", "numpy", "googleapiclient"]),
+    ("cli", "import backend.cli", ["pandas", "sklearn", "numpy", "googleapiclient"]),
+    ("csv export, ML off",
+     "import os, tempfile; from backend.excel import save_excel; "
+     "save_excel({'emails': ['a@b.com'], 'enable_ml': False, 'index_results': False, "
+     "'output_path': os.path.join(tempfile.mkdtemp(), 'out.csv')})",
+     ["pandas", "sklearn", "numpy"]),
+]
+
+
+def import_profile(statement):
+    """
+    Run `statement` in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        (total_seconds, {top-level module: cumulative seconds})
+    """
+    import subprocess
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=root, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+
+    total_us = 0
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        total_us += int(self_us)
+        # Indentation marks nesting; keep the top-level package name
+        modules[name.split(".")[0]] = max(modules.get(name.split(".")[0], 0), int(cumulative_us))
+    return total_us / 1e6, {k: v / 1e6 for k, v in modules.items()}
+
+
+def cmd_benchmark_imports(args):
+    """Measure startup import time and check heavy modules stay unloaded."""
+    results = []
+    ok = True
+    for name, statement, forbidden in IMPORT_SCENARIOS:
+        seconds, modules = import_profile(statement)
+        leaked = [m for m in forbidden if m in modules]
+        ok = ok and not leaked
+        results.append({
+            "scenario": name,
+            "import_seconds": round(seconds, 4),
+            "slowest": {k: round(v, 4) for k, v in sorted(modules.items(), key=lambda kv: -kv[1])[:5]},
+            "unexpected_heavy_imports": leaked,
+        })
+
+    summary = {"command": "benchmark", "mode": "imports", "ok": ok, "scenarios": results}
+    print(json.dumps(summary, indent=2))
+    if args.summary:
+        write_summary(args.summary, summary)
+    return 0 if ok else 1
+
+
+def cmd_benchmark_fetch(args):
+    """Time fetch_emails against the fake Gmail service or a recorded snapshot (see replay.py)."""
+    from .gmail import authenticate, fetch_emails
+
+    if args.replay:
+        from .replay import ReplayService, load_snapshot
+        snapshot = load_snapshot(args.replay)
+        senders = ReplayService(snapshot).senders()
+        if not senders:
+            logger.error(f"No sender listing recorded in {args.replay}")
+            return 2
+    elif not os.environ.get("GMAIL_FAKE"):
+        logger.error("benchmark --fetch needs --fake-gmail SPEC or --replay SNAPSHOT (it never calls the real API)")
+        return 2
+
+    results = []
+    for _ in range(args.repeat):
+        if args.replay:
+            service = ReplayService(snapshot, scale=args.replay_scale)
+            sender = senders[0]
+        else:
+            service = authenticate()
+            sender = service.mailbox.sender
+        context = {"sender": sender, "service": service, "retry_backoff": 0.01,
+                   "fetch_strategy": args.fetch_strategy or "auto", "auto_tune": args.auto_tune,
+                   "fetch_concurrency": args.fetch_concurrency}
+        t0 = time.perf_counter()
+        fetch_emails(context)
+        results.append({
+            "fetch_seconds": round(time.perf_counter() - t0, 4),
+            "messages": context.get("message_count"),
+            "recipients": len(context.get("emails", [])),
+            "api_stats": context.get("api_stats"),
+            "api_usage": context.get("api_usage"),
+            "tuning": {k: v for k, v in (context.get("fetch_tuning") or {}).items() if k != "history"},
+            "calls_by_method": dict(service.calls),
+            "injected_errors": dict(service.errors),
+        })
+        if args.replay:
+            results[-1].update(derived_calls=service.derived, missing_calls=service.missing)
+
+    source = {"replay": args.replay, "replay_scale": args.replay_scale} if args.replay else {"spec": os.environ["GMAIL_FAKE"]}
+    summary = {"command": "benchmark", "mode": "fetch", **source, "runs": results}
+    print(json.dumps(summary, indent=2))
+    if args.summary:
+        write_summary(args.summary, summary)
+    return 0
+
+
+def address_variants(emails, seed=0):
+    """
+    Provider-style spellings of the same mailboxes for normalization
+    benchmarks: case changes, Gmail dots, +tags, googlemail.com, IDN domains.
+    """
+    import random
+
+    rng = random.Random(seed)
+    out = []
+    for email in emails:
+        local, _, domain = email.partition("@")
+        choice = rng.randrange(6)
+        if choice == 1:
+            local, domain = local.capitalize(), domain.upper()
+        elif choice == 2 and domain == "gmail.com":
+            local = ".".join(local[i:i + 3] for i in range(0, len(local), 3))
+        elif choice == 3:
+            local += f"+tag{rng.randrange(5)}"
+        elif choice == 4 and domain == "gmail.com":
+            domain = "googlemail.com"
+        elif choice == 5:
+            domain = "bücher-" + domain
+        out.append(f"{local}@{domain}")
+    return out
+
+
+def cmd_benchmark_normalize(args):
+    """Compare the scalar and batch provider-aware normalizers (see ml.py)."""
+    from . import ml
+
+    emails = address_variants(synthetic_emails(args.recipients, args.seed), args.seed)
+    runs = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        scalar = [ml.canonical_email(e) for e in emails]
+        scalar_seconds = time.perf_counter() - t0
+
+        ml._CANONICAL_CACHE.clear()
+        t0 = time.perf_counter()
+        batch = ml.canonical_emails(emails)
+        batch_seconds = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        ml.canonical_emails(emails)
+        cached_seconds = time.perf_counter() - t0
+
+        if batch != scalar:
+            logger.error("batch and scalar normalizers disagree")
+            return 1
+        runs.append({
+            "scalar_seconds": round(scalar_seconds, 4),
+            "batch_seconds": round(batch_seconds, 4),
+            "batch_cached_seconds": round(cached_seconds, 4),
+        })
+
+    best = {k: min(r[k] for r in runs) for k in runs[0]}
+    summary = {
+        "command": "benchmark",
+        "mode": "normalize",
+        "addresses": len(emails),
+        "unique_addresses": len(set(emails)),
+        "canonical_addresses": len(set(batch)),
+        "runs": runs,
+        "best": best,
+        "addresses_per_second": {
+            k.replace("_seconds", ""): round(len(emails) / v) if v else None for k, v in best.items()
+        },
+    }
+    print(json.dumps(summary, indent=2))
+    if args.summary:
+        write_summary(args.summary, summary)
+    return 0
+
+
+def cmd_benchmark(args):
+    """Time the ML and export stages on synthetic recipients (no Gmail access)."""
+    if args.imports:
+        return cmd_benchmark_imports(args)
+    if args.normalize:
+        return cmd_benchmark_normalize(args)
+    if args.fetch:
+        return cmd_benchmark_fetch(args)
+
+    from .store import RecipientTable
+    from .ml import resolve_identities
+    from .excel import save_excel
+
+    emails = synthetic_emails(args.recipients, args.seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(args.repeat):
+            context = {"output_path": os.path.join(tmp, "bench.xlsx"), "index_results": False}
+            timings = {}
+
+            t0 = time.perf_counter()
+            context["emails"] = RecipientTable(emails)
+            timings["store_seconds"] = time.perf_counter() - t0
+
+            if args.enable_ml:
+                t0 = time.perf_counter()
+                resolve_identities(context)
+                timings["ml_seconds"] = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            save_excel(context)
+            timings["export_seconds"] = time.perf_counter() - t0
+
+            results.append({k: round(v, 4) for k, v in timings.items()})
+    clear()
+
+    summary = {
+        "command": "benchmark",
+        "recipients": args.recipients,
+        "unique_recipients": len(set(emails)),
+        "repeat": args.repeat,
+        "runs": results,
+        "best": {k: min(r[k] for r in results) for k in results[0]},
+    }
+    print(json.dumps(summary, indent=2))
+    if args.summary:
+        write_summary(args.summary, summary)
+    return 0
+
+
+def cmd_cache(args):
+    if args.action == "clear":
+        shutil.rmtree(cache_dir(), ignore_errors=True)
+        cache_dir()
+    print(json.dumps(cache_stats(), indent=2))
+    return 0
+
+
+def cmd_quota(args):
+    print(json.dumps(quota_utilization(), indent=2))
+    return 0
+
+
+def _bool_flag(parser, name, dest, help_text):
+    """Add --name / --no-name that default to None (unset)."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(f"--{name}", dest=dest, action="store_true", default=None, help=help_text)
+    group.add_argument(f"--no-{name}", dest=dest, action="store_false", default=None)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="workcortex", description="WorkCortex Gmail Intelligence (headless)")
+    parser.add_argument("--log-level", default="WARNING", help="DEBUG, INFO, WARNING (default) or ERROR")
+    parser.add_argument("--log-file", help="Also append log records to this file")
+    parser.add_argument("--event-log", metavar="PATH",
+                        help="Append events and log records to a rotating, compressed JSONL file (background writer)")
+    parser.add_argument("--quiet", action="store_true", help="Suppress all stdout output (summary files are still written)")
+    parser.add_argument("--fake-gmail", metavar="SPEC",
+                        help="Use the offline fake Gmail service, e.g. messages=5000,latency=0.02,quota_rate=0.01")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve OpenMetrics at http://127.0.0.1:PORT/metrics while running")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="Write metrics for node_exporter's textfile collector (.prom) after the run")
+    parser.add_argument("--quota-db", metavar="PATH",
+                        help="SQLite file to share Gmail quota with other processes (or WORKCORTEX_QUOTA_DB)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_output_options(p):
+        p.add_argument("--summary", help="Write the JSON run summary here (in addition to the last-run summary)")
+        p.add_argument("--events", choices=["table", "log", "none"], default="table",
+                       help="How to report step events: printed table, log records, or not at all")
+
+    def add_run_options(p):
+        p.add_argument("--config", help="TOML, YAML or JSON file with run options")
+        p.add_argument("--sender", help="Sender email to extract recipients from")
+        p.add_argument("--output", help="Output Excel path")
+        _bool_flag(p, "ml", "enable_ml", "Enable ML identity resolution (default)")
+        _bool_flag(p, "verify-mx", "verify_mx", "Verify recipient domains via MX lookup")
+        _bool_flag(p, "export-clusters", "export_clusters", "Add the identity cluster report sheet")
+        _bool_flag(p, "export-groups", "export_groups",
+                   "Add a sheet of recipient groups (addresses regularly addressed together)")
+        _bool_flag(p, "recipient-graph", "recipient_graph",
+                   "Build the recipient co-occurrence matrix (default: when ML runs or groups are exported)")
+        p.add_argument("--fetch-strategy", choices=["auto", "messages", "threads"],
+                       help="messages.get per message, threads.get per thread, or whichever costs fewer quota units (auto)")
+        _bool_flag(p, "auto-tune", "auto_tune",
+                   "Adapt fetch concurrency and page size to latency/errors, starting from the account's last values (default)")
+        p.add_argument("--fetch-concurrency", type=int, metavar="N",
+                       help="Parallel message/thread fetches (upper bound when auto-tuning, default 16; fixed otherwise)")
+        p.add_argument("--page-size", type=int, metavar="N", help="Starting messages per listing page (max 500)")
+        _bool_flag(p, "analytics", "traffic_analytics",
+                   "Count recipients per domain and top recipients while fetching, for the run summary (default)")
+        _bool_flag(p, "export-analytics", "export_analytics",
+                   "Add Domains and Top Recipients sheets (.domains.csv / .top_recipients.csv for CSV output)")
+        _bool_flag(p, "result-cache", "result_cache", "Skip ML/export when messages and options are unchanged (default)")
+        _bool_flag(p, "incremental", "incremental",
+                   "Merge into the existing output via its .index.db sidecar (adds count/first_seen/last_seen)")
+        p.add_argument("--deadline", type=float, metavar="SECONDS",
+                       help="Cancel the run if it takes longer (exit code 124, partial counts in the summary)")
+        p.add_argument("--preview", action="store_true", default=None,
+                       help="Only estimate message/recipient counts from a sample (seconds, no export)")
+        p.add_argument("--account", dest="accounts", action="append", metavar="TOKEN_PATH",
+                       help="Token file of an account to extract from (repeat for multi-account runs)")
+        p.add_argument("--mbox", action="append", metavar="PATH",
+                       help="Read a local mbox file or Takeout directory instead of the Gmail API (repeatable)")
+        p.add_argument("--record", metavar="PATH",
+                       help="Record the Gmail API calls of this run to a snapshot (.json.gz)")
+        p.add_argument("--replay", metavar="PATH",
+                       help="Serve Gmail API calls from a recorded snapshot instead of the API")
+        p.add_argument("--replay-scale", type=float, metavar="X",
+                       help="Multiply recorded latencies when replaying (default 1.0, 0 = no delay)")
+
+    run = sub.add_parser("run", help="Run the pipeline")
+    add_run_options(run)
+    add_output_options(run)
+    run.set_defaults(func=cmd_run)
+
+    submit = sub.add_parser("submit", help="Queue a pipeline run for the worker")
+    add_run_options(submit)
+    submit.add_argument("--priority", type=int, default=0, help="Higher runs first (default 0)")
+    submit.set_defaults(func=cmd_submit)
+
+    worker = sub.add_parser("worker", help="Run queued jobs (daemon)")
+    worker.add_argument("--concurrency", type=int, default=2, help="Jobs run at the same time (default 2)")
+    worker.add_argument("--account-cap", type=int, default=1,
+                        help="Running jobs allowed per Gmail account (default 1)")
+    worker.add_argument("--poll", type=float, default=1.0, help="Seconds between queue checks when idle")
+    worker.add_argument("--exit-when-idle", action="store_true", help="Exit once the queue is drained")
+    worker.set_defaults(func=cmd_worker)
+
+    job = sub.add_parser("job", help="Inspect or cancel queued jobs")
+    job.add_argument("action", choices=["list", "status", "events", "result", "cancel"])
+    job.add_argument("job_id", type=int, nargs="?")
+    job.set_defaults(func=cmd_job)
+
+    resume = sub.add_parser("resume", help="Re-run the last (failed) run with its saved options")
+    resume.add_argument("--from-summary", help="Summary file to resume from (default: last run)")
+    resume.add_argument("--force", action="store_true", help="Re-run even if the last run succeeded")
+    add_output_options(resume)
+    resume.set_defaults(func=cmd_resume)
+
+    bench = sub.add_parser("benchmark", help="Time the pipeline stages on synthetic data")
+    bench.add_argument("--recipients", type=int, default=2000)
+    bench.add_argument("--repeat", type=int, default=3)
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("--summary", help="Also write the benchmark JSON here")
+    bench.add_argument("--imports", action="store_true",
+                       help="Measure startup import time (-X importtime); exit 1 if heavy modules load eagerly")
+    bench.add_argument("--fetch", action="store_true",
+                       help="Time the fetch stage against --fake-gmail or --replay instead of the ML/export stages")
+    bench.add_argument("--fetch-strategy", choices=["auto", "messages", "threads"])
+    bench.add_argument("--fetch-concurrency", type=int, metavar="N",
+                       help="With --fetch: parallel fetches (bound when auto-tuning)")
+    _bool_flag(bench, "auto-tune", "auto_tune", "With --fetch: adapt concurrency and page size (default)")
+    bench.add_argument("--replay", metavar="PATH", help="With --fetch: replay a recorded snapshot instead of --fake-gmail")
+    bench.add_argument("--replay-scale", type=float, default=1.0,
+                       help="Multiply recorded latencies when replaying (default 1.0, 0 = no delay)")
+    bench.add_argument("--normalize", action="store_true",
+                       help="Compare scalar vs batch provider-aware address normalization")
+    _bool_flag(bench, "ml", "enable_ml", "Include the ML stage (default)")
+    bench.set_defaults(func=cmd_benchmark, enable_ml=True, auto_tune=True)
+
+    cache = sub.add_parser("cache", help="Inspect or clear the local cache")
+    cache.add_argument("action", choices=["info", "clear"])
+    cache.set_defaults(func=cmd_cache)
+
+    quota = sub.add_parser("quota", help="Show current Gmail quota utilization per account")
+    quota.set_defaults(func=cmd_quota)
+
+    return parser
+
+
+def main(argv=None):
+    """CLI entry point; returns a process exit code."""
+    args = build_parser().parse_args(argv)
+    sink = open_event_log(args.event_log) if args.event_log else None
+    if args.metrics_port or args.metrics_file:
+        from . import metrics
+        metrics.enable()
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+    try:
+        setup_logging(args.log_level, args.log_file, sink)
+        return _dispatch(args)
+    finally:
+        if args.metrics_file:
+            metrics.write_textfile(args.metrics_file)
+        if sink is not None:
+            from .events import remove_sink
+            remove_sink(sink)
+            sink.close()
+
+
+def _dispatch(args):
+    if args.fake_gmail:
+        os.environ["GMAIL_FAKE"] = args.fake_gmail
+    if args.quota_db:
+        os.environ["WORKCORTEX_QUOTA_DB"] = args.quota_db
+    if args.quiet:
+        devnull = open(os.devnull, "w")
+        real_stdout, sys.stdout = sys.stdout, devnull
+        try:
+            return args.func(args)
+        finally:
+            sys.stdout = real_stdout
+            devnull.close()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
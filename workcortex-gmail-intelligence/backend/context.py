@@ -0,0 +1,220 @@
+"""
+context.py - Typed Pipeline Context
+
+PipelineContext is the object steps share. It keeps the dict interface
+every step already uses (context["emails"], .get, .setdefault, `in`),
+but each known key is a declared, type-checked `__slots__` field:
+
+- a typo'd or wrongly typed value fails where it is set, not three
+  steps later;
+- Engine.add_step(requires=..., provides=...) names are checked against
+  FIELDS, and the engine verifies them around each step;
+- snapshot() / from_snapshot() carry CONTEXT_VERSION so saved contexts
+  from another release are rejected instead of misread.
+
+Recipients travel as one store.RecipientTable (columnar, shared intern
+pools) that stages read and derive from without copying strings.
+
+Keys that are not declared go to `extras` (or raise with strict=True),
+so ad-hoc keys from callers keep working.
+"""
+
+import os
+from collections.abc import MutableMapping
+
+from .cancel import CancelToken
+from .store import RecipientTable
+
+CONTEXT_VERSION = 1
+
+_NUMBER = (int, float)
+_PATH = (str, os.PathLike)
+_PATHS = (str, os.PathLike, list, tuple)
+
+# Declared fields -> accepted type(s); None (unset) is always accepted
+FIELDS = {
+    # run options
+    "run_id": str,
+    "sender": str,
+    "output_path": _PATH,
+    "enable_ml": bool,
+    "ml_workers": int,
+    "verify_mx": bool,
+    "export_clusters": bool,
+    "export_groups": bool,
+    "export_analytics": bool,
+    "incremental": bool,
+    "preview": bool,
+    "preview_sample": int,
+    "preview_pages": int,
+    "preview_seed": int,
+    "result_cache": bool,
+    "index_results": bool,
+    "results_db": _PATH,
+    "deadline": _NUMBER,
+    # fetch options
+    "fetch_strategy": str,
+    "auto_tune": bool,
+    "fetch_concurrency": int,
+    "page_size": int,
+    "api_retries": int,
+    "retry_backoff": _NUMBER,
+    "shared_quota": bool,
+    "accounts": _PATHS,
+    "account_workers": int,
+    "token_path": _PATH,
+    "mbox_path": _PATHS,
+    "mbox_workers": int,
+    "record_path": _PATH,
+    "replay_path": _PATH,
+    "replay_scale": _NUMBER,
+    "traffic_analytics": bool,
+    "analytics_top_k": int,
+    "recipient_graph": bool,
+    "cooccurrence_max_recipients": int,
+    "alias_max_cooccurrence": int,
+    "group_min_cooccurrence": int,
+    # per-run handles
+    "service": object,
+    "service_factory": object,
+    "limiter": object,
+    "tuner": object,
+    "traffic": object,
+    "cooccurrence": object,
+    "cancel": CancelToken,
+    # fetch results
+    "emails": (RecipientTable, list),
+    "receiver": str,
+    "message_count": int,
+    "message_ids": list,
+    "partial": bool,
+    "fetch_failures": int,
+    "api_stats": dict,
+    "api_usage": dict,
+    "fetch_tuning": dict,
+    "analytics": dict,
+    "accounts_summary": dict,
+    "account_errors": dict,
+    "mbox_stats": dict,
+    "preview_result": dict,
+    "verification_failures": list,
+    # ML results
+    "identity_count": int,
+    "cluster_report": object,
+    "cooccurrence_splits": int,
+    # export / cache results
+    "result_digest": str,
+    "cache_hit": bool,
+    "excel_path": _PATH,
+    "output_files": list,
+    "recipient_count": int,
+    "cluster_rows": int,
+    "group_count": int,
+    "export_delta": dict,
+    "results_run_id": str,
+    "cancelled": str,
+}
+
+# Values snapshot() keeps (plain data only; handles and tables are dropped)
+_PLAIN = (str, int, float, bool, list, dict, type(None))
+
+
+class PipelineContext(MutableMapping):
+    """
+    Mapping of declared, type-checked fields (plus `extras`).
+
+    Args:
+        values: Optional initial mapping
+        strict: Reject keys that are not in FIELDS
+        **kwargs: More initial values
+    """
+
+    __slots__ = tuple(FIELDS) + ("extras", "strict", "version")
+
+    def __init__(self, values=None, strict=False, **kwargs):
+        self.extras = {}
+        self.strict = strict
+        self.version = CONTEXT_VERSION
+        self.update(values or {}, **kwargs)
+
+    # --- mapping interface -------------------------------------------------
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return self.extras[key]
+
+    def __setitem__(self, key, value):
+        expected = FIELDS.get(key)
+        if expected is None:
+            if self.strict:
+                raise KeyError(f"undeclared context field: {key}")
+            self.extras[key] = value
+            return
+        if value is not None and expected is not object and not isinstance(value, expected):
+            raise TypeError(f"context[{key!r}] expects {_type_names(expected)}, got {type(value).__name__}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key in FIELDS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        else:
+            del self.extras[key]
+
+    def __contains__(self, key):
+        if key in FIELDS:
+            return hasattr(self, key)
+        return key in self.extras
+
+    def __iter__(self):
+        for key in FIELDS:
+            if hasattr(self, key):
+                yield key
+        yield from self.extras
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"PipelineContext(v{self.version}, {sorted(self)})"
+
+    # --- versioned plain-data form -------------------------------------------
+
+    def snapshot(self):
+        """
+        Plain-data copy (JSON-serializable values only) tagged with the
+        context version; per-run handles and tables are left out.
+        """
+        data = {k: v for k, v in self.items() if isinstance(v, _PLAIN)}
+        data["version"] = self.version
+        return data
+
+    @classmethod
+    def from_snapshot(cls, data, strict=False):
+        """
+        Rebuild a context from snapshot().
+
+        Raises:
+            ValueError: If the snapshot is from a newer context version
+        """
+        data = dict(data)
+        version = data.pop("version", CONTEXT_VERSION)
+        if version > CONTEXT_VERSION:
+            raise ValueError(f"context snapshot version {version} is newer than {CONTEXT_VERSION}")
+        return cls(data, strict=strict)
+
+
+def _type_names(expected):
+    types = expected if isinstance(expected, tuple) else (expected,)
+    return " or ".join(t.__name__ for t in types)
+
+
+def undeclared(names):
+    """Names in `names` that are not declared context fields."""
+    return [name for name in names if name not in FIELDS]
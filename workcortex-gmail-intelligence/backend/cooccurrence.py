@@ -0,0 +1,224 @@
+"""
+cooccurrence.py - Recipient Co-occurrence Graph
+
+Sparse recipient x recipient matrix of how many messages each pair of
+addresses appeared on together, built while the fetch stage parses each
+message's recipients (no second pass). Entry (i, i) is the number of
+messages address i was on.
+
+Two uses:
+- identity resolution (ml.py): aliases of one person are rarely
+  addressed on the same message, so co-occurring addresses are kept
+  apart even when their names cluster together;
+- recipient groups: connected components of pairs that co-occur at
+  least `min_weight` times (teams, lists of regulars), exportable as a
+  "Recipient Groups" sheet.
+
+Pairs are buffered in compact arrays and folded into a SciPy CSR upper
+triangle in batches, so memory tracks distinct pairs, not messages.
+"""
+
+from array import array
+from itertools import combinations
+
+GROUP_COLUMNS = ["group_id", "recipient_email", "group_size", "messages", "links"]
+
+# Pending pairs folded into the CSR matrix at a time
+_FLUSH_PAIRS = 1_000_000
+
+
+class CooccurrenceMatrix:
+    """
+    Incrementally built co-occurrence counts.
+
+    Args:
+        max_recipients: Messages with more recipients still count towards
+                        each address's message total but add no pairs
+                        (mass mail says little about who works together,
+                        and costs n^2 pairs)
+    """
+
+    def __init__(self, max_recipients=50):
+        self.max_recipients = int(max_recipients)
+        self.index = {}
+        self.addresses = []
+        self.messages = 0
+        self._ignored = set()
+        self._dropped = set()
+        self._rows = array("I")
+        self._cols = array("I")
+        self._upper = None
+        self._full = None
+
+    def __len__(self):
+        return len(self.addresses)
+
+    @staticmethod
+    def _key(address):
+        # Case-insensitive, like RecipientTable.exclude and identity resolution
+        return address.lower()
+
+    def _intern(self, address):
+        """Row id of an address; rows keep the first spelling seen."""
+        normalized = self._key(address)
+        key = self.index.get(normalized)
+        if key is None:
+            key = self.index[normalized] = len(self.addresses)
+            self.addresses.append(address)
+        return key
+
+    def ignore(self, address):
+        """Leave an address (e.g. the mailbox owner) out of every pair."""
+        if address:
+            self._ignored.add(address.casefold())
+
+    def discard(self, address):
+        """Drop an address already counted (another account's owner)."""
+        self.ignore(address)
+        row = self.index.get(self._key(address))
+        if row is not None:
+            self._dropped.add(row)
+        self._full = None
+
+    def add_message(self, addresses):
+        """Count the recipients of one message."""
+        ids = sorted({self._intern(a) for a in addresses if a.casefold() not in self._ignored})
+        if not ids:
+            return
+        self.messages += 1
+        self._full = None
+        if len(ids) > self.max_recipients:
+            self._rows.extend(ids)
+            self._cols.extend(ids)
+        else:
+            # Diagonal (message count) plus every pair i < j
+            for i, j in combinations(ids, 2):
+                self._rows.append(i)
+                self._cols.append(j)
+            self._rows.extend(ids)
+            self._cols.extend(ids)
+        if len(self._rows) >= _FLUSH_PAIRS:
+            self._flush()
+
+    def _fold(self, rows, cols, data):
+        import scipy.sparse as sp
+
+        n = len(self.addresses)
+        batch = sp.csr_matrix((data, (rows, cols)), shape=(n, n))
+        if self._upper is None:
+            self._upper = batch
+        else:
+            self._upper.resize((n, n))
+            self._upper = self._upper + batch
+
+    def _flush(self):
+        """Fold the pending pairs into the CSR upper triangle."""
+        import numpy as np
+
+        if not self._rows and self._upper is not None and self._upper.shape[0] == len(self.addresses):
+            return
+        rows = np.frombuffer(self._rows, dtype=np.uint32) if self._rows else np.zeros(0, dtype=np.uint32)
+        cols = np.frombuffer(self._cols, dtype=np.uint32) if self._cols else np.zeros(0, dtype=np.uint32)
+        self._fold(rows, cols, np.ones(len(rows), dtype=np.int32))
+        self._rows, self._cols = array("I"), array("I")
+
+    def merge(self, other):
+        """Add another matrix's counts (e.g. another account's fetch)."""
+        import numpy as np
+
+        other._flush()
+        self._flush()
+        self.messages += other.messages
+        self._ignored |= other._ignored
+        mapping = np.array([self._intern(a) for a in other.addresses], dtype=np.int64)
+        self._dropped.update(int(mapping[i]) for i in other._dropped)
+        coo = other._upper.tocoo()
+        rows, cols = mapping[coo.row], mapping[coo.col]
+        self._fold(np.minimum(rows, cols), np.maximum(rows, cols), coo.data)
+        self._full = None
+
+    def matrix(self):
+        """
+        Symmetric CSR matrix (len(self) x len(self)) of co-occurrence
+        counts; the diagonal holds each address's message count.
+        """
+        if self._full is None:
+            import numpy as np
+            import scipy.sparse as sp
+
+            self._flush()
+            upper = self._upper
+            full = (upper + sp.triu(upper, k=1).T).tocsr()
+            if self._dropped:
+                keep = np.ones(len(self.addresses), dtype=upper.dtype)
+                keep[list(self._dropped)] = 0
+                mask = sp.diags(keep, dtype=upper.dtype)
+                full = (mask @ full @ mask).tocsr()
+                full.eliminate_zeros()
+            self._full = full
+        return self._full
+
+    def submatrix(self, addresses):
+        """
+        Co-occurrence counts among `addresses` (in that order, matched
+        case-insensitively); addresses never seen have empty rows.
+        """
+        import numpy as np
+        import scipy.sparse as sp
+
+        ids = np.array([self.index.get(self._key(a), -1) for a in addresses], dtype=np.int64)
+        known = np.flatnonzero(ids >= 0)
+        full = self.matrix()
+        # Select the known addresses, then scatter back into request order
+        picked = full[ids[known]][:, ids[known]].tocoo()
+        return sp.csr_matrix((picked.data, (known[picked.row], known[picked.col])),
+                             shape=(len(ids), len(ids)))
+
+    def groups(self, min_weight=2, min_size=2):
+        """
+        Recipient groups: connected components of the pairs that
+        co-occurred on at least `min_weight` messages.
+
+        Returns:
+            List of GROUP_COLUMNS dicts, largest groups first
+        """
+        import numpy as np
+        from scipy.sparse.csgraph import connected_components
+
+        if not self.addresses:
+            return []
+        full = self.matrix()
+        messages = full.diagonal()
+        links = full.copy()
+        links.setdiag(0)
+        links.data = (links.data >= min_weight).astype(np.int8)
+        links.eliminate_zeros()
+        count, labels = connected_components(links, directed=False)
+        sizes = np.bincount(labels, minlength=count)
+        degrees = np.diff(links.indptr)
+        grouped = [label for label in np.argsort(-sizes, kind="stable") if sizes[label] >= min_size]
+        by_label = np.split(np.argsort(labels, kind="stable"), np.cumsum(sizes)[:-1])
+
+        rows = []
+        for group_id, label in enumerate(grouped, 1):
+            members = by_label[label]
+            for member in sorted(members, key=lambda m: (-messages[m], self.addresses[m])):
+                rows.append({
+                    "group_id": group_id,
+                    "recipient_email": self.addresses[member],
+                    "group_size": int(sizes[label]),
+                    "messages": int(messages[member]),
+                    "links": int(degrees[member]),
+                })
+        return rows
+
+
+def wants_cooccurrence(context):
+    """
+    Whether a run builds the matrix: context["recipient_graph"] when set,
+    otherwise whenever identity resolution runs or groups are exported.
+    """
+    option = context.get("recipient_graph")
+    if option is not None:
+        return bool(option)
+    return bool(context.get("enable_ml", True) or context.get("export_groups"))
@@ -4,6 +4,11 @@ engine.py - Simple Execution Engine
 Runs steps sequentially, emits live logs, handles errors.
 """
 
+import time
+
+from . import metrics
+from .cancel import Cancelled, CancelToken
+from .context import undeclared
 from .events import emit
 
 
@@ -12,16 +17,29 @@ class Engine:
     Simple execution engine that runs steps in order.
     
     Each step:
-    - Emits STARTED
+    - Emits STARTED (or SKIPPED if its `when` predicate is false)
     - Executes function
     - Emits SUCCESS or FAILED
+    
+    Steps are cancelled cooperatively through context["cancel"] (see
+    cancel.py): a step that raises Cancelled, and every step after it,
+    emits CANCELLED; results the step stored before stopping are kept.
+    Steps added with after_cancel=True (the export) still run on those
+    partial results when their required inputs are present.
+    
+    A step may declare the context fields it reads (`requires`) and sets
+    (`provides`); a missing input or output fails the step by name
+    instead of surfacing as a KeyError (or a silently absent result) later.
     """
     
     def __init__(self):
         """Initialize engine."""
         self.steps = []
+        # Per-step results of the last run: {"order", "name", "status", "attempts", "seconds"}
+        self.timings = []
     
-    def add_step(self, order, name, tool, func, retries=0):
+    def add_step(self, order, name, tool, func, retries=0, when=None, requires=(), provides=(),
+                 after_cancel=False):
         """
         Add a step to execute.
         
@@ -30,9 +48,24 @@ class Engine:
             name: Human-readable step name
             tool: Tool/service name
             func: Function to execute (takes context dict)
+            retries: Extra attempts if the step raises
+            when: Optional predicate (takes context); if it returns False
+                  the step is skipped and a SKIPPED event is emitted
+            requires: Context fields that must be set before the step runs
+            provides: Context fields the step must set
+            after_cancel: Also run once the run is cancelled, on the
+                          partial results (the run still reports CANCELLED)
+        
+        Raises:
+            ValueError: If requires/provides name an undeclared field
+                        (see context.FIELDS)
         """
-        # store retry count per step
-        self.steps.append((order, name, tool, func, int(retries)))
+        unknown = undeclared(tuple(requires) + tuple(provides))
+        if unknown:
+            raise ValueError(f"step {name!r} declares unknown context field(s): {', '.join(unknown)}")
+        # store retry count and declared inputs/outputs per step
+        self.steps.append((order, name, tool, func, int(retries), when, tuple(requires), tuple(provides),
+                           bool(after_cancel)))
     
     def run(self, context):
         """
@@ -40,27 +73,87 @@ class Engine:
         
         Args:
             context: Dictionary for sharing data between steps
+                Optional: cancel (cancel.CancelToken; one is created
+                          from `deadline` (seconds) if absent)
+                Will populate: cancelled (reason) if the run was cancelled
         
         Returns:
-            True if all succeeded, False if any failed
+            True if all succeeded, False if any failed or was cancelled
         """
-        for order, name, tool, func, retries in self.steps:
+        self.timings = []
+        run_started = time.perf_counter()
+        cancel = context.get("cancel")
+        if cancel is None:
+            cancel = context["cancel"] = CancelToken(context.get("deadline"))
+        stopped = None
+        for order, name, tool, func, retries, when, requires, provides, after_cancel in self.steps:
+            if stopped is None and cancel.cancelled:
+                stopped = context["cancelled"] = cancel.reason
+            if stopped is not None and not (after_cancel and _has_fields(context, requires)):
+                emit(order, name, tool, f"CANCELLED: {stopped}")
+                self.timings.append({"order": order, "name": name, "status": "CANCELLED", "attempts": 0, "seconds": 0.0})
+                metrics.record_step(name, "CANCELLED", 0.0)
+                continue
+            if when is not None and not when(context):
+                emit(order, name, tool, "SKIPPED")
+                self.timings.append({"order": order, "name": name, "status": "SKIPPED", "attempts": 0, "seconds": 0.0})
+                metrics.record_step(name, "SKIPPED", 0.0)
+                continue
             attempt = 0
+            started = time.perf_counter()
             while True:
                 attempt += 1
                 emit(order, name, tool, "STARTED")
                 try:
+                    _check_fields(context, requires, "missing input")
                     func(context)
+                    _check_fields(context, provides, "did not set")
                     emit(order, name, tool, "SUCCESS")
+                    self._record(order, name, "SUCCESS", attempt, started)
+                    break
+                except Cancelled as e:
+                    # Partial results stay in the context; later steps are cancelled too
+                    stopped = context["cancelled"] = stopped or e.reason
+                    emit(order, name, tool, f"CANCELLED: {e.reason}")
+                    self._record(order, name, "CANCELLED", attempt, started)
                     break
                 except Exception as e:
                     # If retries remain, emit RETRIED and try again
-                    if attempt <= retries:
+                    if attempt <= retries and not isinstance(e, StepContractError):
                         emit(order, name, tool, "RETRIED")
                         # small backoff could be added here
                         continue
                     else:
                         emit(order, name, tool, f"FAILED: {str(e)}")
+                        self._record(order, name, "FAILED", attempt, started)
+                        metrics.record_run(context, False, time.perf_counter() - run_started)
                         return False
 
-        return True
+        success = stopped is None
+        metrics.record_run(context, success, time.perf_counter() - run_started)
+        return success
+
+    def _record(self, order, name, status, attempts, started):
+        seconds = time.perf_counter() - started
+        self.timings.append({
+            "order": order,
+            "name": name,
+            "status": status,
+            "attempts": attempts,
+            "seconds": round(seconds, 4),
+        })
+        metrics.record_step(name, status, seconds)
+
+
+class StepContractError(Exception):
+    """A step's declared input was missing or its declared output was not set."""
+
+
+def _has_fields(context, names):
+    return all(context.get(name) is not None for name in names)
+
+
+def _check_fields(context, names, problem):
+    missing = [name for name in names if context.get(name) is None]
+    if missing:
+        raise StepContractError(f"{problem}: {', '.join(missing)}")
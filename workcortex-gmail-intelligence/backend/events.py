@@ -2,6 +2,10 @@
 events.py - Live Event System
 
 Thread-safe queue for streaming execution logs during runtime.
+
+Events carry a raw epoch timestamp ("ts"); use format_timestamp() when
+displaying them. Sinks registered with add_sink() (see sink.py) receive
+every event as well.
 """
 
 import queue
@@ -9,6 +13,7 @@ import time
 from datetime import datetime
 
 _event_queue = queue.Queue()
+_sinks = []
 
 
 def emit(order, step, tool, status):
@@ -22,13 +27,45 @@ def emit(order, step, tool, status):
         status: STARTED, SUCCESS, or FAILED
     """
     event = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "ts": time.time(),
         "order": order,
         "step": step,
         "tool": tool,
         "status": status
     }
     _event_queue.put(event)
+    for sink in _sinks:
+        sink.put(event)
+
+
+def format_timestamp(event, fmt="%Y-%m-%d %H:%M:%S"):
+    """
+    Display form of an event's timestamp.
+
+    Args:
+        event: Event dict (raw "ts" epoch seconds, or a preformatted
+               "timestamp" from older event logs)
+        fmt: strftime format
+
+    Returns:
+        Formatted local time, or "?" if the event has none
+    """
+    ts = event.get("ts")
+    if ts is None:
+        return event.get("timestamp", "?")
+    return datetime.fromtimestamp(ts).strftime(fmt)
+
+
+def add_sink(sink):
+    """Also deliver every emitted event to `sink` (anything with put(event))."""
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def remove_sink(sink):
+    """Stop delivering events to `sink`."""
+    if sink in _sinks:
+        _sinks.remove(sink)
 
 
 def listen():
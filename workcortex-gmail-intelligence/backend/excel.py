@@ -2,10 +2,121 @@
 excel.py - Excel Export
 
 Saves deduplicated recipient emails to Excel file using Pandas.
+Output paths ending in .csv are written with the csv module instead,
+so CSV exports never import pandas. With context["incremental"] the run
+is merged into the existing output instead (see incremental.py). A
+cancelled run exports what it fetched to a separate ".partial" file
+(see partial_output_path) so a previous complete output is kept.
 """
 
-import pandas as pd
+import contextlib
+import csv
+import os
+import tempfile
 from .events import emit
+from .settings import file_mode
+from .store import as_table
+
+
+@contextlib.contextmanager
+def _atomic_path(path):
+    """
+    Yield a temp path next to `path` (same extension) and move it into
+    place on success, so readers never see a half-written file and a
+    hardlinked previous output (see cache.py) is replaced, not modified.
+    The file keeps the previous output's permissions (see file_mode).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=os.path.splitext(path)[1])
+    os.close(fd)
+    try:
+        yield tmp
+        os.chmod(tmp, file_mode(path))
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def partial_output_path(output_path):
+    """Where a cancelled run's output goes: recipients.xlsx -> recipients.partial.xlsx."""
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.partial{ext}"
+
+
+def extra_sheets(context):
+    """
+    Optional report tables for the export, as (sheet name, CSV sidecar
+    suffix, columns, rows of dicts): the ML cluster report when
+    export_clusters is set, recipient groups from the co-occurrence
+    matrix when export_groups is set, and the fetch stage's traffic
+    analytics (see analytics.py) when export_analytics is set.
+    """
+    sheets = []
+    report = context.get("cluster_report") if context.get("export_clusters") else None
+    if report is not None:
+        sheets.append(("Identity Clusters", ".clusters.csv", report.COLUMNS, report.rows()))
+    cooccurrence = context.get("cooccurrence") if context.get("export_groups") else None
+    if cooccurrence is not None:
+        from .cooccurrence import GROUP_COLUMNS
+        groups = cooccurrence.groups(context.get("group_min_cooccurrence", 2))
+        context["group_count"] = len({row["group_id"] for row in groups})
+        sheets.append(("Recipient Groups", ".groups.csv", GROUP_COLUMNS, groups))
+    analytics = context.get("analytics") if context.get("export_analytics") else None
+    if analytics:
+        from .analytics import analytics_sheets
+        sheets.extend(analytics_sheets(analytics))
+    return sheets
+
+
+def _write_csv(output_path, unique_emails, sheets):
+    """
+    Write recipients (and each extra sheet as a CSV sidecar, e.g. .clusters.csv).
+
+    Returns:
+        List of files written
+    """
+    with _atomic_path(output_path) as tmp:
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["recipient_email"])
+            writer.writerows([email] for email in unique_emails)
+    return [output_path] + _write_sidecars(output_path, sheets)
+
+
+def _write_sidecars(output_path, sheets):
+    """Write extra sheets as CSV files next to the output; returns files written."""
+    files = []
+    for _name, suffix, columns, rows in sheets:
+        sidecar = os.path.splitext(output_path)[0] + suffix
+        with _atomic_path(sidecar) as tmp:
+            with open(tmp, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(rows)
+        files.append(sidecar)
+    return files
+
+
+def _write_xlsx(output_path, unique_emails, sheets):
+    """
+    Write recipients (and each extra sheet).
+
+    Returns:
+        List of files written
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(unique_emails, columns=["recipient_email"])
+    with _atomic_path(output_path) as tmp:
+        if sheets:
+            with pd.ExcelWriter(tmp) as writer:
+                df.to_excel(writer, index=False, sheet_name="Recipients")
+                for name, _suffix, columns, rows in sheets:
+                    pd.DataFrame(rows, columns=columns).to_excel(writer, index=False, sheet_name=name)
+        else:
+            df.to_excel(tmp, index=False, sheet_name="Recipients")
+    return [output_path]
 
 
 def save_excel(context):
@@ -14,38 +125,83 @@ def save_excel(context):
     
     Args:
         context: Execution context
-            Must contain: emails (list), output_path (str)
+            Must contain: emails (RecipientTable or list), output_path (str)
+            Optional: export_clusters (bool) - also write the ML
+                      cluster_report as an "Identity Clusters" sheet
+                      (or a .clusters.csv sidecar for CSV output)
+                      export_groups (bool) - add a "Recipient Groups"
+                      sheet (.groups.csv): addresses linked by
+                      co-occurring on >= group_min_cooccurrence
+                      (default 2) messages
+                      export_analytics (bool) - write the fetch
+                      stage's analytics as "Domains" and "Top
+                      Recipients" sheets (.domains.csv /
+                      .top_recipients.csv sidecars for CSV)
+                      index_results (bool, default True) - also index the
+                      recipients in the results store (see results.py)
+                      incremental (bool) - merge into the existing output
+                      via its sidecar index (adds count/first_seen/
+                      last_seen columns; see incremental.py)
+            Will populate: excel_path, output_files, recipient_count
+                           (rows in the output), export_delta (incremental)
+
+    After a cancel (context["cancelled"] set) the recipients fetched so far
+    are written in full (not incrementally) to partial_output_path().
     
     Raises:
         Exception: If file write fails
     """
-    emails = context.get("emails", [])
+    table = as_table(context.get("emails", []))
     output_path = context.get("output_path")
     
     if not output_path:
         raise ValueError("output_path not provided in context")
+    incremental = context.get("incremental")
+    if context.get("cancelled"):
+        output_path, incremental = partial_output_path(output_path), False
     
-    # Deduplicate and sort
-    unique_emails = sorted(set(emails))
-
     # Emit start for internal excel write
     try:
         emit(999, "Saving to Excel - Preparing file", "Pandas/Excel", "STARTED")
 
-        # Create DataFrame
-        df = pd.DataFrame(unique_emails, columns=["recipient_email"])
-
         # Ensure directory exists
-        import os
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
 
-        # Write to Excel
-        df.to_excel(output_path, index=False, sheet_name="Recipients")
+        # Write file (cluster report is only materialized when requested)
+        sheets = extra_sheets(context)
+        is_csv = output_path.lower().endswith(".csv")
+        if incremental:
+            from .incremental import save_incremental
+            delta = save_incremental(output_path, table, () if is_csv else sheets)
+            files = [output_path] + (_write_sidecars(output_path, sheets) if is_csv else [])
+            context["export_delta"] = delta
+            recipient_count = delta["total"]
+        else:
+            # Table is already deduplicated; only sort
+            unique_emails = table.sorted_addresses()
+            if is_csv:
+                files = _write_csv(output_path, unique_emails, sheets)
+            else:
+                files = _write_xlsx(output_path, unique_emails, sheets)
+            recipient_count = len(unique_emails)
+        if context.get("export_clusters") and context.get("cluster_report") is not None:
+            context["cluster_rows"] = len(context["cluster_report"].rows())
 
         context["excel_path"] = output_path
-        context["recipient_count"] = len(unique_emails)
+        context["output_files"] = files
+        context["recipient_count"] = recipient_count
+
+        if context.get("index_results", True):
+            from .results import save_results
+            try:
+                save_results(context)
+            except Exception as e:
+                # The file is written; browsing is a convenience
+                print(f"Warning: Could not index results: {e}")
 
-        emit(999, "Saving to Excel - Completed write", "Pandas/Excel", "SUCCESS")
+        delta = context.get("export_delta") if incremental else None
+        detail = f" ({delta['mode']}: +{delta['added']} new, {delta['updated']} updated)" if delta else ""
+        emit(999, f"Saving to Excel - Completed write{detail}", "Pandas/Excel", "SUCCESS")
     except Exception as e:
         emit(999, "Saving to Excel - Failed write", "Pandas/Excel", f"FAILED: {e}")
         raise
@@ -0,0 +1,314 @@
+"""
+fakegmail.py - Offline Gmail API Stand-in
+
+A discovery-compatible fake of the Gmail `service` object, serving a
+generated mailbox with configurable latency, error rate, quota (429)
+errors and page size. Lets the real `fetch_emails` code paths
+(pagination, list_next, per-message get, retries) run offline.
+
+Usage:
+    service = FakeGmailService(FakeMailbox(messages=5000), latency=0.02)
+    context["service"] = service
+
+    # or point authenticate() at it:
+    GMAIL_FAKE="messages=5000,latency=0.02,error_rate=0.01,quota_rate=0.02"
+"""
+
+import random
+import threading
+import time
+
+
+class FakeHttpError(Exception):
+    """Raised when googleapiclient is not installed; mimics HttpError.resp.status."""
+
+    class _Resp(dict):
+        def __init__(self, status, reason):
+            super().__init__(status=str(status))
+            self.status = status
+            self.reason = reason
+
+    def __init__(self, status, reason):
+        super().__init__(f"<HttpError {status} \"{reason}\">")
+        self.resp = self._Resp(status, reason)
+
+
+def _http_error(status, reason):
+    """Build an HttpError like the real client raises (falls back to FakeHttpError)."""
+    try:
+        import httplib2
+        from googleapiclient.errors import HttpError
+    except ImportError:
+        return FakeHttpError(status, reason)
+    resp = httplib2.Response({"status": status, "reason": reason})
+    return HttpError(resp, f'{{"error": {{"code": {status}, "message": "{reason}"}}}}'.encode())
+
+
+class FakeMailbox:
+    """
+    Deterministically generated mailbox.
+
+    Messages from `sender` are addressed to a pool of recipients spread
+    over `domains` domains, grouped into threads of up to `thread_size`
+    messages. A share of messages (`other_ratio`) come from other senders
+    so that query filtering matters.
+    """
+
+    def __init__(self, sender="sender@example.com", messages=1000, recipients=500,
+                 domains=25, thread_size=3, other_ratio=0.2, owner="me@example.com", seed=0):
+        rng = random.Random(seed)
+        self.owner = owner
+        self.sender = sender
+        pool = [f"user{i}@domain{i % domains}.example" for i in range(recipients)]
+
+        self.messages = []
+        self.by_id = {}
+        self.threads = {}
+        thread_id = None
+        for i in range(messages):
+            if thread_id is None or len(self.threads[thread_id]) >= rng.randint(1, thread_size):
+                thread_id = f"t{len(self.threads):08x}"
+                self.threads[thread_id] = []
+            from_addr = sender if rng.random() >= other_ratio else f"other{rng.randrange(50)}@elsewhere.example"
+            to = rng.sample(pool, k=min(len(pool), rng.randint(1, 3)))
+            cc = rng.sample(pool, k=min(len(pool), rng.randint(0, 2)))
+            message = {
+                "id": f"m{i:010x}",
+                "threadId": thread_id,
+                "From": from_addr,
+                "To": ", ".join(f"User <{a}>" if rng.random() < 0.3 else a for a in to + [owner]),
+                "Cc": ", ".join(cc),
+                "Bcc": "",
+            }
+            self.messages.append(message)
+            self.by_id[message["id"]] = message
+            self.threads[thread_id].append(message)
+        # Gmail lists newest first
+        self.messages.reverse()
+
+    def search(self, query):
+        """Messages matching a (tiny subset of) Gmail query syntax: `from:addr`."""
+        query = (query or "").strip()
+        if query.lower().startswith("from:"):
+            wanted = query[5:].strip().lower()
+            return [m for m in self.messages if m["From"].lower() == wanted]
+        return list(self.messages)
+
+
+def _headers(message, names):
+    return [
+        {"name": name, "value": message[name]}
+        for name in (names or ["From", "To", "Cc", "Bcc"])
+        if message.get(name)
+    ]
+
+
+class _Request:
+    """Mimics googleapiclient HttpRequest: call execute() to get the response."""
+
+    def __init__(self, service, method, handler, **params):
+        self.service = service
+        self.method = method
+        # Same shape as googleapiclient's HttpRequest.methodId
+        self.methodId = "gmail." + ("" if method.startswith("users.") else "users.") + method
+        self.handler = handler
+        self.params = params
+
+    def execute(self, num_retries=0):
+        return self.service._call(self.method, self.handler, self.params)
+
+
+class _Messages:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId="me", q=None, maxResults=None, pageToken=None, **_):
+        return _Request(self._service, "messages.list", self._service._list,
+                        q=q, maxResults=maxResults, pageToken=pageToken)
+
+    def list_next(self, previous_request, previous_response):
+        token = previous_response.get("nextPageToken")
+        if not token:
+            return None
+        params = dict(previous_request.params, pageToken=token)
+        return _Request(self._service, previous_request.method, previous_request.handler, **params)
+
+    def get(self, userId="me", id=None, format="full", metadataHeaders=None, **_):
+        return _Request(self._service, "messages.get", self._service._get_message,
+                        id=id, metadataHeaders=metadataHeaders)
+
+
+class _Threads:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId="me", q=None, maxResults=None, pageToken=None, **_):
+        return _Request(self._service, "threads.list", self._service._list_threads,
+                        q=q, maxResults=maxResults, pageToken=pageToken)
+
+    def list_next(self, previous_request, previous_response):
+        return _Messages.list_next(self, previous_request, previous_response)
+
+    def get(self, userId="me", id=None, format="full", metadataHeaders=None, **_):
+        return _Request(self._service, "threads.get", self._service._get_thread,
+                        id=id, metadataHeaders=metadataHeaders)
+
+
+class _Users:
+    def __init__(self, service):
+        self._service = service
+
+    def getProfile(self, userId="me"):
+        return _Request(self._service, "users.getProfile", self._service._profile)
+
+    def messages(self):
+        return _Messages(self._service)
+
+    def threads(self):
+        return _Threads(self._service)
+
+
+class FakeGmailService:
+    """
+    Thread-safe fake of `build("gmail", "v1", ...)`.
+
+    Args:
+        mailbox: FakeMailbox to serve
+        latency: Seconds added to every call (plus up to `jitter` seconds)
+        jitter: Random extra latency
+        error_rate: Probability of a 500 backendError per call
+        quota_rate: Probability of a 429 rateLimitExceeded per call
+        page_size: Default (and maximum) messages per list page
+        seed: Seed for latency/error randomness
+
+    `calls` counts executed calls per method and `errors` injected errors.
+    """
+
+    thread_safe = True
+
+    def __init__(self, mailbox=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 quota_rate=0.0, page_size=100, seed=0):
+        self.mailbox = mailbox or FakeMailbox()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota_rate = quota_rate
+        self.page_size = page_size
+        self.calls = {}
+        self.errors = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def users(self):
+        return _Users(self)
+
+    # --- dispatch --------------------------------------------------------
+
+    def _call(self, method, handler, params):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+            roll = self._rng.random()
+        if delay:
+            time.sleep(delay)
+        if roll < self.quota_rate:
+            self._count_error(429)
+            raise _http_error(429, "rateLimitExceeded")
+        if roll < self.quota_rate + self.error_rate:
+            self._count_error(500)
+            raise _http_error(500, "backendError")
+        return handler(**params)
+
+    def _count_error(self, status):
+        with self._lock:
+            self.errors[status] = self.errors.get(status, 0) + 1
+
+    # --- handlers --------------------------------------------------------
+
+    def _profile(self):
+        return {"emailAddress": self.mailbox.owner, "messagesTotal": len(self.mailbox.messages)}
+
+    def _list(self, q=None, maxResults=None, pageToken=None):
+        matches = self.mailbox.search(q)
+        size = min(maxResults or self.page_size, self.page_size, 500)
+        start = int(pageToken or 0)
+        page = matches[start:start + size]
+        response = {"resultSizeEstimate": len(matches)}
+        if page:
+            response["messages"] = [{"id": m["id"], "threadId": m["threadId"]} for m in page]
+        if start + size < len(matches):
+            response["nextPageToken"] = str(start + size)
+        return response
+
+    def _get_message(self, id=None, metadataHeaders=None):
+        message = self.mailbox.by_id.get(id)
+        if message is None:
+            raise _http_error(404, "notFound")
+        return self._message_resource(message, metadataHeaders)
+
+    @staticmethod
+    def _message_resource(message, metadataHeaders):
+        return {
+            "id": message["id"],
+            "threadId": message["threadId"],
+            "payload": {"headers": _headers(message, metadataHeaders)},
+        }
+
+    def _list_threads(self, q=None, maxResults=None, pageToken=None):
+        seen = {}
+        for message in self.mailbox.search(q):
+            seen.setdefault(message["threadId"], None)
+        ids = list(seen)
+        size = min(maxResults or self.page_size, self.page_size, 500)
+        start = int(pageToken or 0)
+        response = {"resultSizeEstimate": len(ids)}
+        if ids[start:start + size]:
+            response["threads"] = [{"id": t} for t in ids[start:start + size]]
+        if start + size < len(ids):
+            response["nextPageToken"] = str(start + size)
+        return response
+
+    def _get_thread(self, id=None, metadataHeaders=None):
+        thread = self.mailbox.threads.get(id)
+        if thread is None:
+            raise _http_error(404, "notFound")
+        return {
+            "id": id,
+            "messages": [self._message_resource(m, metadataHeaders) for m in thread],
+        }
+
+
+def from_spec(spec, salt=None):
+    """
+    Build a FakeGmailService from a "key=value,..." string.
+
+    Mailbox keys: sender, messages, recipients, domains, thread_size,
+    other_ratio, owner, seed. Service keys: latency, jitter, error_rate,
+    quota_rate, page_size.
+
+    Args:
+        spec: e.g. "messages=5000,latency=0.02,quota_rate=0.01"
+        salt: Optional string (e.g. a token path) mixed into the seed so
+              each fake account gets a different mailbox
+    """
+    mailbox_keys = {"sender": str, "messages": int, "recipients": int, "domains": int,
+                    "thread_size": int, "other_ratio": float, "owner": str, "seed": int}
+    service_keys = {"latency": float, "jitter": float, "error_rate": float,
+                    "quota_rate": float, "page_size": int}
+    mailbox_args, service_args = {}, {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key in mailbox_keys:
+            mailbox_args[key] = mailbox_keys[key](value)
+        elif key in service_keys:
+            service_args[key] = service_keys[key](value)
+        elif key not in ("1", "true", "yes"):
+            raise ValueError(f"Unknown fake Gmail option: {key}")
+    if salt:
+        import zlib
+        mailbox_args["seed"] = mailbox_args.get("seed", 0) + zlib.crc32(str(salt).encode())
+        mailbox_args.setdefault("owner", f"owner{zlib.crc32(str(salt).encode()) % 1000}@example.com")
+    if "seed" in mailbox_args:
+        service_args["seed"] = mailbox_args["seed"]
+    return FakeGmailService(FakeMailbox(**mailbox_args), **service_args)
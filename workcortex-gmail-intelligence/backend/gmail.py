@@ -6,36 +6,84 @@ Uses OAuth2 (credentials.json from Google Cloud Console).
 """
 
 import os
+import random
 import re
-# Optional DNS resolver for MX checks; imported lazily
-try:
-    import dns.resolver
-    _HAS_DNS = True
-except Exception:
-    _HAS_DNS = False
-import pickle
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from email.utils import getaddresses
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from . import metrics
+from .cancel import Cancelled, check_cancelled
+from .events import emit
+from .store import RecipientTable
+
+# google-auth / googleapiclient and dnspython are imported inside the
+# functions that need them, so importing this module stays cheap.
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
 # Simple email validation regex (pragmatic, not full RFC)
 EMAIL_REGEX = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 
+# HTTP statuses worth retrying (rate limit / transient backend errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Gmail API quota units per method (per-user limit is 250 units/second)
+QUOTA_UNITS = {
+    "users.getProfile": 1,
+    "messages.list": 5,
+    "messages.get": 5,
+    "threads.list": 10,
+    "threads.get": 10,
+}
+
+# Headers requested for each message
+RECIPIENT_HEADERS = ["To", "Cc", "Bcc"]
+
+# Guards context["api_stats"] when requests run on several threads
+_STATS_LOCK = threading.Lock()
+
 
-def authenticate():
+def authenticate(token_path=None):
     """
     Authenticate with Gmail API using OAuth2.
     
     First run: Opens browser for user consent
     Subsequent runs: Uses saved token.json
     
+    If GMAIL_FAKE is set (e.g. "messages=5000,latency=0.02"), returns an
+    offline FakeGmailService instead (see fakegmail.py).
+    
+    Args:
+        token_path: Token file for the account to use
+                    (default: GMAIL_TOKEN_PATH or backend/token.json)
+    
     Returns:
         Authenticated Gmail service
     """
+    fake_spec = os.environ.get("GMAIL_FAKE")
+    if fake_spec:
+        from .fakegmail import from_spec
+        return from_spec(fake_spec, salt=token_path)
+
+    from googleapiclient.discovery import build
+
+    return build("gmail", "v1", credentials=load_credentials(token_path))
+
+
+def load_credentials(token_path=None):
+    """
+    OAuth2 credentials for an account, refreshed (or obtained through the
+    browser consent flow) and saved back to the token file when needed.
+
+    Args:
+        token_path: Token file for the account to use
+                    (default: GMAIL_TOKEN_PATH or backend/token.json)
+    """
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     creds = None
     
     # Get the backend directory path
@@ -43,7 +91,7 @@ def authenticate():
     
     # Support custom paths via environment variables, else use backend directory
     cred_path = os.environ.get("GMAIL_CREDENTIALS_PATH", os.path.join(backend_dir, "credentials.json"))
-    token_path = os.environ.get("GMAIL_TOKEN_PATH", os.path.join(backend_dir, "token.json"))
+    token_path = token_path or os.environ.get("GMAIL_TOKEN_PATH", os.path.join(backend_dir, "token.json"))
 
     # Load existing token if available
     if os.path.exists(token_path):
@@ -64,7 +112,523 @@ def authenticate():
         with open(token_path, "w") as token:
             token.write(creds.to_json())
     
-    return build("gmail", "v1", credentials=creds)
+    return creds
+
+
+def open_service(context):
+    """
+    Gmail service for a fetch: a replayed snapshot (context["replay_path"]),
+    else context["service"] or authenticate(), wrapped for recording when
+    context["record_path"] is set (see replay.py).
+
+    Args:
+        context: Execution context
+            Optional: service, token_path (account to authenticate),
+                      replay_path, replay_scale (latency multiplier,
+                      default 1.0), record_path
+    """
+    if context.get("replay_path"):
+        from .replay import ReplayService
+        return ReplayService(context["replay_path"], scale=context.get("replay_scale", 1.0))
+    service = context.get("service") or authenticate(context.get("token_path"))
+    if context.get("record_path"):
+        from .replay import RecordingService
+        service = RecordingService(service)
+    return service
+
+
+def thread_service_factory(service, context):
+    """
+    Callable giving each fetch thread a service to use, or None when
+    `service` has to stay on the calling thread.
+
+    googleapiclient services are not thread-safe, so unless the service
+    says it is (fake/replay) each thread gets its own: from
+    context["service_factory"] if set, else a service built on the
+    context's account credentials, which are loaded (and refreshed) once
+    here rather than by every thread. A caller-supplied
+    context["service"] without a factory is kept single-threaded.
+    """
+    if getattr(service, "thread_safe", False):
+        return lambda: service
+    factory = context.get("service_factory")
+    if factory is None and context.get("service") is None and not context.get("replay_path"):
+        factory = _credentials_factory(context.get("token_path"))
+    if factory is None:
+        return None
+    if hasattr(service, "fork"):
+        # Recording: every thread's service feeds the same snapshot
+        return lambda: service.fork(factory())
+    return factory
+
+
+def _credentials_factory(token_path):
+    """Service factory sharing one set of credentials across threads."""
+    if os.environ.get("GMAIL_FAKE"):
+        return lambda: authenticate(token_path)
+    from googleapiclient.discovery import build
+
+    creds = load_credentials(token_path)
+    return lambda: build("gmail", "v1", credentials=creds)
+
+
+def save_recording(service, context):
+    """Write the snapshot of a service returned by open_service() when recording."""
+    if context.get("record_path") and hasattr(service, "save"):
+        calls = service.save(context["record_path"])
+        print(f"[DEBUG] Recorded {calls} Gmail API calls to {context['record_path']}")
+
+
+def attach_quota_lease(context, account, service=None):
+    """
+    Share the account's quota with any other pipeline using it: set
+    context["limiter"] to a lease on the process-wide QuotaManager,
+    unless a limiter is already set, context["shared_quota"] is False or
+    `service` is a replay (recorded responses cost the live account
+    nothing, and its replayed profile names the real account).
+
+    Calls already made with this context (the getProfile that found
+    `account`) are charged to the new lease.
+    """
+    if getattr(service, "is_replay", False):
+        return
+    if context.get("limiter") is None and context.get("shared_quota", True):
+        from .quota import get_manager
+        lease = context["limiter"] = get_manager().lease(account or "default", context.get("run_id") or id(context))
+        # The getProfile call(s) that named the account ran before the
+        # lease existed; charge them now so the shared bucket sees them
+        spent = context.get("api_stats", {}).get("quota_units", 0)
+        if spent:
+            lease.acquire(spent)
+
+
+def _dns_resolver():
+    """Return the optional dns.resolver module, or None if dnspython is missing."""
+    try:
+        import dns.resolver
+    except Exception:
+        return None
+    return dns.resolver
+
+
+def _http_status(error):
+    """HTTP status of a googleapiclient HttpError (or compatible), else None."""
+    resp = getattr(error, "resp", None)
+    try:
+        return int(getattr(resp, "status", None))
+    except (TypeError, ValueError):
+        return None
+
+
+def _method_name(request):
+    """Short API method name ("messages.get") from a request's methodId."""
+    method_id = getattr(request, "methodId", None) or ""
+    parts = method_id.split(".")
+    if len(parts) >= 3 and parts[1] == "users":
+        parts = parts[2:] if len(parts) > 3 else parts[1:]
+    return ".".join(parts) if parts != [""] else "unknown"
+
+
+def execute_request(request, context):
+    """
+    Execute a Gmail API request, retrying rate-limit and transient errors.
+    
+    Uses exponential backoff with jitter. Calls, retries and quota units
+    per method are counted in context["api_stats"]. If the context holds
+    a `limiter` (quota.RateLimiter or QuotaLease), each attempt first
+    waits for its quota units, and a 429 pauses the limiter's account.
+    
+    Args:
+        request: googleapiclient request (anything with .execute())
+        context: Execution context
+            Optional: api_retries (int, default 5),
+                      retry_backoff (float seconds, default 0.5),
+                      limiter (quota.RateLimiter / quota.QuotaLease),
+                      tuner (tuning.FetchTuner, told each attempt's
+                             latency, status and quota wait),
+                      cancel (cancel.CancelToken, checked before each
+                              attempt and during retry backoff)
+    
+    Returns:
+        API response dict
+    
+    Raises:
+        cancel.Cancelled: If the run is cancelled or past its deadline
+    """
+    stats = context.setdefault("api_stats", {"calls": 0, "retries": 0, "quota_units": 0, "by_method": {}})
+    max_retries = int(context.get("api_retries", 5))
+    backoff = float(context.get("retry_backoff", 0.5))
+    method = _method_name(request)
+    units = QUOTA_UNITS.get(method, 5)
+    per_method = stats["by_method"].setdefault(method, {"calls": 0, "quota_units": 0})
+    limiter = context.get("limiter")
+    tuner = context.get("tuner")
+    cancel = context.get("cancel")
+    attempt = 0
+    while True:
+        if cancel is not None:
+            cancel.check()
+        waited = limiter.acquire(units) if limiter is not None else 0.0
+        with _STATS_LOCK:
+            stats["calls"] += 1
+            stats["quota_units"] += units
+            per_method["calls"] += 1
+            per_method["quota_units"] += units
+        metrics.record_api_call(method, units)
+        started = time.perf_counter()
+        try:
+            response = request.execute()
+        except Exception as e:
+            status = _http_status(e)
+            if tuner is not None:
+                tuner.observe(method, time.perf_counter() - started, status or 0, waited or 0.0)
+            if status not in RETRY_STATUSES or attempt >= max_retries:
+                raise
+            with _STATS_LOCK:
+                stats["retries"] += 1
+            metrics.record_api_retry(method)
+            delay = backoff * (2 ** attempt) * (0.5 + random.random())
+            if status == 429 and hasattr(limiter, "penalize"):
+                # Back off every pipeline on this account, not just this one
+                limiter.penalize(delay)
+            if cancel is not None:
+                cancel.sleep(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+            continue
+        if tuner is not None:
+            tuner.observe(method, time.perf_counter() - started, None, waited or 0.0)
+        return response
+
+
+def iter_recipients(headers):
+    """Yield valid addresses from a message's To/Cc/Bcc headers."""
+    for header in headers:
+        if header["name"] in RECIPIENT_HEADERS:
+            # Use getaddresses to reliably parse lists like "Name <a@b.com>, c@d.com"
+            parsed = getaddresses([header.get("value", "")])
+            for _name, addr in parsed:
+                addr = addr.strip()
+                if not addr:
+                    continue
+                # Validate email format (skip malformed addresses)
+                if EMAIL_REGEX.match(addr):
+                    yield addr
+
+
+def _add_recipients(headers, recipients, observers=()):
+    """
+    Parse one message's To/Cc/Bcc header values into the recipient table
+    (and pass them to each per-message observer's add_message).
+    """
+    addresses = list(iter_recipients(headers))
+    for addr in addresses:
+        recipients.add(addr)
+    for observer in observers:
+        observer.add_message(addresses)
+
+
+def choose_strategy(messages, requested="auto"):
+    """
+    Pick the fetch strategy that costs fewer quota units.
+    
+    The listing already tells us each message's threadId, so the cost of
+    both strategies is known up front:
+        messages: one messages.get per message  (5 units each)
+        threads:  one threads.get per thread    (10 units each)
+    
+    Args:
+        messages: Listed messages ({"id", "threadId"})
+        requested: "auto", "messages" or "threads"
+    
+    Returns:
+        (strategy, {"messages": est_units, "threads": est_units})
+    """
+    thread_count = len({m.get("threadId", m["id"]) for m in messages})
+    estimates = {
+        "messages": len(messages) * QUOTA_UNITS["messages.get"],
+        "threads": thread_count * QUOTA_UNITS["threads.get"],
+    }
+    if requested in estimates:
+        return requested, estimates
+    return ("threads" if estimates["threads"] < estimates["messages"] else "messages"), estimates
+
+
+def _get_message(service, msg, context):
+    """Recipient headers of one message (messages.get, metadata)."""
+    data = execute_request(service.users().messages().get(
+        userId="me",
+        id=msg["id"],
+        format="metadata",
+        metadataHeaders=RECIPIENT_HEADERS
+    ), context)
+    return [data.get("payload", {}).get("headers", [])]
+
+
+def _get_thread(service, thread, context):
+    """
+    Recipient headers of the listed (sender's) messages in one thread
+    (threads.get, metadata).
+    """
+    thread_id, thread_messages = thread
+    wanted = {m["id"] for m in thread_messages}
+    data = execute_request(service.users().threads().get(
+        userId="me",
+        id=thread_id,
+        format="metadata",
+        metadataHeaders=RECIPIENT_HEADERS
+    ), context)
+    found = [m for m in data.get("messages", []) if m.get("id") in wanted]
+    headers = [m.get("payload", {}).get("headers", []) for m in found]
+    if len(found) < len(thread_messages):
+        # Thread changed since listing; fall back for the missing ones
+        seen = {m.get("id") for m in found}
+        for msg in thread_messages:
+            if msg["id"] not in seen:
+                try:
+                    headers.extend(_get_message(service, msg, context))
+                except Exception as e:
+                    _skip(context, f"message {msg['id']}", e)
+    return headers
+
+
+def _skip(context, what, error):
+    """Report a message/thread that could not be fetched; the run becomes partial."""
+    print(f"Warning: Could not parse {what}: {error}")
+    with _STATS_LOCK:
+        context["fetch_failures"] = (context.get("fetch_failures") or 0) + 1
+    context["partial"] = True
+
+
+def _fetch_all(items, fetch_one, describe, service, recipients, context, service_factory=None,
+               observers=None):
+    """
+    Call fetch_one(service, item, context) for every item and add the
+    returned header lists to `recipients` (in item order, on this thread).
+
+    With a context["tuner"] and a service_factory the calls run on a
+    thread pool, keeping tuner.concurrency of them in flight; failed
+    items are reported, skipped and counted in context["fetch_failures"]
+    (the run is then marked partial). A thread that cannot get a service
+    fails the fetch instead. Each message is also counted in
+    context["traffic"] (analytics.TrafficAnalytics) and
+    context["cooccurrence"] (cooccurrence.CooccurrenceMatrix) when set,
+    or in the given `observers` (objects with add_message) instead.
+    """
+    if observers is None:
+        observers = [o for o in (context.get("traffic"), context.get("cooccurrence")) if o is not None]
+
+    def skip(item, error):
+        _skip(context, describe(item), error)
+
+    def add(item, future_or_headers):
+        try:
+            headers = future_or_headers.result() if hasattr(future_or_headers, "result") else future_or_headers
+        except _ServiceError as e:
+            raise e.__cause__ from None
+        except Exception as e:
+            skip(item, e)
+            return
+        for block in headers:
+            _add_recipients(block, recipients, observers)
+
+    tuner = context.get("tuner")
+    if tuner is None or service_factory is None or tuner.max_concurrency <= 1:
+        for item in items:
+            try:
+                headers = fetch_one(service, item, context)
+            except Exception as e:
+                skip(item, e)
+                continue
+            add(item, headers)
+        return
+
+    local = threading.local()
+
+    def run(item):
+        if getattr(local, "service", None) is None:
+            try:
+                local.service = service_factory()
+            except Exception as e:
+                raise _ServiceError() from e
+        return fetch_one(local.service, item, context)
+
+    items = list(items)
+    futures = {}
+    pending = set()
+    submitted = flushed = 0
+    with ThreadPoolExecutor(max_workers=tuner.max_concurrency) as pool:
+        while flushed < len(items):
+            while submitted < len(items) and len(pending) < tuner.concurrency:
+                future = pool.submit(run, items[submitted])
+                futures[submitted] = future
+                pending.add(future)
+                submitted += 1
+            _done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # Flush finished results in order so the table is deterministic
+            while flushed < submitted and futures[flushed].done():
+                add(items[flushed], futures.pop(flushed))
+                flushed += 1
+
+
+class _ServiceError(Exception):
+    """A fetch thread could not create its service (cause attached)."""
+
+
+def _fetch_by_message(service, messages, recipients, context, service_factory=None):
+    """One messages.get (metadata) per listed message."""
+    _fetch_all(messages, _get_message, lambda m: f"message {m['id']}",
+               service, recipients, context, service_factory)
+
+
+def _fetch_by_thread(service, messages, recipients, context, service_factory=None):
+    """
+    One threads.get (metadata) per thread; only the listed (sender's)
+    messages in each thread are used.
+    """
+    threads = {}
+    for msg in messages:
+        threads.setdefault(msg.get("threadId", msg["id"]), []).append(msg)
+    _fetch_all(list(threads.items()), _get_thread, lambda t: f"thread {t[0]}",
+               service, recipients, context, service_factory)
+
+
+def start_traffic(context, owner=None):
+    """
+    Set context["traffic"] to a fresh analytics.TrafficAnalytics (unless
+    context["traffic_analytics"] is False) that leaves `owner` out.
+    """
+    if not context.get("traffic_analytics", True):
+        context["traffic"] = None
+        return None
+    from .analytics import TrafficAnalytics
+    traffic = context["traffic"] = TrafficAnalytics(top_k=context.get("analytics_top_k", 25))
+    traffic.ignore(owner)
+    return traffic
+
+
+def start_cooccurrence(context, owner=None):
+    """
+    Set context["cooccurrence"] to a fresh cooccurrence.CooccurrenceMatrix
+    that leaves `owner` out, or None when the run has no use for it (see
+    cooccurrence.wants_cooccurrence).
+    """
+    from .cooccurrence import CooccurrenceMatrix, wants_cooccurrence
+
+    if not wants_cooccurrence(context):
+        context["cooccurrence"] = None
+        return None
+    matrix = context["cooccurrence"] = CooccurrenceMatrix(context.get("cooccurrence_max_recipients", 50))
+    matrix.ignore(owner)
+    return matrix
+
+
+def start_tuner(service, account, context):
+    """
+    Set context["tuner"] for a fetch and report its starting settings.
+
+    Args:
+        service: Service in use (replayed services serve recorded pages,
+                 so the page size is not tuned and saved settings are
+                 neither used nor written)
+        account: Account whose saved settings to start from
+        context: Execution context
+            Optional: auto_tune (default True; False keeps
+                      fetch_concurrency / page_size fixed),
+                      fetch_concurrency (upper bound when tuning, default 16),
+                      page_size (starting maxResults)
+    """
+    from .tuning import FetchTuner, DEFAULT_PAGE_SIZE
+
+    replaying = getattr(service, "is_replay", False)
+    if context.get("auto_tune", True):
+        tuner = FetchTuner.for_account(
+            account,
+            resume=not replaying,
+            page_size=context.get("page_size"),
+            max_concurrency=context.get("fetch_concurrency") or 16,
+            adapt_page_size=not replaying,
+        )
+        how = "saved" if tuner.resumed else "default"
+    else:
+        concurrency = int(context.get("fetch_concurrency") or 1)
+        tuner = FetchTuner(concurrency=concurrency, min_concurrency=concurrency, max_concurrency=concurrency,
+                           page_size=context.get("page_size") or DEFAULT_PAGE_SIZE, adapt_page_size=False)
+        how = "fixed"
+    tuner.account = account
+    tuner.persist = context.get("auto_tune", True) and not replaying
+    context["tuner"] = tuner
+    emit(993, f"Fetch tuning - start ({how}): concurrency {tuner.concurrency}, page size {tuner.page_size}",
+         "Tuning", "STARTED")
+    return tuner
+
+
+def finish_tuner(context):
+    """Report the settled settings (context["fetch_tuning"]) and save them for the account."""
+    tuner = context.pop("tuner", None)
+    if tuner is None:
+        return
+    settings = tuner.settings()
+    context["fetch_tuning"] = dict(settings, history=tuner.history)
+    if tuner.persist and settings["observed_calls"]:
+        from .tuning import save_tuning
+        save_tuning(tuner.account, tuner.saved_settings())
+    p50 = settings["latency_p50_ms"]
+    emit(993, f"Fetch tuning - concurrency {settings['concurrency']}, page size {settings['page_size']} "
+         f"({settings['adjustments']} adjustments"
+         + (f", p50 {p50:.0f} ms" if p50 is not None else "") + ")", "Tuning", "SUCCESS")
+
+
+def verify_domains(table, context):
+    """
+    Store recipients in context["emails"], keeping only domains with MX
+    records when context["verify_mx"] is set (and dnspython is installed).
+    
+    Args:
+        table: RecipientTable of candidate recipients
+        context: Execution context
+            Will populate: emails, verification_failures (when verifying;
+                           failed domains are also dropped from the
+                           traffic analytics)
+    
+    Raises:
+        cancel.Cancelled: If the run is cancelled between lookups
+    """
+    resolver = _dns_resolver() if context.get("verify_mx", False) else None
+
+    # Unverified until the lookups finish (kept as-is if the run is cancelled)
+    context["emails"] = table
+    if resolver is None:
+        print(f"[DEBUG] Final emails list: {len(table)} recipients")
+        return
+
+    # One lookup per unique domain rather than per address
+    valid_domains = set()
+    for domain_id in table.domain_ids():
+        check_cancelled(context)
+        try:
+            if resolver.resolve(table.domain_name(domain_id), 'MX'):
+                valid_domains.add(domain_id)
+        except Exception:
+            pass
+
+    validated = table.select_domains(valid_domains)
+    verification_failures = [
+        table.address(row) for row, domain_id in enumerate(table.domain_col)
+        if domain_id not in valid_domains
+    ]
+
+    traffic = context.get("traffic")
+    if traffic is not None:
+        # Keep the Domains / Top Recipients sheets in line with the table
+        for domain_id in table.domain_ids() - valid_domains:
+            traffic.discard_domain(table.domain_name(domain_id))
+        context["analytics"] = traffic.summary()
+
+    context["emails"] = validated
+    context["verification_failures"] = verification_failures
+    print(f"[DEBUG] After MX verification: {len(validated)} valid, {len(verification_failures)} failed")
 
 
 def fetch_emails(context):
@@ -74,114 +638,131 @@ def fetch_emails(context):
     Args:
         context: Execution context dict
             Must contain: sender
-            Will populate: emails (list of recipient emails)
+            Optional: service (pre-authenticated Gmail service),
+                      replay_path / replay_scale / record_path (see
+                      open_service),
+                      fetch_strategy ("auto" (default), "messages", "threads"),
+                      auto_tune / fetch_concurrency / page_size (see
+                      start_tuner), service_factory (see
+                      thread_service_factory),
+                      limiter (default: a lease on the process-wide
+                               quota.QuotaManager for this account),
+                      shared_quota (False to disable that default)
+            Will populate: emails (RecipientTable of unique recipients),
+                           message_ids (ids matched by the query),
+                           api_stats (calls/retries/quota units per method),
+                           api_usage (chosen strategy and cost estimates),
+                           fetch_tuning (settled concurrency/page size),
+                           analytics (per-domain counts and top recipients,
+                                      see analytics.py; off with
+                                      traffic_analytics=False), traffic,
+                           cooccurrence (recipient co-occurrence matrix),
+                           fetch_failures (messages/threads that could
+                                           not be fetched and were skipped),
+                           partial (True if cancelled mid-fetch or any
+                                    message was skipped)
     
     Raises:
         Exception: If Gmail API call fails
+        cancel.Cancelled: If the run is cancelled or past its deadline;
+                          recipients fetched so far are kept in emails
     """
     sender = context.get("sender")
     if not sender:
         raise ValueError("sender not provided in context")
     
+    service = None
+    auth_email = None
+    recipients = RecipientTable()
     try:
-        service = authenticate()
+        service = open_service(context)
         
         # Get authenticated user's email address (for logging, not filtering)
         try:
-            profile = service.users().getProfile(userId="me").execute()
+            profile = execute_request(service.users().getProfile(userId="me"), context)
             auth_email = profile.get("emailAddress")
             context["receiver"] = auth_email
         except Exception:
             context["receiver"] = None
 
+        attach_quota_lease(context, auth_email, service)
+        tuner = start_tuner(service, auth_email, context)
+        start_traffic(context, auth_email)
+        start_cooccurrence(context, auth_email)
+
         # Query for ALL emails from sender (regardless of recipient)
         # This fetches all emails the sender sent (to anyone in the authenticated user's mailbox)
         query = f"from:{sender}"
         
         print(f"\n[DEBUG] Searching Gmail with query: {query}")
 
-        # Handle pagination - collect all messages matching the query
+        # Handle pagination - collect all messages matching the query;
+        # each page is requested at the tuner's current page size
         messages = []
-        request = service.users().messages().list(userId="me", q=query)
+        request = service.users().messages().list(userId="me", q=query, maxResults=tuner.page_size)
         while request is not None:
-            resp = request.execute()
+            resp = execute_request(request, context)
             msgs = resp.get("messages", [])
             if msgs:
                 messages.extend(msgs)
             # Get next page, if any
-            request = service.users().messages().list_next(request, resp)
+            token = resp.get("nextPageToken")
+            request = service.users().messages().list(
+                userId="me", q=query, maxResults=tuner.page_size, pageToken=token
+            ) if token else None
 
         print(f"[DEBUG] Found {len(messages)} messages from {sender}")
+        context["message_count"] = len(messages)
+        context["message_ids"] = [m["id"] for m in messages]
 
         if not messages:
             print(f"[DEBUG] No messages found - returning empty emails list")
-            context["emails"] = []
+            context["emails"] = RecipientTable()
             return
 
-        recipients = []
+        # Extract recipients with whichever strategy costs fewer quota units
+        strategy, estimates = choose_strategy(messages, context.get("fetch_strategy", "auto"))
+        emit(997, f"Fetching - {strategy} strategy (est. {estimates[strategy]} of {max(estimates.values())} units)",
+             "Gmail API", "STARTED")
+        units_before = context["api_stats"]["quota_units"]
+        calls_before = context["api_stats"]["calls"]
 
-        # Extract recipients from each message
-        for msg in messages:
-            try:
-                data = service.users().messages().get(
-                    userId="me",
-                    id=msg["id"],
-                    format="metadata",
-                    metadataHeaders=["To", "Cc", "Bcc"]
-                ).execute()
-                
-                headers = data.get("payload", {}).get("headers", [])
-                
-                for header in headers:
-                    if header["name"] in ["To", "Cc", "Bcc"]:
-                        # Use getaddresses to reliably parse lists like "Name <a@b.com>, c@d.com"
-                        parsed = getaddresses([header.get("value", "")])
-                        for _name, addr in parsed:
-                            addr = addr.strip()
-                            if not addr:
-                                continue
-                            # Validate email format
-                            if EMAIL_REGEX.match(addr):
-                                recipients.append(addr)
-                            else:
-                                # skip malformed addresses
-                                continue
-            
-            except Exception as e:
-                # Log but continue
-                print(f"Warning: Could not parse message {msg['id']}: {e}")
-                continue
+        factory = thread_service_factory(service, context)
+        if strategy == "threads":
+            _fetch_by_thread(service, messages, recipients, context, factory)
+        else:
+            _fetch_by_message(service, messages, recipients, context, factory)
+
+        context["api_usage"] = {
+            "strategy": strategy,
+            "estimated_units": estimates,
+            "calls": context["api_stats"]["calls"] - calls_before,
+            "quota_units": context["api_stats"]["quota_units"] - units_before,
+        }
+        emit(997, f"Fetching - {strategy} strategy: {context['api_usage']['calls']} calls, "
+             f"{context['api_usage']['quota_units']} units", "Gmail API", "SUCCESS")
         
         # Exclude the authenticated user's email from recipients (we want external recipients)
-        filtered = [r for r in recipients if r.lower() != auth_email.lower()] if auth_email else recipients
+        filtered = recipients.exclude(auth_email) if auth_email else recipients
 
-        print(f"[DEBUG] Extracted {len(recipients)} total recipients, {len(filtered)} after filtering auth email")
-        print(f"[DEBUG] Recipients: {filtered[:10]}")  # First 10 for debugging
+        print(f"[DEBUG] Extracted {recipients.total} total recipients ({len(recipients)} unique), {len(filtered)} after filtering auth email")
+        print(f"[DEBUG] Recipients: {[filtered.address(i) for i in range(min(10, len(filtered)))]}")  # First 10 for debugging
 
         # If requested, verify domains via MX lookup
-        verify_mx = context.get("verify_mx", False)
-        verification_failures = []
-
-        if verify_mx and _HAS_DNS:
-            validated = []
-            for addr in filtered:
-                domain = addr.split("@")[-1]
-                try:
-                    answers = dns.resolver.resolve(domain, 'MX')
-                    if answers:
-                        validated.append(addr)
-                    else:
-                        verification_failures.append(addr)
-                except Exception:
-                    verification_failures.append(addr)
-
-            context["emails"] = validated
-            context["verification_failures"] = verification_failures
-            print(f"[DEBUG] After MX verification: {len(validated)} valid, {len(verification_failures)} failed")
-        else:
-            context["emails"] = filtered
-            print(f"[DEBUG] Final emails list: {len(filtered)} recipients")
+        verify_domains(filtered, context)
     
+    except Cancelled:
+        # Keep the recipients fetched so far (unless verify_domains already stored them)
+        if "emails" not in context:
+            context["emails"] = recipients.exclude(auth_email) if auth_email else recipients
+        context["partial"] = True
+        raise
     except Exception as e:
         raise Exception(f"Gmail API error: {str(e)}")
+    finally:
+        finish_tuner(context)
+        if context.get("traffic") is not None:
+            context["analytics"] = context["traffic"].summary()
+        if service is not None:
+            save_recording(service, context)
 
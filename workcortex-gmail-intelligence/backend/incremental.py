@@ -0,0 +1,318 @@
+"""
+incremental.py - Incremental Export
+
+Merges a run into an existing output instead of rebuilding it. A SQLite
+sidecar next to the output (`<output>.index.db`) holds what the file
+already contains - recipient, row position, count, first_seen and
+last_seen - so the previous output is never parsed. Each run:
+
+- appends recipients not in the index (first_seen = this run),
+- updates the count of recipients whose count changed (last_seen = this
+  run; unchanged recipients keep their last_seen, so a steady mailbox
+  produces no updates),
+- keeps recipients from earlier runs that this run did not see.
+
+Outputs are patched rather than regenerated: row i of the file is on
+line i of the CSV (after the header), or of the worksheet XML of an XLSX
+workbook this module writes itself (inline strings, one <row> per line).
+Unchanged lines are copied as raw bytes, only new and changed rows are
+serialized, and the result replaces the file atomically - so the
+serialization work scales with the delta (the rest is a byte copy and,
+for XLSX, recompressing the sheet). The index records the output's size
+and mtime; if the file was changed or removed outside the pipeline it
+is regenerated in full from the index.
+"""
+
+import csv
+import io
+import os
+import shutil
+import sqlite3
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+INDEX_VERSION = 1
+
+COLUMNS = ["recipient_email", "count", "first_seen", "last_seen"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipients (
+    email TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def index_path(output_path):
+    """Sidecar index location for an output file."""
+    return output_path + ".index.db"
+
+
+def _file_state(path):
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _csv_line(row):
+    buf = io.StringIO()
+    csv.writer(buf).writerow(row)
+    return buf.getvalue().encode("utf-8")
+
+
+def _xlsx_line(row):
+    """One worksheet <row> (no r= attributes, so rows can move) plus newline."""
+    cells = []
+    for value in row:
+        if value is None:
+            cells.append("<c/>")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>')
+    return f"<row>{''.join(cells)}</row>\n".encode("utf-8")
+
+
+class ExportIndex:
+    """
+    Sidecar index of an incrementally written output.
+
+    Changes are applied inside one transaction that is committed only
+    after the output file was written (see commit()/rollback()).
+
+    Args:
+        output_path: The output file the index describes
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.path = index_path(output_path)
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM recipients").fetchone()[0]
+
+    def output_matches(self):
+        """True if the output file is exactly what this index last wrote."""
+        if not os.path.exists(self.output_path) or self.meta("version") != str(INDEX_VERSION):
+            return False
+        return self.meta("output_state") == _file_state(self.output_path)
+
+    def apply(self, table, now):
+        """
+        Merge a run's recipients (begins the transaction).
+
+        Args:
+            table: RecipientTable of this run
+            now: Timestamp string recorded as first_seen / last_seen
+
+        Returns:
+            (added, changed) - lists of (position, row) for appended and
+            updated recipients, row being a COLUMNS tuple
+        """
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        existing = dict(conn.execute("SELECT email, count FROM recipients"))
+        next_position = (conn.execute("SELECT MAX(position) FROM recipients").fetchone()[0] or -1) + 1
+
+        current = dict(zip(table, table.counts))
+        new = [(email, current[email]) for email in current.keys() - existing.keys()]
+        changed = []
+        for email in [e for e, count in current.items() if existing.get(e, count) != count]:
+            position, first_seen = conn.execute(
+                "SELECT position, first_seen FROM recipients WHERE email = ?", (email,)
+            ).fetchone()
+            changed.append((position, (email, current[email], first_seen, now)))
+
+        added = [(next_position + i, (email, count, now, now)) for i, (email, count) in enumerate(sorted(new))]
+        conn.executemany("INSERT INTO recipients VALUES (?, ?, ?, ?, ?)",
+                         [(email, position, count, first, last) for position, (email, count, first, last) in added])
+        conn.executemany("UPDATE recipients SET count = ?, last_seen = ? WHERE email = ?",
+                         [(count, last, email) for _position, (email, count, _first, last) in changed])
+        return added, changed
+
+    def rows(self):
+        """Every indexed row (COLUMNS tuples) in file order."""
+        return self._conn.execute(
+            "SELECT email, count, first_seen, last_seen FROM recipients ORDER BY position"
+        )
+
+    def commit(self, fmt):
+        """Record the written output's state and commit the transaction."""
+        state = {"version": str(INDEX_VERSION), "format": fmt, "rows": str(len(self)),
+                 "output_state": _file_state(self.output_path)}
+        self._conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", state.items())
+        self._conn.execute("COMMIT")
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+
+def _patch_lines(lines, out, encode, added, changed):
+    """
+    Copy data lines to `out`, re-encoding changed positions, then append
+    the new rows. Line i is the recipient at position i (positions are
+    assigned in append order), so nothing is parsed.
+    """
+    replacements = {position: row for position, row in changed}
+    for position, line in enumerate(lines):
+        row = replacements.get(position)
+        out.write(encode(row) if row is not None else line)
+    out.writelines(encode(row) for _position, row in added)
+
+
+def _patch_csv(src, tmp, added, changed):
+    with open(src, "rb") as old, open(tmp, "wb") as out:
+        if not changed:
+            # Pure append: byte copy plus the new rows
+            shutil.copyfileobj(old, out, 1 << 20)
+            out.writelines(_csv_line(row) for _position, row in added)
+        else:
+            out.write(old.readline())  # header
+            _patch_lines(old, out, _csv_line, added, changed)
+
+
+def _write_full_csv(tmp, rows):
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+
+# --- minimal XLSX package ---------------------------------------------------
+
+_SHEET_HEAD = (b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>\n')
+_SHEET_TAIL = b"</sheetData></worksheet>\n"
+_RECIPIENTS_SHEET = "xl/worksheets/sheet1.xml"
+
+
+def _package_parts(sheet_names):
+    """Static parts of a workbook with the given sheets (sheet1.xml, sheet2.xml, ...)."""
+    ns = "http://schemas.openxmlformats.org"
+    overrides = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+        f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in range(1, len(sheet_names) + 1)
+    )
+    sheets = "".join(f'<sheet name="{escape(name)}" sheetId="{i}" r:id="rId{i}"/>'
+                     for i, name in enumerate(sheet_names, 1))
+    rels = "".join(f'<Relationship Id="rId{i}" Type="{ns}/officeDocument/2006/relationships/worksheet" '
+                   f'Target="worksheets/sheet{i}.xml"/>' for i in range(1, len(sheet_names) + 1))
+    return {
+        "[Content_Types].xml":
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Types xmlns="{ns}/package/2006/content-types">'
+            f'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            f'<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            f'{overrides}</Types>',
+        "_rels/.rels":
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{ns}/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{ns}/officeDocument/2006/relationships/officeDocument" '
+            f'Target="xl/workbook.xml"/></Relationships>',
+        "xl/workbook.xml":
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<workbook xmlns="{ns}/spreadsheetml/2006/main" '
+            f'xmlns:r="{ns}/officeDocument/2006/relationships"><sheets>{sheets}</sheets></workbook>',
+        "xl/_rels/workbook.xml.rels":
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{ns}/package/2006/relationships">{rels}</Relationships>',
+    }
+
+
+def _write_xlsx(src, tmp, added, changed, rows, sheets):
+    """
+    Write the workbook to `tmp`: the recipients sheet is patched from
+    `src` when given, else written from `rows`; extra sheets (see
+    excel.extra_sheets) are always written in full.
+    """
+    sheet_names = ["Recipients"] + [name for name, _suffix, _columns, _rows in sheets]
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as out:
+        for name, content in _package_parts(sheet_names).items():
+            out.writestr(name, content)
+        with out.open(_RECIPIENTS_SHEET, "w") as sheet:
+            sheet.write(_SHEET_HEAD)
+            sheet.write(_xlsx_line(COLUMNS))
+            if src is not None:
+                with zipfile.ZipFile(src) as old, old.open(_RECIPIENTS_SHEET) as old_sheet:
+                    old_sheet.readline()  # XML declaration
+                    old_sheet.readline()  # <worksheet><sheetData>
+                    old_sheet.readline()  # header row
+                    data = (line for line in old_sheet if not line.startswith(b"</sheetData>"))
+                    _patch_lines(data, sheet, _xlsx_line, added, changed)
+            else:
+                sheet.writelines(_xlsx_line(row) for row in rows)
+            sheet.write(_SHEET_TAIL)
+        for number, (_name, _suffix, columns, extra_rows) in enumerate(sheets, 2):
+            with out.open(f"xl/worksheets/sheet{number}.xml", "w") as sheet:
+                sheet.write(_SHEET_HEAD)
+                sheet.write(_xlsx_line(columns))
+                sheet.writelines(_xlsx_line([r.get(c) for c in columns]) for r in extra_rows)
+                sheet.write(_SHEET_TAIL)
+
+
+def save_incremental(output_path, table, sheets=()):
+    """
+    Merge a run's recipients into `output_path` using its sidecar index.
+
+    Args:
+        output_path: .csv or .xlsx output
+        table: RecipientTable of this run
+        sheets: Extra XLSX sheets (see excel.extra_sheets); CSV callers
+                write those as sidecars themselves
+
+    Returns:
+        dict with mode ("append", "patch" or "full"), added, updated,
+        total (rows in the output) and seconds
+    """
+    from .excel import _atomic_path
+
+    started = time.perf_counter()
+    fmt = "csv" if output_path.lower().endswith(".csv") else "xlsx"
+    index = ExportIndex(output_path)
+    try:
+        if len(index) and index.meta("format") != fmt:
+            raise ValueError(f"{index.path} indexes a {index.meta('format')} output, not {fmt}")
+        reusable = index.output_matches()
+        if len(index) == 0 and os.path.exists(output_path):
+            print(f"Warning: {output_path} has no export index; replacing it with a fresh incremental export")
+        added, changed = index.apply(table, time.strftime("%Y-%m-%d %H:%M:%S"))
+
+        mode = ("patch" if changed else "append") if reusable else "full"
+        with _atomic_path(output_path) as tmp:
+            if fmt == "csv" and reusable:
+                _patch_csv(output_path, tmp, added, changed)
+            elif fmt == "csv":
+                _write_full_csv(tmp, index.rows())
+            elif reusable:
+                _write_xlsx(output_path, tmp, added, changed, None, sheets)
+            else:
+                _write_xlsx(None, tmp, (), (), index.rows(), sheets)
+        index.commit(fmt)
+        total = len(index)
+    except BaseException:
+        index.rollback()
+        raise
+    finally:
+        index.close()
+    return {"mode": mode, "added": len(added), "updated": len(changed), "total": total,
+            "seconds": round(time.perf_counter() - started, 4)}
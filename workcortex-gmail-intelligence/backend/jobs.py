@@ -0,0 +1,429 @@
+"""
+jobs.py - Persistent Job Queue and Worker
+
+The UI and CLI submit pipeline runs as jobs to a local SQLite queue; a
+worker daemon (`python -m backend.cli worker`) claims and runs them with
+a fixed parallelism, highest priority first, while capping how many
+jobs may use the same Gmail account at once. Job status, events and
+results are queryable by job id and survive restarts: a worker that
+starts up requeues jobs left RUNNING by a worker process that is gone.
+
+Each job runs in its own `backend.cli run` subprocess, so jobs do not
+share the in-process event queue or environment, a crashing job cannot
+take the worker down, and concurrent jobs share Gmail quota through the
+SQLite quota database (see quota.py).
+"""
+
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+from .settings import data_dir
+
+# Job states
+QUEUED, RUNNING, SUCCESS, FAILED, CANCELLED = "QUEUED", "RUNNING", "SUCCESS", "FAILED", "CANCELLED"
+FINISHED = (SUCCESS, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    accounts TEXT NOT NULL,
+    options TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    event_log TEXT,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, id);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+def default_path():
+    """Location of the job database (under WORKCORTEX_HOME)."""
+    return os.path.join(data_dir(), "jobs.db")
+
+
+def job_accounts(options):
+    """
+    Accounts a job draws quota from (the unit of the per-account cap).
+
+    Token paths from options["accounts"], else the default token.
+    """
+    accounts = options.get("accounts") or [os.environ.get("GMAIL_TOKEN_PATH", "default")]
+    return sorted({os.path.abspath(a) if a != "default" else a for a in accounts})
+
+
+def worker_id():
+    """host:pid of this process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _worker_alive(worker):
+    """Whether a worker id on this host still has a running process."""
+    host, _, pid = (worker or "").rpartition(":")
+    if host != socket.gethostname():
+        return True  # cannot tell; leave other hosts' jobs alone
+    try:
+        os.kill(int(pid), 0)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue.
+
+    Safe to use from several threads and processes: state changes run in
+    BEGIN IMMEDIATE transactions.
+
+    Args:
+        path: Database file (default: default_path())
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        job["accounts"] = json.loads(job["accounts"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    # -- submit / inspect ---------------------------------------------------
+
+    def submit(self, options, priority=0):
+        """
+        Queue a pipeline run.
+
+        Args:
+            options: Run options (cli.RUN_DEFAULTS keys)
+            priority: Higher runs first
+
+        Returns:
+            Job id
+        """
+        cur = self._connect().execute(
+            "INSERT INTO jobs (status, priority, accounts, options, created) VALUES (?, ?, ?, ?, ?)",
+            (QUEUED, int(priority), json.dumps(job_accounts(options)), json.dumps(options), time.time())
+        )
+        return cur.lastrowid
+
+    def get(self, job_id):
+        """Job dict (status, options, timestamps, result, ...) or None."""
+        return self._job(self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list(self, status=None, limit=50):
+        """Most recent jobs, optionally only those in `status`."""
+        if status:
+            rows = self._connect().execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)
+            ).fetchall()
+        else:
+            rows = self._connect().execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._job(r) for r in rows]
+
+    def events(self, job_id):
+        """
+        A job's events (oldest first).
+
+        Read from the job's live event log while it runs, from the
+        database once it has finished.
+        """
+        rows = self._connect().execute(
+            "SELECT event FROM job_events WHERE job_id = ? ORDER BY seq", (job_id,)
+        ).fetchall()
+        if rows:
+            return [json.loads(r[0]) for r in rows]
+        job = self.get(job_id)
+        if job and job["status"] == RUNNING and job["event_log"]:
+            return read_event_log(job["event_log"])
+        return []
+
+    def result(self, job_id):
+        """The run summary of a finished job, or None."""
+        job = self.get(job_id)
+        return job["result"] if job else None
+
+    def cancel(self, job_id):
+        """
+        Cancel a job: QUEUED jobs are cancelled at once, RUNNING jobs are
+        flagged and stopped by their worker.
+
+        Returns:
+            True if the job was cancelled or flagged
+        """
+        def fn(conn):
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, finished = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED)
+            )
+            if cur.rowcount:
+                return True
+            cur = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING)
+            )
+            return bool(cur.rowcount)
+        return self._transaction(fn)
+
+    # -- worker side --------------------------------------------------------
+
+    def claim(self, worker, account_cap=1):
+        """
+        Take the next runnable job: highest priority, then oldest, among
+        those whose accounts are each used by fewer than `account_cap`
+        running jobs.
+
+        Returns:
+            Job dict (now RUNNING) or None
+        """
+        def fn(conn):
+            busy = {}
+            for row in conn.execute("SELECT accounts FROM jobs WHERE status = ?", (RUNNING,)):
+                for account in json.loads(row[0]):
+                    busy[account] = busy.get(account, 0) + 1
+            for row in conn.execute(
+                "SELECT id, accounts FROM jobs WHERE status = ? ORDER BY priority DESC, id", (QUEUED,)
+            ):
+                if all(busy.get(a, 0) < account_cap for a in json.loads(row[1])):
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, started = ?, worker = ?, attempts = attempts + 1"
+                        " WHERE id = ?", (RUNNING, time.time(), worker, row[0])
+                    )
+                    return row[0]
+            return None
+        job_id = self._transaction(fn)
+        return self.get(job_id) if job_id is not None else None
+
+    def set_event_log(self, job_id, path):
+        self._connect().execute("UPDATE jobs SET event_log = ? WHERE id = ?", (path, job_id))
+
+    def finish(self, job_id, status, result=None, error=None, events=()):
+        """Record a job's outcome, summary and events."""
+        def fn(conn):
+            conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+            conn.executemany(
+                "INSERT INTO job_events VALUES (?, ?, ?)",
+                ((job_id, seq, json.dumps(event, default=str)) for seq, event in enumerate(events))
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ?, result = ? WHERE id = ?",
+                (status, time.time(), error, json.dumps(result, default=str) if result is not None else None, job_id)
+            )
+        self._transaction(fn)
+
+    def requeue_orphans(self):
+        """
+        Put RUNNING jobs whose worker process is gone back in the queue.
+
+        Returns:
+            Ids of requeued jobs
+        """
+        def fn(conn):
+            orphans = [
+                row[0] for row in conn.execute("SELECT id, worker FROM jobs WHERE status = ?", (RUNNING,))
+                if not _worker_alive(row[1])
+            ]
+            for job_id in orphans:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, started = NULL WHERE id = ?", (QUEUED, job_id)
+                )
+            return orphans
+        return self._transaction(fn)
+
+    def cancel_requested(self, job_id):
+        row = self._connect().execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+
+def read_event_log(path):
+    """Pipeline events (not log records) from a job's JSONL event log."""
+    events = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # partially written last line
+                if record.get("kind") != "log":
+                    events.append(record)
+    except OSError:
+        pass
+    return events
+
+
+class Worker:
+    """
+    Runs queued jobs until stopped.
+
+    Args:
+        queue: JobQueue
+        concurrency: Jobs run at the same time
+        account_cap: Running jobs allowed per Gmail account
+        poll_interval: Seconds between queue checks when idle
+        quota_db: SQLite quota database shared by the jobs
+                  (default: WORKCORTEX_QUOTA_DB or <data dir>/quota.db)
+    """
+
+    def __init__(self, queue, concurrency=2, account_cap=1, poll_interval=1.0, quota_db=None):
+        self.queue = queue
+        self.concurrency = max(1, int(concurrency))
+        self.account_cap = max(1, int(account_cap))
+        self.poll_interval = float(poll_interval)
+        self.quota_db = quota_db or os.environ.get("WORKCORTEX_QUOTA_DB") or os.path.join(data_dir(), "quota.db")
+        self.id = worker_id()
+        self._threads = {}
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Stop claiming jobs (running jobs finish)."""
+        self._stop.set()
+
+    def run(self, exit_when_idle=False):
+        """
+        Claim and run jobs until stop() (or, with `exit_when_idle`, until
+        the queue is empty and nothing is running).
+
+        Returns:
+            Number of jobs run
+        """
+        requeued = self.queue.requeue_orphans()
+        if requeued:
+            print(f"[worker] requeued {len(requeued)} interrupted job(s): {requeued}", file=sys.stderr)
+        count = 0
+        while not self._stop.is_set():
+            self._threads = {j: t for j, t in self._threads.items() if t.is_alive()}
+            claimed = False
+            while len(self._threads) < self.concurrency:
+                job = self.queue.claim(self.id, self.account_cap)
+                if job is None:
+                    break
+                thread = threading.Thread(target=self._run_job, args=(job,), name=f"job-{job['id']}", daemon=True)
+                self._threads[job["id"]] = thread
+                thread.start()
+                claimed = True
+                count += 1
+            if exit_when_idle and not claimed and not self._threads:
+                break
+            self._stop.wait(self.poll_interval)
+        for thread in list(self._threads.values()):
+            thread.join()
+        return count
+
+    def _run_job(self, job):
+        """Run one job and record its outcome (FAILED if it cannot be started)."""
+        try:
+            status, result, error, events = self._execute(job)
+        except Exception as e:
+            status, result, error, events = FAILED, None, f"worker error: {e}", []
+        self.queue.finish(job["id"], status, result, error, events)
+        print(f"[worker] job {job['id']} {status}", file=sys.stderr)
+
+    def _execute(self, job):
+        """
+        Run a job in a `backend.cli run` subprocess.
+
+        Returns:
+            (status, summary or None, error or None, events)
+        """
+        job_dir = data_dir("jobs", str(job["id"]))
+        config = os.path.join(job_dir, "options.json")
+        summary = os.path.join(job_dir, "summary.json")
+        event_log = os.path.join(job_dir, "events.jsonl")
+        options = dict(job["options"], run_id=f"job-{job['id']}")
+        with open(config, "w") as f:
+            json.dump(options, f)
+        for path in (summary, event_log):
+            if os.path.exists(path):
+                os.remove(path)  # left over from an interrupted attempt
+        self.queue.set_event_log(job["id"], event_log)
+
+        cmd = [sys.executable, "-m", "backend.cli", "--quiet", "--event-log", event_log,
+               "--quota-db", self.quota_db, "run", "--config", config, "--summary", summary, "--events", "none"]
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(os.path.join(job_dir, "stderr.log"), "w") as stderr:
+            proc = subprocess.Popen(cmd, cwd=root, stdout=subprocess.DEVNULL, stderr=stderr)
+            cancelled = False
+            try:
+                while proc.poll() is None:
+                    if not cancelled and self.queue.cancel_requested(job["id"]):
+                        cancelled = True
+                        # SIGINT cancels the run at its next check and lets the CLI
+                        # write its summary (partial counts); Windows has no equivalent
+                        if os.name == "nt":
+                            proc.terminate()
+                        else:
+                            proc.send_signal(signal.SIGINT)
+                    time.sleep(0.5)
+            except BaseException:
+                # Lost track of the run: stop it rather than leave it unrecorded
+                proc.kill()
+                proc.wait()
+                raise
+
+        result = None
+        if os.path.exists(summary):
+            with open(summary) as f:
+                result = json.load(f)
+        if cancelled:
+            status, error = CANCELLED, "cancelled"
+        elif proc.returncode == 124:
+            status, error = CANCELLED, "deadline exceeded"
+        elif proc.returncode == 0:
+            status, error = SUCCESS, None
+        else:
+            status = FAILED
+            error = _last_failure(read_event_log(event_log)) or f"exit code {proc.returncode}"
+        return status, result, error, read_event_log(event_log)
+
+
+def _last_failure(events):
+    failures = [e["status"] for e in events if str(e.get("status", "")).startswith("FAILED")]
+    return failures[-1] if failures else None
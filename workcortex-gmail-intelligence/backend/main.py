@@ -5,14 +5,15 @@ Runs the complete execution pipeline with live event logging.
 This is the internal module; use run_main.py from project root.
 """
 
-from .engine import Engine
-from .gmail import fetch_emails
-from .ml import resolve_identities
-from .excel import save_excel
-from .events import listen, clear
+from .api import build_engine
+from .cancel import CancelToken, cancel_on_sigint
+from .context import PipelineContext
+from .events import listen, clear, format_timestamp
 
 
-def run_pipeline(sender, output_path, enable_ml=True, verify_mx=False, service=None):
+def run_pipeline(sender, output_path, enable_ml=True, verify_mx=False, service=None,
+                 export_clusters=False, incremental=False, export_groups=False, cancel=None,
+                 deadline=None, export_analytics=False):
     """
     Run the complete Gmail intelligence pipeline.
     
@@ -22,34 +23,40 @@ def run_pipeline(sender, output_path, enable_ml=True, verify_mx=False, service=N
         enable_ml: Whether to apply ML deduplication
         verify_mx: Whether to verify MX records
         service: Optional pre-authenticated Gmail service (from UI)
+        export_clusters: Whether to add the identity cluster report sheet
+        incremental: Merge into the existing output instead of rewriting it
+        export_groups: Whether to add the recipient groups sheet
+        cancel: Optional cancel.CancelToken to stop the run from elsewhere
+        deadline: Optional time budget in seconds for the whole run
+        export_analytics: Whether to add the Domains / Top Recipients sheets
     
     Returns:
-        Tuple of (success: bool, context: dict, events: list)
+        Tuple of (success: bool, context: PipelineContext, events: list)
     """
     # Clear any previous events
     clear()
     
     # Setup execution context
-    context = {
+    context = PipelineContext({
         "sender": sender,
         "output_path": output_path,
         "enable_ml": enable_ml,
-        "verify_mx": verify_mx
-    }
+        "verify_mx": verify_mx,
+        "export_clusters": export_clusters,
+        "incremental": incremental,
+        "export_groups": export_groups,
+        "deadline": deadline,
+        "export_analytics": export_analytics
+    })
+    if cancel is not None:
+        context["cancel"] = cancel
     
     # If service provided (from UI), use it; otherwise fetch_emails will authenticate
     if service:
         context["service"] = service
     
     # Create and configure engine
-    engine = Engine()
-    engine.add_step(1, "Fetching Gmail Emails", "Gmail API", fetch_emails)
-    
-    if enable_ml:
-        engine.add_step(2, "Resolving Duplicate Identities", "ML Engine", resolve_identities)
-        engine.add_step(3, "Saving to Excel", "Pandas/Excel", save_excel)
-    else:
-        engine.add_step(2, "Saving to Excel", "Pandas/Excel", save_excel)
+    engine = build_engine(context)
     
     # Run engine
     success = engine.run(context)
@@ -91,14 +98,17 @@ def main():
         print(f"Verify MX: {verify_mx}")
         print("=" * 60 + "\n")
 
-        success, context, events = run_pipeline(sender, output_path, enable_ml=enable_ml, verify_mx=verify_mx)
+        # First Ctrl-C stops the run cleanly (partial results are reported)
+        with cancel_on_sigint(CancelToken()) as cancel:
+            success, context, events = run_pipeline(sender, output_path, enable_ml=enable_ml,
+                                                    verify_mx=verify_mx, cancel=cancel)
 
         # Print log table
         print("\n" + "-" * 100)
         print(f"{'Timestamp':<20} | {'Order':<5} | {'Step':<35} | {'Tool':<20} | {'Status':<15}")
         print("-" * 100)
         for event in events:
-            timestamp = event.get("timestamp", "?")
+            timestamp = format_timestamp(event)
             order = event.get("order", "?")
             step = event.get("step", "?")[:35]
             tool = event.get("tool", "?")[:20]
@@ -111,6 +121,12 @@ def main():
             print(f"  Recipients extracted: {context.get('recipient_count', 0)}")
             print(f"  File saved: {context.get('excel_path', '?')}")
             return 0
+        elif context.get("cancelled"):
+            print(f"\n⚠️  CANCELLED ({context['cancelled']})")
+            print(f"  Recipients fetched before stopping: {len(context.get('emails') or [])}")
+            if context.get("excel_path"):
+                print(f"  Partial results saved: {context['excel_path']}")
+            return 130
         else:
             print(f"\n✗ FAILED - Check logs above for errors")
             return 1
@@ -122,5 +138,9 @@ def main():
 
 if __name__ == "__main__":
     import sys
+    if len(sys.argv) > 1:
+        # Any arguments -> headless CLI (run/resume/benchmark/cache)
+        from .cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
     sys.exit(main())
 
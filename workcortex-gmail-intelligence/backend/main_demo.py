@@ -8,12 +8,13 @@ import sys
 from .engine import Engine
 from .ml import resolve_identities
 from .excel import save_excel
-from .events import listen, clear
+from .events import listen, clear, format_timestamp
+from .store import RecipientTable
 
 
 def mock_fetch_emails(context):
     """Mock Gmail fetch for demo purposes."""
-    context["emails"] = [
+    context["emails"] = RecipientTable([
         "alice@company.com",
         "bob@company.com",
         "alice.smith@company.com",
@@ -23,7 +24,7 @@ def mock_fetch_emails(context):
         "david@tech.io",
         "eve@research.org",
         "frank@consulting.com",
-    ]
+    ])
 
 
 def main():
@@ -39,7 +40,8 @@ def main():
     context = {
         "sender": "john.doe@company.com (DEMO)",
         "output_path": "recipients_demo.xlsx",
-        "enable_ml": True
+        "enable_ml": True,
+        "export_clusters": True
     }
     
     # Create and configure engine
@@ -57,7 +59,7 @@ def main():
     print("-" * 100)
     
     for event in listen():
-        timestamp = event.get("timestamp", "?")
+        timestamp = format_timestamp(event)
         order = event.get("order", "?")
         step = event.get("step", "?")[:35]
         tool = event.get("tool", "?")[:20]
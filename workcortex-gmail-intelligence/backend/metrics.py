@@ -0,0 +1,359 @@
+"""
+metrics.py - Pipeline Metrics
+
+A small in-process metrics registry (counters, gauges, histograms) with
+OpenMetrics / Prometheus text output, fed by the Engine and the stages:
+step durations, messages fetched, API calls and retries, result cache
+hits, recipients per second and peak memory.
+
+Metrics are off until enable() is called; every record_* hook then
+returns immediately, so instrumented code pays one global lookup.
+Expose them with serve() (local HTTP /metrics) or write_textfile()
+(node_exporter textfile collector). No external dependencies.
+"""
+
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Default histogram buckets for step durations (seconds)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """A metric family: one value (or histogram) per label combination."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """Monotonically increasing total."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self, openmetrics):
+        name = self.name + "_total"
+        with self._lock:
+            return [(name, key, (), v) for key, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_max(self, value, **labels):
+        """Keep the largest value seen (peaks)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = max(value, self._values.get(key, value))
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels))
+
+    def samples(self, openmetrics):
+        with self._lock:
+            return [(self.name, key, (), v) for key, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Distribution over fixed buckets (cumulative on output)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self, openmetrics):
+        out = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    out.append((self.name + "_bucket", key, (("le", _number(bound)),), cumulative))
+                out.append((self.name + "_count", key, (), cumulative))
+                out.append((self.name + "_sum", key, (), total))
+        return out
+
+
+class Registry:
+    """Named metric families and their text exposition."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self, openmetrics=True):
+        """
+        Text exposition of every metric.
+
+        Args:
+            openmetrics: OpenMetrics 1.0 (default) or Prometheus 0.0.4 text
+                         (what node_exporter's textfile collector reads)
+        """
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for metric in metrics:
+            # Prometheus text names counter families with their _total suffix
+            family = metric.name if openmetrics or metric.kind != "counter" else metric.name + "_total"
+            lines.append(f"# HELP {family} {metric.documentation}")
+            lines.append(f"# TYPE {family} {metric.kind}")
+            for name, key, extra, value in metric.samples(openmetrics):
+                lines.append(f"{name}{_labels(metric.labelnames, key, extra)} {_number(value)}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def _standard_metrics(registry):
+    registry.histogram("workcortex_step_duration_seconds", "Engine step duration", ("step", "status"))
+    registry.counter("workcortex_pipeline_runs", "Pipeline runs by outcome", ("status",))
+    registry.counter("workcortex_messages_fetched", "Gmail messages matched and fetched")
+    registry.counter("workcortex_recipients_exported", "Recipients written to output files")
+    registry.counter("workcortex_api_calls", "Gmail API requests (including retries)", ("method",))
+    registry.counter("workcortex_api_retries", "Gmail API requests retried after an error", ("method",))
+    registry.counter("workcortex_api_quota_units", "Gmail quota units spent")
+    registry.counter("workcortex_result_cache_lookups", "Result cache lookups", ("result",))
+    registry.gauge("workcortex_result_cache_hit_ratio", "Result cache hits / lookups")
+    registry.gauge("workcortex_last_run_duration_seconds", "Wall time of the most recent run")
+    registry.gauge("workcortex_last_run_recipients_per_second", "Recipients exported per second in the most recent run")
+    registry.gauge("workcortex_last_run_timestamp_seconds", "End time of the most recent run")
+    registry.gauge("workcortex_peak_memory_bytes", "Peak resident memory of this process")
+
+
+_registry = None
+
+
+def enable():
+    """Turn metrics on (idempotent) and return the registry."""
+    global _registry
+    if _registry is None:
+        registry = Registry()
+        _standard_metrics(registry)
+        _registry = registry
+    return _registry
+
+
+def disable():
+    """Turn metrics off and drop collected values."""
+    global _registry
+    _registry = None
+
+
+def registry():
+    """The active Registry, or None when metrics are disabled."""
+    return _registry
+
+
+# -- hooks called by the engine and stages (no-ops when disabled) --------
+
+def record_step(name, status, seconds):
+    reg = _registry
+    if reg is None:
+        return
+    reg.get("workcortex_step_duration_seconds").observe(seconds, step=name, status=status)
+
+
+def record_api_call(method, units):
+    reg = _registry
+    if reg is None:
+        return
+    reg.get("workcortex_api_calls").inc(method=method)
+    reg.get("workcortex_api_quota_units").inc(units)
+
+
+def record_api_retry(method):
+    reg = _registry
+    if reg is None:
+        return
+    reg.get("workcortex_api_retries").inc(method=method)
+
+
+def record_cache(hit):
+    reg = _registry
+    if reg is None:
+        return
+    lookups = reg.get("workcortex_result_cache_lookups")
+    lookups.inc(result="hit" if hit else "miss")
+    hits, misses = lookups.value(result="hit"), lookups.value(result="miss")
+    reg.get("workcortex_result_cache_hit_ratio").set(hits / (hits + misses))
+
+
+def record_run(context, success, seconds):
+    """Run-level metrics from the finished context (called by Engine.run)."""
+    reg = _registry
+    if reg is None:
+        return
+    status = "SUCCESS" if success else ("CANCELLED" if context.get("cancelled") else "FAILED")
+    reg.get("workcortex_pipeline_runs").inc(status=status)
+    reg.get("workcortex_messages_fetched").inc(context.get("message_count") or 0)
+    recipients = 0 if context.get("cache_hit") else (context.get("recipient_count") or 0)
+    reg.get("workcortex_recipients_exported").inc(recipients)
+    reg.get("workcortex_last_run_duration_seconds").set(round(seconds, 4))
+    reg.get("workcortex_last_run_recipients_per_second").set(
+        round((context.get("recipient_count") or 0) / seconds, 2) if seconds > 0 else 0
+    )
+    reg.get("workcortex_last_run_timestamp_seconds").set(round(time.time(), 3))
+    peak = peak_memory_bytes()
+    if peak is not None:
+        reg.get("workcortex_peak_memory_bytes").set_max(peak)
+
+
+def peak_memory_bytes():
+    """Peak resident set size of this process, or None if unavailable."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# -- exposition ------------------------------------------------------------
+
+def write_textfile(path):
+    """
+    Write the registry for node_exporter's textfile collector.
+
+    Written atomically (temp file + rename) as the collector requires,
+    world-readable (0644) since node_exporter usually runs as another
+    user. Does nothing when metrics are disabled.
+    """
+    reg = _registry
+    if reg is None:
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(reg.render(openmetrics=False))
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def serve(port, address="127.0.0.1"):
+    """
+    Serve GET /metrics on a background thread (enables metrics).
+
+    Content is negotiated: OpenMetrics if the scraper accepts it, else
+    Prometheus text.
+
+    Returns:
+        The HTTP server (call shutdown() to stop)
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    enable()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            reg = _registry
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            body = (reg.render(openmetrics) if reg else "").encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, int(port)), Handler)
+    threading.Thread(target=server.serve_forever, name="workcortex-metrics", daemon=True).start()
+    return server
@@ -5,9 +5,131 @@ Uses explainable ML (normalization + clustering) to group similar email addresse
 that likely belong to the same person.
 """
 
-import numpy as np
-from sklearn.cluster import AgglomerativeClustering
+from .cancel import check_cancelled
 from .events import emit
+from .store import RecipientTable, as_table
+
+
+# Provider rules: domain -> (canonical domain, dots ignored, "+tag" subaddressing)
+PROVIDER_RULES = {
+    "gmail.com": ("gmail.com", True, True),
+    "googlemail.com": ("gmail.com", True, True),
+    "outlook.com": ("outlook.com", False, True),
+    "hotmail.com": ("hotmail.com", False, True),
+    "live.com": ("live.com", False, True),
+    "icloud.com": ("icloud.com", False, True),
+    "me.com": ("me.com", False, True),
+    "fastmail.com": ("fastmail.com", False, True),
+    "protonmail.com": ("protonmail.com", False, True),
+    "proton.me": ("proton.me", False, True),
+}
+
+_PLUS_TAG_DOMAINS = {d for d, (_, _, plus) in PROVIDER_RULES.items() if plus}
+_DOTLESS_DOMAINS = {d for d, (_, no_dots, _) in PROVIDER_RULES.items() if no_dots}
+_DOMAIN_ALIASES = {d: canonical for d, (canonical, _, _) in PROVIDER_RULES.items() if canonical != d}
+
+# Canonical addresses already computed (bounded; cleared when full)
+_CANONICAL_CACHE = {}
+_CANONICAL_CACHE_SIZE = 500_000
+
+# Below this many rows, worker start-up costs more than normalizing in-process
+_PARALLEL_NORMALIZE_ROWS = 20_000
+
+
+def _idna(domain):
+    """Punycode form of an internationalized domain (ASCII domains unchanged)."""
+    if domain.isascii():
+        return domain
+    try:
+        return domain.encode("idna").decode("ascii")
+    except UnicodeError:
+        return domain
+
+
+def canonical_email(email):
+    """
+    Provider-aware canonical form of one address (scalar version).
+    
+    Case-folds the whole address (every domain) and punycodes IDN
+    domains; Googlemail -> Gmail aliasing, Gmail dot-insensitivity and
+    "+tag" removal only apply to the providers in PROVIDER_RULES:
+        J.Doe+news@GoogleMail.com  ->  jdoe@gmail.com
+        Bob+x@Outlook.com          ->  bob@outlook.com
+        Anna@Bücher.example        ->  anna@xn--bcher-kva.example
+        J.Doe+x@Company.com        ->  j.doe+x@company.com
+    
+    Args:
+        email: Email address string
+    
+    Returns:
+        Canonical address
+    """
+    local, sep, domain = email.strip().rpartition("@")
+    if not sep:
+        return email.strip().casefold()
+    local = local.casefold()
+    domain = _idna(domain.casefold())
+    rule = PROVIDER_RULES.get(domain)
+    if rule is not None:
+        domain, no_dots, plus_tags = rule
+        if plus_tags:
+            local = local.split("+", 1)[0]
+        if no_dots:
+            local = local.replace(".", "")
+    return f"{local}@{domain}"
+
+
+def canonical_emails(emails):
+    """
+    Batch version of canonical_email for whole arrays.
+    
+    Works on unique addresses only (repeats are mapped back by index),
+    skips addresses seen in earlier calls, and applies each rule as one
+    vectorized pandas string operation over the rows it concerns.
+    
+    Args:
+        emails: Sequence of address strings
+    
+    Returns:
+        List of canonical addresses, aligned with `emails`
+    """
+    import pandas as pd
+
+    codes, uniques = pd.factorize(pd.Series(list(emails), dtype=object), sort=False)
+    cache = _CANONICAL_CACHE
+    known = [cache.get(u) for u in uniques]
+    todo = [i for i, c in enumerate(known) if c is None]
+
+    if todo:
+        raw = pd.Series([uniques[i] for i in todo], dtype=object).str.strip()
+        parts = raw.str.rpartition("@")
+        has_at = parts[1] == "@"
+        local = parts[0].where(has_at, raw).str.casefold()
+        domain = parts[2].where(has_at, "").str.casefold()
+
+        # Punycode only the (few) distinct non-ASCII domains
+        non_ascii = ~domain.str.match(r"^[\x00-\x7f]*$")
+        if non_ascii.any():
+            domain[non_ascii] = domain[non_ascii].map({d: _idna(d) for d in domain[non_ascii].unique()})
+
+        plus_tags = domain.isin(_PLUS_TAG_DOMAINS)
+        no_dots = domain.isin(_DOTLESS_DOMAINS)
+        aliased = domain.isin(_DOMAIN_ALIASES)
+        if plus_tags.any():
+            local[plus_tags] = local[plus_tags].str.replace(r"\+.*$", "", regex=True)
+        if no_dots.any():
+            local[no_dots] = local[no_dots].str.replace(".", "", regex=False)
+        if aliased.any():
+            domain[aliased] = domain[aliased].map(_DOMAIN_ALIASES)
+
+        result = (local + "@" + domain).where(has_at, local).tolist()
+        if len(cache) + len(result) > _CANONICAL_CACHE_SIZE:
+            cache.clear()
+        for i, value in zip(todo, result):
+            known[i] = value
+            cache[uniques[i]] = value
+
+    return [known[c] for c in codes]
 
 
 def normalize_email(email):
@@ -18,6 +140,7 @@ def normalize_email(email):
         john.doe@gmail.com    →  johndoe
         johndoe@company.com   →  johndoe
         john_doe@startup.io   →  johndoe
+        John.Doe+news@googlemail.com  →  johndoe
     
     Args:
         email: Email address string
@@ -28,10 +151,191 @@ def normalize_email(email):
     if "@" not in email:
         return email.lower()
     
-    username = email.split("@")[0].lower()
-    # Remove dots and underscores
-    normalized = username.replace(".", "").replace("_", "")
-    return normalized
+    return _normalize_username(canonical_email(email).rpartition("@")[0])
+
+
+def normalize_emails(emails):
+    """Batch normalize_email: identity keys for a sequence of addresses."""
+    return [
+        _normalize_username(c.rpartition("@")[0]) if "@" in c else c
+        for c in canonical_emails(emails)
+    ]
+
+
+def _normalize_range(handle, start, end):
+    """Process-pool worker: identity keys for rows [start, end) of a shared table."""
+    table = RecipientTable.attach(handle)
+    try:
+        return normalize_emails([table.address(row) for row in range(start, end)])
+    finally:
+        # The columns point into the block; drop them before unmapping
+        del table
+        handle.close()
+
+
+def normalize_table(table, workers=1):
+    """
+    normalize_emails over a RecipientTable, split across processes.
+
+    With workers > 1 and a large table, the table is exported once to
+    shared memory (RecipientTable.share) and each worker attaches it and
+    normalizes a contiguous row range, so no address list is pickled.
+
+    Args:
+        table: RecipientTable
+        workers: Worker processes (1: normalize in this process)
+
+    Returns:
+        List of identity keys, aligned with the table's rows
+    """
+    rows = len(table)
+    if workers <= 1 or rows < _PARALLEL_NORMALIZE_ROWS:
+        return normalize_emails(table)
+    from concurrent.futures import ProcessPoolExecutor
+
+    step = -(-rows // workers)
+    starts = list(range(0, rows, step))
+    ends = [min(start + step, rows) for start in starts]
+    handle = table.share()
+    try:
+        with ProcessPoolExecutor(max_workers=len(starts)) as pool:
+            parts = pool.map(_normalize_range, [handle] * len(starts), starts, ends)
+            return [key for part in parts for key in part]
+    finally:
+        handle.unlink()
+
+
+def _normalize_username(username):
+    """Lowercase a username and remove dots and underscores."""
+    return username.lower().replace(".", "").replace("_", "")
+
+
+class ClusterReport:
+    """
+    Explanation of one identity resolution run.
+    
+    Only keeps references to the clustering inputs and labels; the
+    per-member rows are computed the first time `rows()` is called, so
+    runs that never export the report pay nothing for it.
+    
+    Each member is scored against its cluster's canonical email:
+        distance     = |vector(member) - vector(canonical)|
+        match_score  = 1 - distance / distance_threshold  (clipped to 0..1)
+    """
+    
+    COLUMNS = [
+        "cluster_id", "canonical_email", "member_email",
+        "normalized", "distance", "match_score", "cluster_size"
+    ]
+    
+    def __init__(self, table, normalized, vectors, labels, canonical, threshold):
+        self.table = table
+        self.normalized = normalized
+        self.vectors = vectors
+        self.labels = labels
+        self.canonical = canonical
+        self.threshold = threshold
+        self._rows = None
+    
+    def __len__(self):
+        return len(self.canonical)
+    
+    def rows(self):
+        """
+        Materialize the report.
+        
+        Returns:
+            List of dicts (one per input email) keyed by COLUMNS,
+            ordered by cluster then score (canonical first)
+        """
+        if self._rows is not None:
+            return self._rows
+        
+        table = self.table
+        sizes = {}
+        for label in self.labels:
+            sizes[label] = sizes.get(label, 0) + 1
+        
+        rows = []
+        for row, label in enumerate(self.labels):
+            canonical = self.canonical[label]
+            distance = float(abs(self.vectors[row][0] - self.vectors[canonical][0]))
+            score = max(0.0, 1.0 - distance / self.threshold) if self.threshold else 1.0
+            rows.append({
+                "cluster_id": int(label),
+                "canonical_email": table.address(canonical),
+                "member_email": table.address(row),
+                "normalized": self.normalized[row],
+                "distance": distance,
+                "match_score": round(score, 4),
+                "cluster_size": sizes[label],
+            })
+        
+        rows.sort(key=lambda r: (r["cluster_id"], -r["match_score"], r["member_email"]))
+        self._rows = rows
+        return rows
+    
+    def merges(self):
+        """Rows for clusters that actually merged more than one email."""
+        return [r for r in self.rows() if r["cluster_size"] > 1]
+
+
+def split_cooccurring(labels, table, cooccurrence, max_shared=0):
+    """
+    Split clusters whose members were addressed on the same messages.
+    
+    Aliases of one person are rarely on one message together, while
+    teammates with similar names are. Within each cluster, members that
+    co-occurred on more than `max_shared` messages are separated: each
+    member (in row order) joins the first sub-cluster holding none of
+    the members it co-occurred with.
+    
+    Args:
+        labels: Cluster label per table row
+        table: RecipientTable the labels refer to
+        cooccurrence: cooccurrence.CooccurrenceMatrix from the fetch stage
+        max_shared: Shared messages tolerated between aliases
+    
+    Returns:
+        (labels, splits) - new label array and number of clusters added
+    """
+    import numpy as np
+
+    labels = np.array(labels)
+    sizes = np.bincount(labels)
+    rows = np.flatnonzero(sizes[labels] > 1)
+    if not len(rows):
+        return labels, 0
+
+    # One lookup for every member of a multi-member cluster; keep the
+    # pairs that fall inside a cluster
+    shared = cooccurrence.submatrix([table.address(r) for r in rows]).tocoo()
+    a, b = rows[shared.row], rows[shared.col]
+    inside = (a < b) & (labels[a] == labels[b]) & (shared.data > max_shared)
+    conflicts = {}
+    for i, j in zip(a[inside].tolist(), b[inside].tolist()):
+        conflicts.setdefault(j, []).append(i)
+    if not conflicts:
+        return labels, 0
+
+    next_label = int(labels.max()) + 1
+    splits = 0
+    part = {}
+    sub_labels = {}
+    for row in rows.tolist():
+        taken = {part[i] for i in conflicts.get(row, ()) if i in part}
+        k = 0
+        while k in taken:
+            k += 1
+        part[row] = k
+        if k:
+            key = (labels[row], k)
+            if key not in sub_labels:
+                sub_labels[key] = next_label
+                next_label += 1
+                splits += 1
+            labels[row] = sub_labels[key]
+    return labels, splits
 
 
 def resolve_identities(context):
@@ -39,15 +343,24 @@ def resolve_identities(context):
     Group similar email addresses using unsupervised clustering.
     
     Algorithm:
-    1. Normalize email usernames
+    1. Normalize email usernames (provider-aware, see canonical_email)
     2. Convert to feature vectors (hash-based)
     3. Apply hierarchical clustering
-    4. Keep one email from each cluster
+    4. Split clusters whose members co-occur on messages (when the
+       fetch stage built context["cooccurrence"], see split_cooccurring)
+    5. Keep one email from each cluster
     
     Args:
         context: Execution context
-            Must contain: emails (list of email strings)
-            Will populate: emails (deduplicated by identity)
+            Must contain: emails (RecipientTable or list of email strings)
+            Optional: cooccurrence (CooccurrenceMatrix),
+                      alias_max_cooccurrence (int, default 0),
+                      ml_workers (processes normalizing large tables,
+                                  default 1; see normalize_table),
+                      cancel (cancel.CancelToken, checked between phases)
+            Will populate: emails (RecipientTable deduplicated by identity),
+                           cluster_report (ClusterReport, built lazily),
+                           cooccurrence_splits (clusters split apart)
     
     This is valid ML:
     - Feature extraction (normalization)
@@ -55,39 +368,63 @@ def resolve_identities(context):
     - Explainable (can show which emails grouped)
     - No deep learning hype
     """
-    emails = list(set(context.get("emails", [])))
+    # NumPy / scikit-learn are only imported when ML actually runs
+    import numpy as np
+    from sklearn.cluster import AgglomerativeClustering
+
+    table = as_table(context.get("emails", []))
 
     # Emit internal ML start
     emit(998, "Resolving identities - feature extraction", "ML Engine", "STARTED")
 
-    if len(emails) <= 1:
+    if len(table) <= 1:
+        context["emails"] = table
+        context["identity_count"] = len(table)
         emit(998, "Resolving identities - nothing to do", "ML Engine", "SUCCESS")
         return
     
-    # Normalize all emails
-    normalized = [normalize_email(e) for e in emails]
+    # Provider-aware keys, computed in one batch over unique addresses
+    normalized = normalize_table(table, int(context.get("ml_workers") or 1))
     
     # Create feature vectors from normalized names
     # Use hash to convert strings to numeric values
     vectors = np.array([[hash(n) % 10000] for n in normalized]).reshape(-1, 1)
     
+    # Cancellation is checked between phases; emails stay unresolved if cancelled
+    check_cancelled(context)
+    
     # Apply hierarchical clustering
+    threshold = 3000
     clustering = AgglomerativeClustering(
         n_clusters=None,
-        distance_threshold=3000,
+        distance_threshold=threshold,
         linkage="average"
     )
     clustering.fit(vectors)
+    labels = clustering.labels_
     
-    # Keep first email from each cluster
+    # Co-occurrence: addresses on the same message are different people
+    cooccurrence = context.get("cooccurrence")
+    check_cancelled(context)
+    if cooccurrence is not None and len(cooccurrence):
+        labels, splits = split_cooccurring(
+            labels, table, cooccurrence, context.get("alias_max_cooccurrence", 0)
+        )
+        context["cooccurrence_splits"] = splits
+        emit(998, f"Resolving identities - co-occurrence split {splits} cluster(s)", "ML Engine", "SUCCESS")
+    
+    # Keep first email (row) from each cluster
     grouped = {}
-    for label, email in zip(clustering.labels_, emails):
+    for row, label in enumerate(labels):
         if label not in grouped:
-            grouped[label] = email
+            grouped[label] = row
     
-    # Deduplicated emails
-    deduplicated = sorted(list(grouped.values()))
+    # Deduplicated emails (shares the fetch stage's string pools)
+    deduplicated = table.select(sorted(grouped.values()))
     context["emails"] = deduplicated
     context["identity_count"] = len(deduplicated)
+    context["cluster_report"] = ClusterReport(
+        table, normalized, vectors, labels, grouped, threshold
+    )
 
     emit(998, "Resolving identities - completed", "ML Engine", "SUCCESS")
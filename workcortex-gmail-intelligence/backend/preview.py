@@ -0,0 +1,166 @@
+"""
+preview.py - Fast Sender Preview
+
+Estimates how big an extraction will be before running it: the message
+count comes from the listing's resultSizeEstimate, and distinct
+recipient/domain counts from a random sample of message metadata fed
+into HyperLogLog sketches (extrapolated by capture-recapture between the
+two halves of the sample). Cost is a few list pages plus `sample`
+metadata gets, independent of mailbox size. The gets run on the fetch
+stage's tuned thread pool (gmail._fetch_all), so the sample is not
+limited to one request at a time.
+"""
+
+import random
+import time
+
+from .events import emit
+from .gmail import (open_service, save_recording, execute_request, attach_quota_lease, start_tuner,
+                    finish_tuner, thread_service_factory, _fetch_all, _get_message)
+from .sketch import HyperLogLog
+from .store import RecipientTable
+
+# Listing page size used by the preview (Gmail maximum)
+PAGE_SIZE = 500
+
+
+class _SampleSketches:
+    """
+    Per-message observer for gmail._fetch_all: feeds alternate sampled
+    messages into two halves (recipient and domain HyperLogLogs each),
+    leaving out the mailbox owner like the full fetch does.
+    """
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.recipients = (HyperLogLog(), HyperLogLog())
+        self.domains = (HyperLogLog(), HyperLogLog())
+        self.messages = 0
+        self.occurrences = 0
+
+    def add_message(self, addresses):
+        half = self.messages % 2
+        self.messages += 1
+        for addr in addresses:
+            addr = addr.lower()
+            if addr == self.owner:
+                continue
+            self.occurrences += 1
+            self.recipients[half].add(addr)
+            self.domains[half].add(addr.rsplit("@", 1)[-1])
+
+
+def preview_sender(context):
+    """
+    Estimate message and distinct recipient counts for a sender.
+
+    The sample is drawn uniformly from the first `preview_pages` listing
+    pages (the newest messages), so estimates describe recent traffic
+    when the mailbox is larger than that window. Like the full fetch,
+    the mailbox owner is not counted as a recipient.
+
+    Args:
+        context: Execution context
+            Must contain: sender
+            Optional: service (or replay_path / record_path, see
+                      gmail.open_service), preview_sample (default 100),
+                      preview_pages (default 2), preview_seed,
+                      auto_tune / fetch_concurrency (sampling threads,
+                      see gmail.start_tuner)
+            Will populate: preview_result (dict, see below)
+
+    preview_result:
+        messages_estimate    resultSizeEstimate from the listing
+        sampled_messages     messages whose metadata was fetched
+        recipients / domains {"sample_distinct": (low, est, high),
+                              "point_estimate": capture-recapture estimate,
+                              "total_estimate": (low, high)}
+        seconds, quota_units
+    """
+    sender = context.get("sender")
+    if not sender:
+        raise ValueError("sender not provided in context")
+
+    started = time.perf_counter()
+    service = open_service(context)
+    try:
+        profile = execute_request(service.users().getProfile(userId="me"), context)
+        context["receiver"] = profile.get("emailAddress")
+    except Exception:
+        context["receiver"] = None
+    attach_quota_lease(context, context["receiver"], service)
+    query = f"from:{sender}"
+
+    # A couple of listing pages: size estimate plus a pool to sample from
+    emit(996, "Preview - listing", "Gmail API", "STARTED")
+    pool = []
+    estimate = 0
+    request = service.users().messages().list(userId="me", q=query, maxResults=PAGE_SIZE)
+    for _ in range(int(context.get("preview_pages", 2))):
+        if request is None:
+            break
+        resp = execute_request(request, context)
+        estimate = max(estimate, int(resp.get("resultSizeEstimate", 0)))
+        pool.extend(resp.get("messages", []))
+        request = service.users().messages().list_next(request, resp)
+    estimate = max(estimate, len(pool))
+    emit(996, f"Preview - ~{estimate} messages", "Gmail API", "SUCCESS")
+
+    rng = random.Random(context.get("preview_seed"))
+    sample = rng.sample(pool, min(len(pool), int(context.get("preview_sample", 100))))
+
+    # Two sketches per measure (one per half of the sample) so that the
+    # overlap between halves gives a capture-recapture estimate of the total
+    sketches = _SampleSketches((context.get("receiver") or "").lower())
+    emit(996, f"Preview - sampling {len(sample)} messages", "Gmail API", "STARTED")
+    start_tuner(service, context["receiver"], context)
+    try:
+        _fetch_all(sample, _get_message, lambda m: f"message {m['id']}", service, RecipientTable(),
+                   context, thread_service_factory(service, context), observers=[sketches])
+    finally:
+        finish_tuner(context)
+    emit(996, "Preview - sampling complete", "Gmail API", "SUCCESS")
+    save_recording(service, context)
+
+    recipients, domains = sketches.recipients, sketches.domains
+    n = sketches.messages
+    per_message = sketches.occurrences / n if n else 0.0
+    # No sender can have more distinct recipients than recipient slots
+    ceiling = per_message * estimate
+
+    def extrapolate(halves):
+        a, b = halves
+        union = HyperLogLog(a.p)
+        union.merge(a)
+        union.merge(b)
+        low, est, high = union.bounds()
+        # Lincoln-Petersen: total ~ |A| * |B| / |A n B|, overlap by inclusion-exclusion
+        overlap = a.count() + b.count() - est
+        if overlap > union.relative_error * est:
+            # Sketch error on the overlap drives the interval
+            product = a.count() * b.count()
+            total = min(ceiling, product / overlap)
+            total_low = product / (overlap + (high - est))
+            total_high = min(ceiling, product / max(1.0, overlap - (high - est)))
+        else:
+            # Halves barely overlap: the sample says little beyond "large"
+            total = total_high = ceiling
+            total_low = est
+        return {
+            "sample_distinct": (round(low), round(est), round(high)),
+            "point_estimate": round(min(ceiling, max(est, total))),
+            "total_estimate": (round(min(ceiling, max(low, total_low))),
+                               round(min(ceiling, max(est, total_high)))),
+        }
+
+    context["preview_result"] = {
+        "sender": sender,
+        "messages_estimate": estimate,
+        "sampled_messages": n,
+        "recipients_per_message": round(per_message, 2),
+        "recipients": extrapolate(recipients),
+        "domains": extrapolate(domains),
+        "relative_error": round(recipients[0].relative_error, 4),
+        "seconds": round(time.perf_counter() - started, 3),
+        "quota_units": context.get("api_stats", {}).get("quota_units", 0),
+    }
@@ -0,0 +1,296 @@
+"""
+quota.py - Gmail Quota Limiting
+
+Token buckets measured in Gmail API quota units, so fetches stay under
+the per-user rate limit instead of tripping 429s.
+
+RateLimiter is a private bucket for one fetch. QuotaManager (via
+get_manager()) is shared by every pipeline in the process, and
+optionally across processes through a SQLite file.
+"""
+
+import threading
+import time
+
+# Gmail per-user rate limit (quota units per second)
+DEFAULT_UNITS_PER_SECOND = 250
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket for one Gmail account.
+
+    Args:
+        units_per_second: Refill rate (default: Gmail per-user limit)
+        burst: Bucket capacity (default: one second worth of units)
+    """
+
+    def __init__(self, units_per_second=DEFAULT_UNITS_PER_SECOND, burst=None):
+        self.rate = float(units_per_second)
+        self.capacity = float(burst if burst is not None else units_per_second)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, units=1):
+        """
+        Block until `units` quota units are available, then consume them.
+
+        Returns:
+            Seconds spent waiting
+        """
+        units = min(float(units), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= units:
+                    self._tokens -= units
+                    self.waited += waited
+                    return waited
+                delay = (units - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def _step_bucket(state, now, units, rate, capacity, penalty):
+    """
+    Advance one bucket state and try to take `units` from it.
+
+    Args:
+        state: (tokens, updated, window_start, window_units, total_units) or None
+        penalty: If set, empty the bucket to -penalty seconds of refill instead
+
+    Returns:
+        (new_state, wait) - wait is 0.0 when the units were granted
+    """
+    tokens, updated, window_start, window_units, total_units = state or (capacity, now, now, 0.0, 0.0)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if now - window_start >= 1.0:
+        window_start, window_units = now, 0.0
+
+    wait = 0.0
+    if penalty:
+        tokens = min(tokens, -penalty * rate)
+    elif tokens >= units:
+        tokens -= units
+        window_units += units
+        total_units += units
+    else:
+        wait = (units - tokens) / rate
+    return (tokens, now, window_start, window_units, total_units), wait
+
+
+class _SQLiteBuckets:
+    """
+    Token buckets kept in a local SQLite file so that separate processes
+    (UI, scheduled CLI runs, workers) share one budget per account.
+    Each take runs in a BEGIN IMMEDIATE transaction (file-level write lock).
+    """
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = path
+        self._local = threading.local()
+        self._sqlite3 = sqlite3
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " account TEXT PRIMARY KEY, tokens REAL, updated REAL,"
+            " window_start REAL, window_units REAL, total_units REAL)"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, account, units, rate, capacity, penalty=0.0):
+        """
+        Try to consume `units`; returns 0.0 on success, else seconds to wait.
+        A `penalty` (seconds) empties the bucket below zero instead.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated, window_start, window_units, total_units FROM buckets WHERE account = ?",
+                (account,)
+            ).fetchone()
+            state, wait = _step_bucket(row, now, units, rate, capacity, penalty)
+            conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?, ?)", (account,) + state)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def snapshot(self):
+        """{account: (tokens, updated, window_start, window_units, total_units)}"""
+        rows = self._connect().execute(
+            "SELECT account, tokens, updated, window_start, window_units, total_units FROM buckets"
+        ).fetchall()
+        return {r[0]: r[1:] for r in rows}
+
+
+class _MemoryBuckets:
+    """In-process equivalent of _SQLiteBuckets."""
+
+    def __init__(self):
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def take(self, account, units, rate, capacity, penalty=0.0):
+        with self._lock:
+            self._state[account], wait = _step_bucket(
+                self._state.get(account), time.time(), units, rate, capacity, penalty
+            )
+        return wait
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._state)
+
+
+class QuotaLease:
+    """
+    One pipeline's handle on an account's shared budget.
+
+    Has the same `acquire(units)` / `waited` interface as RateLimiter, so
+    it can be used as context["limiter"].
+    """
+
+    def __init__(self, manager, account, pipeline):
+        self.manager = manager
+        self.account = account
+        self.pipeline = pipeline
+        self.waited = 0.0
+
+    def acquire(self, units=1):
+        waited = self.manager.acquire(self.account, self.pipeline, units)
+        self.waited += waited
+        return waited
+
+    def penalize(self, seconds):
+        """Report a 429: pause the whole account (all pipelines) for `seconds`."""
+        self.manager.penalize(self.account, seconds)
+
+
+class QuotaManager:
+    """
+    Process-wide Gmail quota accounting, shared by concurrent pipelines.
+
+    Every account has one token bucket (units/second = Gmail per-user
+    limit). Pipelines waiting on the same account are served round-robin,
+    so one large run cannot starve another. With `db_path` the buckets
+    live in SQLite and are shared across processes as well.
+
+    Args:
+        units_per_second: Per-account refill rate
+        db_path: Optional SQLite file for cross-process sharing
+    """
+
+    def __init__(self, units_per_second=DEFAULT_UNITS_PER_SECOND, db_path=None):
+        self.rate = float(units_per_second)
+        self.capacity = self.rate
+        self.db_path = db_path
+        self._buckets = _SQLiteBuckets(db_path) if db_path else _MemoryBuckets()
+        self._cond = threading.Condition()
+        # account -> ordered {pipeline: waiting requests}; head pipeline goes next
+        self._queues = {}
+
+    def lease(self, account, pipeline):
+        """Limiter for `pipeline` drawing on `account`'s budget."""
+        return QuotaLease(self, account, pipeline)
+
+    def acquire(self, account, pipeline, units):
+        """
+        Block until `pipeline` may spend `units` on `account`.
+
+        Returns:
+            Seconds spent waiting
+        """
+        units = min(float(units), self.capacity)
+        started = time.monotonic()
+        with self._cond:
+            queue = self._queues.setdefault(account, {})
+            queue[pipeline] = queue.get(pipeline, 0) + 1
+            try:
+                while True:
+                    if next(iter(queue)) == pipeline:
+                        wait = self._buckets.take(account, units, self.rate, self.capacity)
+                        if wait == 0.0:
+                            break
+                        self._cond.wait(min(wait, 1.0))
+                    else:
+                        self._cond.wait(0.05)
+            finally:
+                queue[pipeline] -= 1
+                count = queue.pop(pipeline)
+                if count:
+                    # Round-robin: this pipeline goes to the back of the line
+                    queue[pipeline] = count
+                if not queue:
+                    self._queues.pop(account, None)
+                self._cond.notify_all()
+        return time.monotonic() - started
+
+    def penalize(self, account, seconds):
+        """Empty an account's bucket so no pipeline calls it for `seconds`."""
+        self._buckets.take(account, 0, self.rate, self.capacity, penalty=seconds)
+
+    def utilization(self):
+        """
+        Current use per account.
+
+        Returns:
+            {account: {"units_last_second", "utilization" (0..1),
+                       "available_units", "total_units", "waiting_pipelines"}}
+        """
+        now = time.time()
+        with self._cond:
+            waiting = {account: len(queue) for account, queue in self._queues.items()}
+        result = {}
+        for account, (tokens, updated, window_start, window_units, total_units) in self._buckets.snapshot().items():
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            recent = window_units if now - window_start < 2.0 else 0.0
+            result[account] = {
+                "units_last_second": round(recent, 1),
+                "utilization": round(min(1.0, recent / self.rate), 3),
+                "available_units": round(max(0.0, tokens), 1),
+                "total_units": round(total_units, 1),
+                "waiting_pipelines": waiting.get(account, 0),
+            }
+        return result
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """
+    The process-wide QuotaManager.
+
+    Set WORKCORTEX_QUOTA_DB to a SQLite path to share quota across
+    processes; WORKCORTEX_QUOTA_UNITS overrides the per-account rate.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            import os
+
+            _manager = QuotaManager(
+                float(os.environ.get("WORKCORTEX_QUOTA_UNITS", DEFAULT_UNITS_PER_SECOND)),
+                os.environ.get("WORKCORTEX_QUOTA_DB") or None,
+            )
+        return _manager
@@ -0,0 +1,351 @@
+"""
+replay.py - Gmail API Record / Replay
+
+Captures the Gmail API traffic of a real run (list pages, message and
+thread metadata, errors, and each call's latency) into a gzip-compressed
+JSON snapshot, and serves it back as a discovery-compatible `service`,
+so fetch strategies, concurrency settings and parsers can be compared
+offline against an identical real-world workload.
+
+Usage:
+    # record while running against the real API
+    context["record_path"] = "snapshot.json.gz"
+
+    # replay at the recorded speed (scale=0.5: twice as fast, 0: no delay)
+    context["replay_path"] = "snapshot.json.gz"
+    context["replay_scale"] = 1.0
+
+Calls are matched on method plus parameters (list pages on their page
+token only, ignoring maxResults); repeated calls (retries)
+replay the recorded outcomes in order, then keep returning the last
+successful response. messages.get and threads.get answers are derived
+from each other when only one was recorded, so a snapshot taken with
+one fetch strategy can replay the other.
+"""
+
+import gzip
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from .fakegmail import _http_error
+from .gmail import _http_status
+from .settings import file_mode
+
+SNAPSHOT_VERSION = 1
+
+
+def call_key(method, params):
+    """
+    Lookup key for a call: method plus its parameters (userId and unset
+    ones dropped). Pages are identified by their token alone, so a
+    replay serves the recorded pages whatever page size it asks for.
+    """
+    dropped = ("userId", "maxResults") if method.endswith(".list") else ("userId",)
+    params = {k: v for k, v in params.items() if v is not None and k not in dropped}
+    return f"{method} {json.dumps(params, sort_keys=True, default=str)}"
+
+
+def load_snapshot(path):
+    """Read a snapshot written by RecordingService.save()."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {snapshot.get('version')} in {path}")
+    return snapshot
+
+
+# --- recording -------------------------------------------------------------
+
+class _RecordedRequest:
+    """Wraps a real request; execute() times it and records the outcome."""
+
+    def __init__(self, recorder, inner, method, params):
+        self._recorder = recorder
+        self.inner = inner
+        self.method = method
+        self.params = params
+        self.methodId = getattr(inner, "methodId", None) or f"gmail.users.{method}"
+
+    def execute(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.inner.execute(*args, **kwargs)
+        except Exception as e:
+            self._recorder._record(self.method, self.params, time.perf_counter() - started,
+                                   error=_http_status(e) or 500, reason=str(e))
+            raise
+        self._recorder._record(self.method, self.params, time.perf_counter() - started, response=response)
+        return response
+
+
+class _RecordedCollection:
+    """Proxy for users().messages() / users().threads()."""
+
+    def __init__(self, recorder, inner, name):
+        self._recorder = recorder
+        self._inner = inner
+        self._name = name
+
+    def list(self, userId="me", **params):
+        return _RecordedRequest(self._recorder, self._inner.list(userId=userId, **params),
+                                f"{self._name}.list", params)
+
+    def list_next(self, previous_request, previous_response):
+        inner = self._inner.list_next(previous_request.inner, previous_response)
+        if inner is None:
+            return None
+        params = dict(previous_request.params, pageToken=previous_response.get("nextPageToken"))
+        return _RecordedRequest(self._recorder, inner, previous_request.method, params)
+
+    def get(self, userId="me", **params):
+        return _RecordedRequest(self._recorder, self._inner.get(userId=userId, **params),
+                                f"{self._name}.get", params)
+
+
+class _RecordedUsers:
+    def __init__(self, recorder):
+        self._recorder = recorder
+        self._inner = recorder.service.users()
+
+    def getProfile(self, userId="me"):
+        return _RecordedRequest(self._recorder, self._inner.getProfile(userId=userId), "users.getProfile", {})
+
+    def messages(self):
+        return _RecordedCollection(self._recorder, self._inner.messages(), "messages")
+
+    def threads(self):
+        return _RecordedCollection(self._recorder, self._inner.threads(), "threads")
+
+
+class RecordingService:
+    """
+    Pass-through wrapper around a Gmail service that records every call.
+
+    Call save(path) when done. Recording is thread-safe; use fork() to
+    record through one service per thread when the wrapped service is
+    not.
+
+    Args:
+        service: Real (or fake) Gmail service to wrap
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def thread_safe(self):
+        return getattr(self.service, "thread_safe", False)
+
+    def fork(self, service):
+        """Recorder for another service that writes to this recorder's snapshot."""
+        other = RecordingService(service)
+        other.calls = self.calls
+        other._lock = self._lock
+        return other
+
+    def users(self):
+        return _RecordedUsers(self)
+
+    def _record(self, method, params, latency, response=None, error=None, reason=None):
+        outcome = {"latency": round(latency, 6)}
+        if error is not None:
+            outcome["error"] = error
+            outcome["reason"] = reason
+        else:
+            outcome["response"] = response
+        with self._lock:
+            self.calls.setdefault(call_key(method, params), []).append(outcome)
+
+    def save(self, path):
+        """
+        Write the snapshot (gzip JSON, written atomically).
+
+        Returns:
+            Number of calls recorded
+        """
+        with self._lock:
+            count = sum(len(outcomes) for outcomes in self.calls.values())
+            snapshot = {
+                "version": SNAPSHOT_VERSION,
+                "recorded_at": time.time(),
+                "source": type(self.service).__name__,
+                "call_count": count,
+                "calls": self.calls,
+            }
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                f.write(json.dumps(snapshot, separators=(",", ":")).encode("utf-8"))
+            os.chmod(tmp, file_mode(path))
+            os.replace(tmp, path)
+            return count
+
+
+# --- replay ----------------------------------------------------------------
+
+class _ReplayRequest:
+    def __init__(self, service, method, params):
+        self._service = service
+        self.method = method
+        self.params = params
+        self.methodId = f"gmail.users.{method}"
+
+    def execute(self, *args, **kwargs):
+        return self._service._replay(self.method, self.params)
+
+
+class _ReplayCollection:
+    def __init__(self, service, name):
+        self._service = service
+        self._name = name
+
+    def list(self, userId="me", **params):
+        return _ReplayRequest(self._service, f"{self._name}.list", params)
+
+    def list_next(self, previous_request, previous_response):
+        token = previous_response.get("nextPageToken")
+        if not token:
+            return None
+        return _ReplayRequest(self._service, previous_request.method, dict(previous_request.params, pageToken=token))
+
+    def get(self, userId="me", **params):
+        return _ReplayRequest(self._service, f"{self._name}.get", params)
+
+
+class _ReplayUsers:
+    def __init__(self, service):
+        self._service = service
+
+    def getProfile(self, userId="me"):
+        return _ReplayRequest(self._service, "users.getProfile", {})
+
+    def messages(self):
+        return _ReplayCollection(self._service, "messages")
+
+    def threads(self):
+        return _ReplayCollection(self._service, "threads")
+
+
+class ReplayService:
+    """
+    Serves a recorded snapshot as a Gmail service. Thread-safe.
+
+    Args:
+        snapshot: Snapshot path (or an already loaded snapshot dict)
+        scale: Multiplier on recorded latencies (1.0 original timing,
+               0 no delay)
+        strict: Raise 404 for calls not in the snapshot instead of
+                deriving them (messages.get <-> threads.get)
+
+    `calls` counts replayed calls per method, `errors` replayed errors,
+    `derived` answers built from the other get method and `missing`
+    calls the snapshot could not answer.
+    """
+
+    thread_safe = True
+    is_replay = True
+
+    def __init__(self, snapshot, scale=1.0, strict=False):
+        if not isinstance(snapshot, dict):
+            snapshot = load_snapshot(snapshot)
+        self.snapshot = snapshot
+        self.scale = float(scale)
+        self.strict = strict
+        self.calls = {}
+        self.errors = {}
+        self.derived = 0
+        self.missing = 0
+        self._outcomes = snapshot["calls"]
+        self._cursor = {}
+        self._lock = threading.Lock()
+        self._index = None
+
+    def users(self):
+        return _ReplayUsers(self)
+
+    def senders(self):
+        """Senders whose `from:` listing was recorded."""
+        found = []
+        for key in self._outcomes:
+            method, _, params = key.partition(" ")
+            query = json.loads(params).get("q") or ""
+            if method == "messages.list" and query.startswith("from:"):
+                found.append(query[5:].strip())
+        return list(dict.fromkeys(found))
+
+    def _replay(self, method, params):
+        key = call_key(method, params)
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            outcomes = self._outcomes.get(key)
+            if outcomes:
+                position = self._cursor.get(key, 0)
+                self._cursor[key] = position + 1
+                if position < len(outcomes):
+                    outcome = outcomes[position]
+                else:
+                    # Past the recorded sequence: keep answering with the last success
+                    outcome = next((o for o in reversed(outcomes) if "response" in o), outcomes[-1])
+            else:
+                outcome = None if self.strict else self._derive(method, params)
+                if outcome is None:
+                    self.missing += 1
+                else:
+                    self.derived += 1
+            if outcome is not None and "error" in outcome:
+                self.errors[outcome["error"]] = self.errors.get(outcome["error"], 0) + 1
+        if outcome is None:
+            raise _http_error(404, f"notFound (not in snapshot: {key})")
+        if self.scale and outcome.get("latency"):
+            time.sleep(outcome["latency"] * self.scale)
+        if "error" in outcome:
+            raise _http_error(outcome["error"], outcome.get("reason") or "recorded error")
+        return outcome["response"]
+
+    def _build_index(self):
+        """Message resources by id, thread membership and median latency per method."""
+        messages, threads, latencies = {}, {}, {}
+        for key, outcomes in self._outcomes.items():
+            method = key.split(" ", 1)[0]
+            latencies.setdefault(method, []).extend(o["latency"] for o in outcomes if "response" in o)
+            for outcome in outcomes:
+                response = outcome.get("response")
+                if not response:
+                    continue
+                if method == "messages.get":
+                    messages[response.get("id")] = response
+                elif method == "threads.get":
+                    for message in response.get("messages", []):
+                        messages[message.get("id")] = message
+                        threads.setdefault(response.get("id"), []).append(message.get("id"))
+                elif method == "messages.list":
+                    for ref in response.get("messages", []):
+                        threads.setdefault(ref.get("threadId", ref.get("id")), []).append(ref.get("id"))
+        medians = {m: statistics.median(v) for m, v in latencies.items() if v}
+        threads = {t: list(dict.fromkeys(ids)) for t, ids in threads.items()}
+        return messages, threads, medians
+
+    def _derive(self, method, params):
+        """An outcome for an unrecorded get, built from the other get method's responses."""
+        if method not in ("messages.get", "threads.get"):
+            return None
+        if self._index is None:
+            self._index = self._build_index()
+        messages, threads, medians = self._index
+        other = "threads.get" if method == "messages.get" else "messages.get"
+        latency = medians.get(method, medians.get(other, 0.0))
+        wanted = params.get("id")
+        if method == "messages.get":
+            message = messages.get(wanted)
+            return {"latency": latency, "response": message} if message else None
+        members = [messages[m] for m in threads.get(wanted, []) if m in messages]
+        if not members:
+            return None
+        return {"latency": latency, "response": {"id": wanted, "messages": members}}
@@ -0,0 +1,182 @@
+"""
+results.py - Indexed Results Store
+
+Each export also writes its recipients to a local SQLite database keyed
+by run id, indexed by address, domain and count, so a result of any size
+can be browsed a page at a time (prefix/domain search, sorting) without
+loading the output file.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .settings import data_dir
+from .store import as_table
+
+# Sort keys accepted by page() -> ORDER BY clause
+SORTS = {
+    "email": "email",
+    "domain": "domain, email",
+    "count": "count, email",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    sender TEXT,
+    output_path TEXT,
+    created REAL,
+    recipient_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS recipients (
+    run_id TEXT NOT NULL,
+    email TEXT NOT NULL COLLATE NOCASE,
+    domain TEXT NOT NULL COLLATE NOCASE,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (run_id, email)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS recipients_domain ON recipients (run_id, domain, email);
+CREATE INDEX IF NOT EXISTS recipients_count ON recipients (run_id, count, email);
+"""
+
+
+def new_run_id():
+    """Short unique id for a pipeline run."""
+    return uuid.uuid4().hex[:12]
+
+
+def default_path():
+    """Location of the results database (under WORKCORTEX_HOME)."""
+    return os.path.join(data_dir(), "results.db")
+
+
+class ResultStore:
+    """
+    SQLite-backed recipients per run. One connection, serialized by a
+    lock, so an instance can be shared across threads (e.g. Streamlit's
+    script runs).
+
+    Args:
+        path: Database file (default: default_path())
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def save(self, run_id, table, sender=None, output_path=None):
+        """
+        Replace the recipients stored for `run_id`.
+
+        Args:
+            run_id: Run identifier
+            table: RecipientTable (or list of addresses)
+            sender, output_path: Recorded with the run
+
+        Returns:
+            Number of rows written
+        """
+        table = as_table(table)
+        counts = table.counts
+        rows = (
+            (run_id, table.address(row), table.domain(row), counts[row])
+            for row in range(len(table))
+        )
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM recipients WHERE run_id = ?", (run_id,))
+            self._conn.executemany("INSERT OR REPLACE INTO recipients VALUES (?, ?, ?, ?)", rows)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?)",
+                (run_id, sender, output_path, time.time(), len(table))
+            )
+        return len(table)
+
+    def runs(self, limit=20):
+        """Most recent runs as dicts."""
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT run_id, sender, output_path, created, recipient_count FROM runs"
+                " ORDER BY created DESC LIMIT ?", (limit,)
+            )
+            columns = [c[0] for c in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def domains(self, run_id, limit=200):
+        """[(domain, recipients)] for a run, most common first."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT domain, COUNT(*) AS n FROM recipients WHERE run_id = ?"
+                " GROUP BY domain ORDER BY n DESC, domain LIMIT ?", (run_id, limit)
+            ).fetchall()
+
+    def page(self, run_id, offset=0, limit=50, prefix=None, domain=None, sort="email", descending=False):
+        """
+        One page of a run's recipients.
+
+        Args:
+            run_id: Run identifier
+            offset, limit: Page window
+            prefix: Only addresses starting with this (case-insensitive)
+            domain: Only this domain (case-insensitive)
+            sort: "email", "domain" or "count"
+            descending: Reverse the sort
+
+        Returns:
+            (rows, total) - rows are (email, domain, count) tuples, total
+            is the number of matching recipients
+        """
+        if sort not in SORTS:
+            raise ValueError(f"sort must be one of {sorted(SORTS)}")
+        where = ["run_id = ?"]
+        params = [run_id]
+        if prefix:
+            # Range scan on the (run_id, email) primary key
+            where.append("email >= ? AND email < ?")
+            params += [prefix, prefix + "\U0010ffff"]
+        if domain:
+            where.append("domain = ?")
+            params.append(domain)
+        clause = " AND ".join(where)
+        order = ", ".join(f"{col} {'DESC' if descending else 'ASC'}" for col in SORTS[sort].split(", "))
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM recipients WHERE {clause}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT email, domain, count FROM recipients WHERE {clause} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [int(limit), int(offset)]
+            ).fetchall()
+        return rows, total
+
+    def delete(self, run_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM recipients WHERE run_id = ?", (run_id,))
+            self._conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+
+def save_results(context):
+    """
+    Index the exported recipients for browsing.
+
+    Args:
+        context: Execution context
+            Must contain: emails
+            Optional: run_id (generated if missing), sender, excel_path,
+                      results_db (database path)
+            Will populate: results_run_id
+    """
+    run_id = context.setdefault("run_id", new_run_id())
+    store = ResultStore(context.get("results_db"))
+    try:
+        store.save(run_id, context.get("emails", []), context.get("sender"), context.get("excel_path"))
+    finally:
+        store.close()
+    context["results_run_id"] = run_id
@@ -0,0 +1,57 @@
+"""
+settings.py - Local Paths
+
+Where the pipeline keeps run summaries, caches and other local state.
+Override the root with the WORKCORTEX_HOME environment variable.
+"""
+
+import os
+import stat
+
+# Read once: os.umask() can only be queried by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def data_dir(*parts):
+    """
+    Return (and create) a directory under the WorkCortex data root.
+
+    Args:
+        *parts: Optional sub-directory components
+
+    Returns:
+        Absolute directory path
+    """
+    root = os.environ.get("WORKCORTEX_HOME", os.path.join(os.path.expanduser("~"), ".workcortex"))
+    path = os.path.abspath(os.path.join(root, *parts))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_dir(*parts):
+    """Directory for cached data that is safe to delete."""
+    return data_dir("cache", *parts)
+
+
+def last_run_path():
+    """Default location of the JSON summary of the most recent CLI run."""
+    return os.path.join(data_dir("runs"), "last_run.json")
+
+
+def file_mode(path):
+    """
+    Permission bits for a file replaced atomically at `path`.
+
+    mkstemp() temp files are 0600; outputs should get the mode the file
+    already has, else what open() would create (0666 minus the umask).
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def log_dir(*parts):
+    """Directory for rotating event/log files (see sink.py)."""
+    return data_dir("logs", *parts)
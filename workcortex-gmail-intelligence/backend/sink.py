@@ -0,0 +1,183 @@
+"""
+sink.py - Event and Log Sink
+
+Append-only JSONL file for events and log records, written by a
+background thread so that emitting stays cheap on the hot path: callers
+only enqueue a dict, and the writer serializes and writes whole batches
+at once. The file rotates by size or age, and rotated segments are
+gzip-compressed and pruned to a fixed count.
+
+Usage:
+    sink = EventSink(log_dir("events.jsonl"))
+    add_sink(sink)                 # every emit() is also written here
+    logger.addHandler(SinkLogHandler(sink))
+    ...
+    sink.close()                   # flush and stop the writer
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+# Sentinel that tells the writer thread to flush and exit
+_STOP = object()
+
+
+class EventSink:
+    """
+    Batched, rotating JSONL writer.
+
+    Args:
+        path: Active log file (rotated segments are written next to it)
+        max_bytes: Rotate when the active file reaches this size
+        max_age: Rotate when the active file's first record is older than
+                 this (seconds), even across processes appending to it
+        batch_size: Most records written per batch
+        flush_interval: Longest a record waits before being written (seconds)
+        compress: gzip rotated segments
+        keep: Number of rotated segments to keep
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, max_age=24 * 3600,
+                 batch_size=500, flush_interval=1.0, compress=True, keep=10):
+        self.path = os.path.abspath(path)
+        self.max_bytes = int(max_bytes)
+        self.max_age = float(max_age)
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval)
+        self.compress = compress
+        self.keep = int(keep)
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._opened = 0.0
+        self._thread = threading.Thread(target=self._run, name="workcortex-sink", daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        """Queue a record (dict) for writing; never blocks on I/O."""
+        self._queue.put(record)
+
+    def close(self, timeout=5.0):
+        """Flush pending records and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- writer thread -------------------------------------------------
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = None
+            deadline = time.monotonic() + self.flush_interval
+            while record is not None:
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+                if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                    break
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    record = None
+            if batch:
+                self._write(batch)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(json.dumps(record, default=str, separators=(",", ":")))
+            except (TypeError, ValueError):
+                self.dropped += 1
+        try:
+            self._maybe_rotate()
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+            self.written += len(lines)
+        except OSError:
+            # A full disk or removed directory must not take the pipeline down
+            self.dropped += len(lines)
+
+    def _maybe_rotate(self):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._opened = self._segment_start() if self._file.tell() else time.time()
+        if self._file.tell() < self.max_bytes and time.time() - self._opened < self.max_age:
+            return
+        self._file.close()
+        self.rotations += 1
+        stem, ext = os.path.splitext(self.path)
+        rotated = f"{stem}.{time.strftime('%Y%m%d-%H%M%S')}-{self.rotations}{ext}"
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self._prune(stem, ext)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened = time.time()
+
+    def _segment_start(self):
+        """
+        When the existing active file was started: its first record's "ts".
+        (The mtime is the last write, so short runs appending to the file
+        would keep it from ever aging out.)
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return float(json.loads(f.readline())["ts"])
+        except (OSError, ValueError, KeyError, TypeError):
+            stat = os.stat(self.path)
+            return getattr(stat, "st_birthtime", stat.st_mtime)
+
+    def _prune(self, stem, ext):
+        segments = sorted(glob.glob(f"{glob.escape(stem)}.*{ext}*"), key=os.path.getmtime)
+        segments = [s for s in segments if s != self.path]
+        for old in segments[:max(0, len(segments) - self.keep)]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+class SinkLogHandler(logging.Handler):
+    """Logging handler that forwards records to an EventSink (no file I/O on the caller)."""
+
+    def __init__(self, sink, level=logging.NOTSET):
+        super().__init__(level)
+        self.sink = sink
+
+    def emit(self, record):
+        self.sink.put({
+            "ts": record.created,
+            "kind": "log",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        })
@@ -0,0 +1,217 @@
+"""
+sketch.py - Streaming Sketches
+
+Fixed-memory approximate counters used where exact sets would grow with
+the mailbox: HyperLogLog for distinct counts, Count-Min for per-item
+frequencies and Space-Saving for the most frequent items (heavy hitters).
+"""
+
+import hashlib
+import heapq
+import math
+from array import array
+
+
+def hash64(value):
+    """Stable 64-bit hash of a string (unlike hash(), same across processes)."""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Approximate distinct counter (Flajolet et al., with the small-range
+    linear counting correction).
+
+    Memory is 2**precision one-byte registers regardless of how many
+    values are added; relative standard error is 1.04 / sqrt(2**precision)
+    (about 1.6% at the default precision of 12).
+
+    Args:
+        precision: Number of index bits (4..16)
+    """
+
+    def __init__(self, precision=12):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+        if self.m >= 128:
+            self.alpha = 0.7213 / (1 + 1.079 / self.m)
+        else:
+            self.alpha = {16: 0.673, 32: 0.697, 64: 0.709}[self.m]
+
+    def add(self, value):
+        """Add a string value."""
+        x = hash64(value)
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        """Add every value from an iterable."""
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        """Fold another sketch (same precision) into this one."""
+        if other.p != self.p:
+            raise ValueError("cannot merge sketches with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self):
+        """Estimated number of distinct values added."""
+        estimate = self.alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return estimate
+
+    @property
+    def relative_error(self):
+        """Relative standard error of count()."""
+        return 1.04 / math.sqrt(self.m)
+
+    def bounds(self, z=1.96):
+        """
+        Confidence interval for count().
+
+        Args:
+            z: Standard normal quantile (1.96 -> ~95%)
+
+        Returns:
+            (low, estimate, high)
+        """
+        estimate = self.count()
+        spread = z * self.relative_error * estimate
+        return max(0.0, estimate - spread), estimate, estimate + spread
+
+
+class CountMinSketch:
+    """
+    Approximate frequency counter (Cormode & Muthukrishnan).
+
+    estimate() never undercounts; it overcounts by at most
+    e / width * total with probability 1 - exp(-depth).
+
+    Args:
+        width: Counters per row
+        depth: Rows (independent hash functions)
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = int(width)
+        self.depth = int(depth)
+        self.rows = [array("Q", bytes(8 * self.width)) for _ in range(self.depth)]
+        self.total = 0
+
+    def _indexes(self, value):
+        # Double hashing: row i uses h1 + i * h2
+        x = hash64(value)
+        h1, h2 = x & 0xFFFFFFFF, (x >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, value, count=1):
+        """Add `count` occurrences of a string value; returns its new estimate."""
+        self.total += count
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(value)):
+            row[index] += count
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        return estimate
+
+    def estimate(self, value):
+        """Estimated occurrences of a value (an upper bound)."""
+        return min(row[index] for row, index in zip(self.rows, self._indexes(value)))
+
+    def merge(self, other):
+        """Fold another sketch (same width and depth) into this one."""
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("cannot merge sketches with different dimensions")
+        for row, other_row in zip(self.rows, other.rows):
+            for i, count in enumerate(other_row):
+                if count:
+                    row[i] += count
+        self.total += other.total
+
+    @property
+    def error_bound(self):
+        """Maximum overcount of estimate() (with probability 1 - exp(-depth))."""
+        return math.e / self.width * self.total
+
+
+class SpaceSaving:
+    """
+    Top-k frequent items in fixed memory (Metwally et al.).
+
+    Keeps `capacity` counters; an unseen item replaces the smallest one
+    and inherits its count as error. Every item with true frequency above
+    total / capacity is guaranteed to be tracked, and each tracked count
+    overestimates by at most its recorded error.
+
+    Args:
+        capacity: Counters kept (use a few times the k you report)
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = int(capacity)
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []
+
+    def add(self, value, count=1):
+        """Add `count` occurrences of a value."""
+        self.total += count
+        counts = self.counts
+        if value in counts:
+            counts[value] += count
+        elif len(counts) < self.capacity:
+            counts[value] = count
+            self.errors[value] = 0
+        else:
+            floor, victim = self._pop_min()
+            del counts[victim], self.errors[victim]
+            counts[value] = floor + count
+            self.errors[value] = floor
+        heapq.heappush(self._heap, (counts[value], value))
+        if len(self._heap) > 4 * self.capacity:
+            # Drop stale heap entries
+            self._heap = [(c, v) for v, c in counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        """(count, value) of the smallest tracked counter (lazy heap)."""
+        while True:
+            count, value = heapq.heappop(self._heap)
+            if self.counts.get(value) == count:
+                return count, value
+
+    def merge(self, other):
+        """Fold another summary into this one (counts and errors add up)."""
+        combined = {}
+        floor_self = min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+        floor_other = min(other.counts.values()) if len(other.counts) >= other.capacity else 0
+        for value in set(self.counts) | set(other.counts):
+            count = self.counts.get(value, floor_self) + other.counts.get(value, floor_other)
+            error = self.errors.get(value, floor_self) + other.errors.get(value, floor_other)
+            combined[value] = (count, error)
+        kept = sorted(combined.items(), key=lambda item: item[1][0], reverse=True)[:self.capacity]
+        self.counts = {value: count for value, (count, _error) in kept}
+        self.errors = {value: error for value, (_count, error) in kept}
+        self.total += other.total
+        self._heap = [(c, v) for v, c in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, k):
+        """
+        The k most frequent tracked items.
+
+        Returns:
+            List of (value, count, error), most frequent first; the true
+            count lies in [count - error, count]
+        """
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(value, count, self.errors[value]) for value, count in ranked]
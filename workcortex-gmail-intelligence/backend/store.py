@@ -0,0 +1,375 @@
+"""
+store.py - Compact Recipient Store
+
+Deduplicated, array-backed recipient table shared by all pipeline stages
+instead of copying lists of address strings between them.
+"""
+
+from array import array
+
+
+class RecipientTable:
+    """
+    Deduplicated recipient addresses stored as integer columns.
+
+    Local parts and domains are interned once into pools; each recipient
+    row is a (local_id, domain_id) pair held in `array('I')` columns plus
+    an occurrence count. Inserting an address that is already present
+    only bumps its count, so dedup happens once, on insert.
+
+    Tables produced by `select()` share the intern pools of their parent,
+    so filtering stages only copy integer ids, never strings. The
+    address -> row index is built lazily, so derived tables that are
+    only read never pay for it.
+
+    `share()` exports the columns and pools to shared memory so a
+    process-pool step (see ml.normalize_table) can `attach()` the table
+    without pickling it.
+
+    Iterating a table yields address strings, and `len()` is the number
+    of unique recipients, so code written for a list of emails keeps working.
+    """
+
+    __slots__ = (
+        "_local_pool", "_local_ids", "_domain_pool", "_domain_ids",
+        "local_col", "domain_col", "counts", "_index"
+    )
+
+    def __init__(self, emails=None, _pools=None):
+        """
+        Create a table.
+
+        Args:
+            emails: Optional iterable of addresses to insert
+        """
+        if _pools is None:
+            _pools = ([], {}, [], {})
+        self._local_pool, self._local_ids, self._domain_pool, self._domain_ids = _pools
+        self.local_col = array("I")
+        self.domain_col = array("I")
+        self.counts = array("I")
+        self._index = {}
+        if emails is not None:
+            self.extend(emails)
+
+    # --- interning -------------------------------------------------------
+
+    @staticmethod
+    def _intern(value, pool, ids):
+        key = ids.get(value)
+        if key is None:
+            key = len(pool)
+            ids[value] = key
+            pool.append(value)
+        return key
+
+    @staticmethod
+    def _split(address):
+        local, sep, domain = address.rpartition("@")
+        if not sep:
+            return address, ""
+        return local, domain
+
+    # --- insert ----------------------------------------------------------
+
+    def add(self, address, count=1):
+        """
+        Insert an address (or bump its count if already present).
+
+        Args:
+            address: Email address string
+            count: Occurrences to add
+
+        Returns:
+            Row id of the address
+        """
+        local, domain = self._split(address)
+        local_id = self._intern(local, self._local_pool, self._local_ids)
+        domain_id = self._intern(domain, self._domain_pool, self._domain_ids)
+        return self._add_ids(local_id, domain_id, count)
+
+    def _row_index(self):
+        if self._index is None:
+            self._index = {
+                (domain_id << 32) | local_id: row
+                for row, (local_id, domain_id) in enumerate(zip(self.local_col, self.domain_col))
+            }
+        return self._index
+
+    def _add_ids(self, local_id, domain_id, count):
+        key = (domain_id << 32) | local_id
+        index = self._row_index()
+        row = index.get(key)
+        if row is None:
+            row = len(self.local_col)
+            index[key] = row
+            self.local_col.append(local_id)
+            self.domain_col.append(domain_id)
+            self.counts.append(count)
+        else:
+            self.counts[row] += count
+        return row
+
+    def extend(self, emails):
+        """Insert every address from an iterable."""
+        for address in emails:
+            self.add(address)
+
+    def merge(self, other):
+        """
+        Add every row of another table (summing counts).
+
+        Args:
+            other: RecipientTable (may use different intern pools)
+        """
+        if other._local_pool is self._local_pool and other._domain_pool is self._domain_pool:
+            for local_id, domain_id, count in zip(other.local_col, other.domain_col, other.counts):
+                self._add_ids(local_id, domain_id, count)
+            return
+        for row in range(len(other)):
+            self.add(other.address(row), other.counts[row])
+
+    # --- read ------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.local_col)
+
+    def __iter__(self):
+        local_pool, domain_pool = self._local_pool, self._domain_pool
+        for local_id, domain_id in zip(self.local_col, self.domain_col):
+            yield self._join(local_pool[local_id], domain_pool[domain_id])
+
+    def __contains__(self, address):
+        local, domain = self._split(address)
+        local_id = self._local_ids.get(local)
+        domain_id = self._domain_ids.get(domain)
+        if local_id is None or domain_id is None:
+            return False
+        return ((domain_id << 32) | local_id) in self._row_index()
+
+    @staticmethod
+    def _join(local, domain):
+        return f"{local}@{domain}" if domain else local
+
+    def address(self, row):
+        """Address string for a row id."""
+        return self._join(
+            self._local_pool[self.local_col[row]],
+            self._domain_pool[self.domain_col[row]]
+        )
+
+    def local_part(self, row):
+        """Local part (before @) for a row id."""
+        return self._local_pool[self.local_col[row]]
+
+    def domain(self, row):
+        """Domain for a row id."""
+        return self._domain_pool[self.domain_col[row]]
+
+    def domain_ids(self):
+        """Set of domain ids present in this table."""
+        return set(self.domain_col)
+
+    def domain_name(self, domain_id):
+        """Domain string for an interned domain id."""
+        return self._domain_pool[domain_id]
+
+    def local_name(self, local_id):
+        """Local part string for an interned local id."""
+        return self._local_pool[local_id]
+
+    @property
+    def total(self):
+        """Total occurrences inserted (including duplicates)."""
+        return sum(self.counts)
+
+    def sorted_addresses(self):
+        """All unique addresses as a sorted list."""
+        return sorted(self)
+
+    # --- derive ----------------------------------------------------------
+
+    def select(self, rows):
+        """
+        Build a table holding only the given rows.
+
+        The result shares this table's intern pools; only integer
+        columns are copied (its row index is built on first use).
+
+        Args:
+            rows: Iterable of distinct row ids
+
+        Returns:
+            New RecipientTable
+        """
+        rows = list(rows)
+        local_col, domain_col, counts = self.local_col, self.domain_col, self.counts
+        subset = RecipientTable(_pools=self._pools())
+        subset.local_col = array("I", [local_col[row] for row in rows])
+        subset.domain_col = array("I", [domain_col[row] for row in rows])
+        subset.counts = array("I", [counts[row] for row in rows])
+        subset._index = None
+        return subset
+
+    def exclude(self, address):
+        """
+        Table without `address` (compared case-insensitively).
+
+        Returns self unchanged when the address is not present.
+        """
+        local, domain = self._split(address.lower())
+        # Match through the (small) pools, then by id over the columns
+        domains = {i for i, name in enumerate(self._domain_pool) if name.lower() == domain}
+        locals_ = {i for i, name in enumerate(self._local_pool) if name.lower() == local}
+        if not domains or not locals_:
+            return self
+        drop = {
+            row for row, (local_id, domain_id) in enumerate(zip(self.local_col, self.domain_col))
+            if domain_id in domains and local_id in locals_
+        }
+        if not drop:
+            return self
+        return self.select(row for row in range(len(self)) if row not in drop)
+
+    def select_domains(self, domain_ids):
+        """Table holding only rows whose domain id is in `domain_ids`."""
+        domain_ids = set(domain_ids)
+        return self.select(
+            row for row, domain_id in enumerate(self.domain_col) if domain_id in domain_ids
+        )
+
+    def _pools(self):
+        return (self._local_pool, self._local_ids, self._domain_pool, self._domain_ids)
+
+    # --- shared memory ---------------------------------------------------
+
+    def share(self):
+        """
+        Copy the table into one shared-memory block for a process-pool step.
+
+        The block holds the three integer columns followed by the
+        NUL-joined local and domain pools. Only pool entries this table
+        references are exported (a select() result shares its parent's
+        full pools), so ids in the attached copy are renumbered. The
+        caller owns the block and must `unlink()` the handle once the
+        workers are done.
+
+        Returns:
+            SharedRecipients handle (picklable; pass it to the workers)
+        """
+        from multiprocessing import shared_memory
+
+        local_col, local_pool = _compact(self.local_col, self._local_pool)
+        domain_col, domain_pool = _compact(self.domain_col, self._domain_pool)
+        local_bytes = "\0".join(local_pool).encode("utf-8")
+        domain_bytes = "\0".join(domain_pool).encode("utf-8")
+        column_bytes = len(self) * self.counts.itemsize
+        size = 3 * column_bytes + len(local_bytes) + len(domain_bytes)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        offset = 0
+        for chunk in (local_col, domain_col, self.counts):
+            shm.buf[offset:offset + column_bytes] = memoryview(chunk).cast("B")
+            offset += column_bytes
+        shm.buf[offset:offset + len(local_bytes)] = local_bytes
+        offset += len(local_bytes)
+        shm.buf[offset:offset + len(domain_bytes)] = domain_bytes
+        layout = (len(self), len(local_pool), len(local_bytes),
+                  len(domain_pool), len(domain_bytes))
+        return SharedRecipients(shm.name, layout, shm)
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Read-only view of a shared table (see share()).
+
+        The columns are memoryviews over the shared block, not copies;
+        only the pool strings are decoded. Use select() (or merge() into
+        a new table) to get a table that can be added to.
+
+        Args:
+            handle: SharedRecipients from share()
+        """
+        rows, local_count, local_bytes, domain_count, domain_bytes = handle.layout
+        buf = handle.open().buf
+        column_bytes = rows * array("I").itemsize
+        local_pool = _split_pool(buf, 3 * column_bytes, local_bytes, local_count)
+        domain_pool = _split_pool(buf, 3 * column_bytes + local_bytes, domain_bytes, domain_count)
+        table = cls(_pools=(
+            local_pool, {name: i for i, name in enumerate(local_pool)},
+            domain_pool, {name: i for i, name in enumerate(domain_pool)},
+        ))
+        table.local_col = buf[:column_bytes].cast("I")
+        table.domain_col = buf[column_bytes:2 * column_bytes].cast("I")
+        table.counts = buf[2 * column_bytes:3 * column_bytes].cast("I")
+        table._index = None
+        return table
+
+
+class SharedRecipients:
+    """
+    Picklable handle to a RecipientTable in shared memory.
+
+    Args:
+        name: Shared memory block name
+        layout: (rows, local pool size, local pool bytes,
+                 domain pool size, domain pool bytes)
+        shm: The creating process's SharedMemory (owner side only)
+    """
+
+    def __init__(self, name, layout, shm=None):
+        self.name = name
+        self.layout = layout
+        self._shm = shm
+
+    def __reduce__(self):
+        return (SharedRecipients, (self.name, self.layout))
+
+    def open(self):
+        """This process's mapping of the block (opened once)."""
+        if self._shm is None:
+            from multiprocessing import shared_memory
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        return self._shm
+
+    def close(self):
+        """
+        Unmap the block in this process. Drop tables attached from it
+        first (their columns still point into the block).
+        """
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self):
+        """Close and free the block (owner, after every worker is done)."""
+        shm = self.open()
+        self._shm = None
+        shm.close()
+        shm.unlink()
+
+
+def _compact(column, pool):
+    """(column renumbered to the ids it uses, pool of just those entries)."""
+    used = sorted(set(column))
+    if len(used) == len(pool):
+        return column, pool
+    remap = {old: new for new, old in enumerate(used)}
+    return array("I", [remap[i] for i in column]), [pool[i] for i in used]
+
+
+def _split_pool(buf, offset, size, count):
+    if not count:
+        return []
+    return bytes(buf[offset:offset + size]).decode("utf-8").split("\0")
+
+
+def as_table(emails):
+    """
+    Return `emails` as a RecipientTable (no copy if it already is one).
+
+    Args:
+        emails: RecipientTable or iterable of address strings
+    """
+    if isinstance(emails, RecipientTable):
+        return emails
+    return RecipientTable(emails or [])
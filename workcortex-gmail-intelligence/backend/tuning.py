@@ -0,0 +1,229 @@
+"""
+tuning.py - Adaptive Fetch Tuning
+
+Chooses the fetch concurrency (parallel messages.get / threads.get
+calls) and listing page size (maxResults) while a fetch runs, from the
+latency, error/429 rate and quota waits of the requests it observes:
+
+- concurrency is AIMD: +1 after each window of clean, fast calls,
+  halved on a 429/5xx or when latency inflates past `latency_factor`
+  times the best seen, and held (or stepped down) while calls mostly
+  wait on the quota limiter, since more threads cannot add headroom.
+- page size doubles while list pages come back quickly and halves when
+  they are slow or fail.
+
+The settled values are saved per account (cache dir) and used as the
+starting point of the next run. Step-downs made only because the quota
+was the bottleneck are not saved (the next run may have the bucket to
+itself), and a saved concurrency never starts a run below
+DEFAULT_CONCURRENCY.
+"""
+
+import hashlib
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from .settings import cache_dir
+
+# Starting concurrency without saved settings (also the floor for saved ones)
+DEFAULT_CONCURRENCY = 4
+
+# Gmail list limits (default page size and the API maximum)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Methods whose calls drive the concurrency controller
+_FETCH_METHODS = ("messages.get", "threads.get")
+_LIST_METHODS = ("messages.list", "threads.list")
+
+_THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Adjustments kept in FetchTuner.history
+_HISTORY_LIMIT = 100
+
+
+def _settings_path(account):
+    digest = hashlib.sha1((account or "default").lower().encode()).hexdigest()[:16]
+    return os.path.join(cache_dir("tuning"), f"{digest}.json")
+
+
+def load_tuning(account):
+    """Saved {concurrency, page_size, ...} for an account, or {} if none."""
+    try:
+        with open(_settings_path(account)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_tuning(account, settings):
+    """Persist an account's tuned settings (written atomically)."""
+    path = _settings_path(account)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(dict(settings, account=account, updated=time.time()), f)
+    os.replace(tmp, path)
+
+
+class FetchTuner:
+    """
+    Thread-safe AIMD controller for one account's fetch.
+
+    Args:
+        concurrency: Starting concurrency
+        page_size: Starting list page size
+        min_concurrency, max_concurrency: Concurrency bounds
+        min_page_size, max_page_size: Page size bounds
+        window: Fetch calls per concurrency decision
+        latency_factor: Latency inflation (vs. the best window) treated as overload
+        page_latency: Target seconds per list page
+        adapt_page_size: False to keep page_size fixed (e.g. when replaying)
+
+    Read `concurrency` / `page_size` for the current values.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, page_size=DEFAULT_PAGE_SIZE, min_concurrency=1, max_concurrency=16,
+                 min_page_size=50, max_page_size=MAX_PAGE_SIZE, window=20, latency_factor=2.0,
+                 page_latency=1.0, adapt_page_size=True):
+        self.min_concurrency = max(1, int(min_concurrency))
+        self.max_concurrency = max(self.min_concurrency, int(max_concurrency))
+        self.min_page_size = int(min_page_size)
+        self.max_page_size = min(int(max_page_size), MAX_PAGE_SIZE)
+        self.concurrency = min(max(int(concurrency), self.min_concurrency), self.max_concurrency)
+        self.page_size = min(max(int(page_size), self.min_page_size), self.max_page_size)
+        # Concurrency as last set by a latency/error decision (what is saved)
+        self.unbound_concurrency = self.concurrency
+        self.window = int(window)
+        self.latency_factor = float(latency_factor)
+        self.page_latency = float(page_latency)
+        self.adapt_page_size = adapt_page_size
+        self.history = []
+        self.adjustments = 0
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._waits = []
+        self._errors = 0
+        self._since_decrease = 0
+        self._baseline = None
+        self._observed = 0
+        self._failed = 0
+        self._all_latencies = []
+        self._started = time.monotonic()
+
+    @classmethod
+    def for_account(cls, account, resume=True, **kwargs):
+        """
+        Tuner starting from the account's saved settings (kwargs win);
+        resume=False starts from the defaults.
+        """
+        saved = load_tuning(account) if resume else {}
+        start = {k: saved[k] for k in ("concurrency", "page_size") if k in saved}
+        if "concurrency" in start:
+            start["concurrency"] = max(int(start["concurrency"]), DEFAULT_CONCURRENCY)
+        start.update({k: v for k, v in kwargs.items() if v is not None})
+        tuner = cls(**start)
+        tuner.resumed = bool(saved)
+        return tuner
+
+    def _change(self, reason, concurrency=None, page_size=None):
+        old = (self.concurrency, self.page_size)
+        if concurrency is not None:
+            self.concurrency = min(max(int(concurrency), self.min_concurrency), self.max_concurrency)
+        if page_size is not None:
+            self.page_size = min(max(int(page_size), self.min_page_size), self.max_page_size)
+        if reason == "healthy window":
+            # Climbing back from quota step-downs does not lower what is saved
+            self.unbound_concurrency = max(self.unbound_concurrency, self.concurrency)
+        elif concurrency is not None and reason != "quota bound":
+            self.unbound_concurrency = self.concurrency
+        if (self.concurrency, self.page_size) != old:
+            self.adjustments += 1
+            if len(self.history) < _HISTORY_LIMIT:
+                self.history.append({
+                    "t": round(time.monotonic() - self._started, 3),
+                    "concurrency": self.concurrency,
+                    "page_size": self.page_size,
+                    "reason": reason,
+                })
+
+    def observe(self, method, seconds, status=None, waited=0.0):
+        """
+        Record one API attempt.
+
+        Args:
+            method: Short method name ("messages.get")
+            seconds: Request latency (excluding quota waits)
+            status: HTTP status of a failed attempt, None on success
+            waited: Seconds spent waiting on the quota limiter first
+        """
+        throttled = status in _THROTTLE_STATUSES
+        with self._lock:
+            self._observed += 1
+            if status is not None:
+                self._failed += 1
+            if method in _LIST_METHODS:
+                self._observe_page(seconds, throttled)
+            elif method in _FETCH_METHODS:
+                self._observe_fetch(seconds, throttled, waited)
+
+    def _observe_page(self, seconds, throttled):
+        if not self.adapt_page_size:
+            return
+        if throttled or seconds > 2 * self.page_latency:
+            self._change("slow or failed list page", page_size=self.page_size // 2)
+        elif seconds < self.page_latency / 2:
+            self._change("fast list page", page_size=self.page_size * 2)
+
+    def _observe_fetch(self, seconds, throttled, waited):
+        self._since_decrease += 1
+        if throttled:
+            # Multiplicative decrease, at most once per round of in-flight calls
+            self._errors += 1
+            if self._since_decrease >= self.concurrency:
+                self._since_decrease = 0
+                self._change("throttled (429/5xx)", concurrency=self.concurrency // 2)
+            return
+        self._latencies.append(seconds)
+        self._all_latencies.append(seconds)
+        self._waits.append(waited)
+        if len(self._latencies) < self.window:
+            return
+
+        p50 = statistics.median(self._latencies)
+        quota_bound = statistics.fmean(self._waits) > p50 / 2
+        errors = self._errors
+        self._latencies, self._waits, self._errors = [], [], 0
+        if self._baseline is None or p50 < self._baseline:
+            self._baseline = p50
+        if errors:
+            return
+        if self._baseline and p50 > self.latency_factor * self._baseline:
+            self._since_decrease = 0
+            self._change("latency inflation", concurrency=self.concurrency // 2)
+        elif quota_bound:
+            # Waiting on the quota bucket: extra threads only queue up
+            self._change("quota bound", concurrency=self.concurrency - 1)
+        else:
+            self._change("healthy window", concurrency=self.concurrency + 1)
+
+    def saved_settings(self):
+        """What save_tuning() keeps for the next run (quota step-downs excluded)."""
+        with self._lock:
+            return {"concurrency": self.unbound_concurrency, "page_size": self.page_size}
+
+    def settings(self):
+        """Current settings and the statistics they were based on."""
+        with self._lock:
+            latencies = self._all_latencies
+            return {
+                "concurrency": self.concurrency,
+                "page_size": self.page_size,
+                "adjustments": self.adjustments,
+                "observed_calls": self._observed,
+                "error_rate": round(self._failed / self._observed, 4) if self._observed else 0.0,
+                "latency_p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+            }
@@ -6,7 +6,8 @@ Runs the complete Gmail Intelligence system with real Gmail API integration.
 Handles OAuth2 authentication, email fetching, ML deduplication, and Excel export.
 
 Usage:
-    python run_main.py
+    python run_main.py                       (interactive prompts)
+    python run_main.py run --sender ... --output ...   (headless, see backend/cli.py)
 
 Requirements:
     - credentials.json must be in the backend/ directory
@@ -17,14 +18,11 @@ import sys
 import os
 import logging
 
-# Setup logging for production
+# Setup logging for production (the persistent log is added by open_event_log)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s | %(levelname)-8s | %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('execution.log', mode='a')
-    ]
+    handlers=[logging.StreamHandler(sys.stdout)]
 )
 logger = logging.getLogger(__name__)
 
@@ -32,11 +30,27 @@ logger = logging.getLogger(__name__)
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, PROJECT_ROOT)
 
-from backend.engine import Engine
-from backend.gmail import fetch_emails
-from backend.ml import resolve_identities
-from backend.excel import save_excel
-from backend.events import listen, clear
+from backend.main import run_pipeline
+from backend.cancel import CancelToken, cancel_on_sigint
+from backend.events import format_timestamp, add_sink
+from backend.settings import log_dir
+from backend.sink import EventSink, SinkLogHandler
+
+
+def open_event_log():
+    """
+    Persist events and log records to a rotating JSONL file.
+
+    Written by a background thread in batches (see backend/sink.py), so
+    neither emit() nor logging waits on disk.
+
+    Returns:
+        The EventSink (close it to flush)
+    """
+    sink = EventSink(os.path.join(log_dir(), "execution.jsonl"))
+    add_sink(sink)
+    logging.getLogger().addHandler(SinkLogHandler(sink))
+    return sink
 
 
 def main():
@@ -77,45 +91,26 @@ def main():
         
         logger.info(f"Starting pipeline with sender: {sender}")
         
-        # Clear previous events
-        clear()
-        
-        # Setup execution context
-        context = {
-            "sender": sender,
-            "output_path": output_path,
-            "enable_ml": enable_ml,
-            "verify_mx": verify_mx
-        }
-        
-        # Create and configure engine
-        engine = Engine()
-        engine.add_step(1, "Fetching Gmail Emails", "Gmail API", fetch_emails)
-        
-        if enable_ml:
-            engine.add_step(2, "Resolving Duplicate Identities", "ML Engine", resolve_identities)
-            engine.add_step(3, "Saving to Excel", "Pandas/Excel", save_excel)
-        else:
-            engine.add_step(2, "Saving to Excel", "Pandas/Excel", save_excel)
-        
-        # Run engine
+        # Same steps as the headless CLI and UI (backend.api.build_engine).
+        # First Ctrl-C stops the run cleanly (partial results are exported)
         logger.info("Running execution pipeline...")
-        success = engine.run(context)
+        with cancel_on_sigint(CancelToken()) as cancel:
+            success, context, events = run_pipeline(sender, output_path, enable_ml=enable_ml,
+                                                    verify_mx=verify_mx, cancel=cancel)
         
         # Print log table
         print("\n" + "-" * 100)
         print(f"{'Timestamp':<20} | {'Order':<5} | {'Step':<35} | {'Tool':<20} | {'Status':<15}")
         print("-" * 100)
         
-        for event in listen():
-            timestamp = event.get("timestamp", "?")
+        for event in events:
+            timestamp = format_timestamp(event)
             order = event.get("order", "?")
             step = event.get("step", "?")[:35]
             tool = event.get("tool", "?")[:20]
             status = event.get("status", "?")
             
             print(f"{timestamp:<20} | {order:<5} | {step:<35} | {tool:<20} | {status:<15}")
-            logger.info(f"Step {order}: {step} ({tool}) - {status}")
         
         print("-" * 100)
         
@@ -132,6 +127,13 @@ def main():
             logger.info(f"Recipients: {context.get('recipient_count', 0)}")
             logger.info(f"Excel file: {context.get('excel_path', '?')}")
             return 0
+        elif context.get("cancelled"):
+            print(f"\n⚠️  CANCELLED ({context['cancelled']})")
+            print(f"  Recipients fetched before stopping: {len(context.get('emails') or [])}")
+            if context.get("excel_path"):
+                print(f"  Partial results saved: {context['excel_path']}")
+            logger.warning(f"Pipeline cancelled: {context['cancelled']}")
+            return 130
         else:
             print(f"\n✗ FAILED ✗")
             print(f"Check logs above for errors")
@@ -150,4 +152,13 @@ def main():
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    if len(sys.argv) > 1:
+        # Any arguments -> headless CLI (run/resume/benchmark/cache)
+        from backend.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+    event_log = open_event_log()
+    try:
+        exit_code = main()
+    finally:
+        event_log.close()
+    sys.exit(exit_code)
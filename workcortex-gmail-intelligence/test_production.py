@@ -15,7 +15,7 @@ from backend.engine import Engine
 from backend.gmail import fetch_emails
 from backend.ml import resolve_identities
 from backend.excel import save_excel
-from backend.events import listen, clear
+from backend.events import listen, clear, format_timestamp
 
 def test_production():
     """Test production with real Gmail API"""
@@ -63,7 +63,7 @@ def test_production():
     print("-"*100)
     
     for event in listen():
-        timestamp = event.get("timestamp", "?")
+        timestamp = format_timestamp(event)
         order = event.get("order", "?")
         step = event.get("step", "?")[:35]
         tool = event.get("tool", "?")[:20]
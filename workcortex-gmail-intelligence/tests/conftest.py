@@ -0,0 +1,48 @@
+"""
+Shared fixtures for the regression tests.
+
+Every test gets its own WorkCortex home (caches, tuning, results store)
+and runs against the fake Gmail service (backend/fakegmail.py), so no
+credentials or network are needed.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def workcortex_home(tmp_path, monkeypatch):
+    """Isolated WORKCORTEX_HOME; no fake/real token settings leak in."""
+    home = tmp_path / "home"
+    monkeypatch.setenv("WORKCORTEX_HOME", str(home))
+    for name in ("GMAIL_FAKE", "GMAIL_TOKEN_PATH", "GMAIL_TOKEN_PATHS"):
+        monkeypatch.delenv(name, raising=False)
+    return home
+
+
+@pytest.fixture
+def fake_context(tmp_path):
+    """
+    Build a pipeline context served by a fresh fake Gmail mailbox.
+
+    Usage: fake_context("messages=200,error_rate=0.2", incremental=True)
+    """
+    def make(spec="messages=200", **options):
+        from backend.fakegmail import from_spec
+        context = {
+            "sender": "sender@example.com",
+            "output_path": str(tmp_path / "recipients.csv"),
+            "enable_ml": False,
+            "service": from_spec(spec),
+            # Fail fast: an injected error skips the message instead of retrying
+            "api_retries": 0,
+            "retry_backoff": 0.0,
+            "shared_quota": False,
+        }
+        context.update(options)
+        return context
+    return make
@@ -0,0 +1,47 @@
+"""Multi-account extraction: accounts are kept apart even when token names collide."""
+
+import os
+
+from backend.accounts import account_labels, account_paths
+from backend.api import run_pipeline
+
+
+def test_colliding_token_names_get_directory_labels(tmp_path):
+    work = str(tmp_path / "work" / "token.json")
+    home = str(tmp_path / "home" / "token.json")
+    other = str(tmp_path / "other.json")
+    assert account_labels([work, home, other]) == {
+        work: "work/token", home: "home/token", other: "other",
+    }
+
+
+def test_same_token_listed_twice_is_fetched_once(tmp_path):
+    token = str(tmp_path / "work" / "token.json")
+    twice = os.path.join(str(tmp_path), "work", ".", "token.json")
+    assert account_paths({"accounts": [token, twice]}) == [token]
+
+
+def test_accounts_with_same_token_name_are_not_merged(tmp_path, monkeypatch):
+    # Each token path salts the fake mailbox, so the accounts differ
+    monkeypatch.setenv("GMAIL_FAKE", "messages=150,seed=3")
+    work = str(tmp_path / "work" / "token.json")
+    home = str(tmp_path / "home" / "token.json")
+    context = {
+        "sender": "sender@example.com",
+        "output_path": str(tmp_path / "recipients.csv"),
+        "enable_ml": False,
+        "result_cache": False,
+        "auto_tune": False,
+        "accounts": [work, home],
+    }
+    assert run_pipeline(context)
+
+    summary = context["accounts_summary"]
+    assert set(summary) == {"work/token", "home/token"}
+    assert summary["work/token"]["token_path"] == work
+    assert summary["work/token"]["receiver"] != summary["home/token"]["receiver"]
+    assert context["message_count"] == sum(s["messages"] for s in summary.values())
+
+    ids = context["message_ids"]
+    assert len(ids) == len(set(ids)) == context["message_count"]
+    assert {i.rpartition(":")[0] for i in ids} == {"work/token", "home/token"}
@@ -0,0 +1,48 @@
+"""Result cache: complete runs are reused, partial runs never are."""
+
+import json
+import os
+
+from backend import cache
+from backend.api import run_pipeline
+
+CLEAN = "messages=300,seed=1"
+# Seeded: the listing pages succeed, ~15% of the message gets fail
+FLAKY = "messages=300,seed=1,error_rate=0.2"
+
+
+def test_complete_run_is_served_from_cache(fake_context):
+    first = fake_context(CLEAN)
+    assert run_pipeline(first)
+    assert not first["cache_hit"]
+
+    second = fake_context(CLEAN)
+    assert run_pipeline(second)
+    assert second["cache_hit"]
+    assert second["recipient_count"] == first["recipient_count"]
+
+
+def test_partial_run_is_not_stored(fake_context):
+    context = fake_context(FLAKY)
+    assert run_pipeline(context)
+    assert context["partial"] and context["fetch_failures"]
+    assert not os.path.exists(cache._meta_path(context["result_digest"]))
+
+    again = fake_context(FLAKY)
+    assert run_pipeline(again)
+    assert not again["cache_hit"]
+
+
+def test_entry_recorded_as_partial_is_a_miss(fake_context):
+    context = fake_context(CLEAN)
+    assert run_pipeline(context)
+    meta_path = cache._meta_path(context["result_digest"])
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta["partial"] = True
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+
+    again = fake_context(CLEAN)
+    assert run_pipeline(again)
+    assert not again["cache_hit"]
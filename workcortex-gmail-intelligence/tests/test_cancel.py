@@ -0,0 +1,51 @@
+"""Cancellation and deadlines: runs stop early and keep what they fetched."""
+
+import json
+import os
+import threading
+
+from backend import cli
+from backend.api import run_pipeline
+from backend.cancel import CancelToken
+from backend.excel import partial_output_path
+from backend.settings import last_run_path
+
+# Slow enough that a run is still fetching when it is stopped
+SLOW = "messages=2000,latency=0.01,seed=6"
+
+
+def test_cancelled_run_exports_partial_file(fake_context, tmp_path):
+    output = tmp_path / "recipients.csv"
+    output.write_text("recipient_email\nkept@example.com\n")
+    cancel = CancelToken()
+    context = fake_context(SLOW, output_path=str(output), cancel=cancel)
+    timer = threading.Timer(0.5, cancel.cancel, args=("interrupted",))
+    timer.start()
+    try:
+        assert not run_pipeline(context)
+    finally:
+        timer.cancel()
+
+    assert context["cancelled"] == "interrupted"
+    assert context["partial"]
+    # The previous complete output is left alone
+    assert output.read_text() == "recipient_email\nkept@example.com\n"
+    assert context["excel_path"] == partial_output_path(str(output))
+    assert os.path.exists(context["excel_path"])
+    assert not context.get("cache_hit")
+
+
+def test_cli_deadline_exits_124_with_partial_summary(tmp_path, monkeypatch):
+    monkeypatch.setenv("GMAIL_FAKE", SLOW)
+    output = str(tmp_path / "recipients.csv")
+    options = dict(cli.RUN_DEFAULTS, sender="sender@example.com", output_path=output,
+                   enable_ml=False, deadline=0.5)
+    assert cli.execute(options, events_mode="none") == 124
+
+    with open(last_run_path()) as f:
+        summary = json.load(f)
+    assert summary["status"] == "CANCELLED"
+    assert summary["cancelled"] == "deadline exceeded"
+    assert summary["partial"]
+    assert summary["output_path"] == partial_output_path(output)
+    assert not os.path.exists(output)
@@ -0,0 +1,44 @@
+"""Incremental export: new runs are merged into the existing output."""
+
+import csv
+
+from backend.api import run_pipeline
+
+
+def _rows(path):
+    with open(path, newline="") as f:
+        return {row["recipient_email"]: row for row in csv.DictReader(f)}
+
+
+def test_incremental_merge_matches_full_export(fake_context, tmp_path):
+    output = str(tmp_path / "recipients.csv")
+    # Same seed: the 150-message mailbox is the 100-message one plus newer mail
+    first = fake_context("messages=100,seed=4", output_path=output, incremental=True)
+    assert run_pipeline(first)
+    assert first["export_delta"]["mode"] == "full"
+    before = _rows(output)
+
+    second = fake_context("messages=150,seed=4", output_path=output, incremental=True)
+    assert run_pipeline(second)
+    delta = second["export_delta"]
+    assert delta["added"] > 0
+    assert delta["total"] == len(before) + delta["added"]
+
+    full = fake_context("messages=150,seed=4", output_path=str(tmp_path / "full.csv"))
+    assert run_pipeline(full)
+    merged = _rows(output)
+    assert set(merged) == set(_rows(full["excel_path"]))
+    assert set(before) <= set(merged)
+    assert {"count", "first_seen", "last_seen"} <= set(next(iter(merged.values())))
+
+
+def test_rerun_with_same_messages_changes_nothing(fake_context, tmp_path):
+    output = str(tmp_path / "recipients.csv")
+    assert run_pipeline(fake_context("messages=120,seed=5", output_path=output, incremental=True))
+    before = _rows(output)
+
+    again = fake_context("messages=120,seed=5", output_path=output, incremental=True)
+    assert run_pipeline(again)
+    assert again["export_delta"]["added"] == again["export_delta"]["updated"] == 0
+    # Messages already merged are not counted twice
+    assert _rows(output) == before
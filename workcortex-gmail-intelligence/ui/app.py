@@ -16,14 +16,20 @@ import time
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Try importing backend package; if that fails adjust path and retry
 try:
-    from backend.events import listen, clear
+    from backend.events import listen, clear, format_timestamp
     from backend.main import run_pipeline
+    from backend.api import run_pipeline as run_context_pipeline
     from backend.gmail import authenticate
+    from backend.results import ResultStore, SORTS
+    from backend.jobs import JobQueue, FINISHED
 except Exception:
     sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-    from backend.events import listen, clear
+    from backend.events import listen, clear, format_timestamp
     from backend.main import run_pipeline
+    from backend.api import run_pipeline as run_context_pipeline
     from backend.gmail import authenticate
+    from backend.results import ResultStore, SORTS
+    from backend.jobs import JobQueue, FINISHED
 
 
 # Page config
@@ -33,6 +39,27 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def result_store():
+    """One shared connection to the indexed results store."""
+    return ResultStore()
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def load_result_page(run_id, prefix, domain, sort, descending, page, page_size):
+    """One page of a run's recipients (cached per run id and query)."""
+    rows, total = result_store().page(
+        run_id, page * page_size, page_size, prefix or None, domain or None, sort, descending
+    )
+    return pd.DataFrame(rows, columns=["Recipient", "Domain", "Count"]), total
+
+
+@st.cache_data(show_spinner=False)
+def load_result_domains(run_id):
+    """Domains of a run, most common first (cached per run id)."""
+    return result_store().domains(run_id)
+
+
 # Title and description
 st.title("📧 WorkCortex Gmail Intelligence")
 st.markdown("Extract recipient emails from Gmail and apply ML-based identity resolution.")
@@ -48,6 +75,10 @@ if 'events' not in st.session_state:
     st.session_state.events = []
 if 'context' not in st.session_state:
     st.session_state.context = {}
+if 'preview' not in st.session_state:
+    st.session_state.preview = None
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
 
 # Sidebar: Authentication
 st.sidebar.header("🔐 Authentication")
@@ -93,14 +124,69 @@ if st.session_state.authenticated_email:
         help="Group similar email addresses"
     )
     
+    export_clusters = st.sidebar.checkbox(
+        "Export identity cluster report",
+        value=False,
+        disabled=not enable_ml,
+        help="Add a sheet listing each cluster's members, canonical pick and match scores"
+    )
+    
+    export_groups = st.sidebar.checkbox(
+        "Export recipient groups",
+        value=False,
+        help="Add a sheet of addresses that are regularly addressed together (teams, distribution circles)"
+    )
+    
+    export_analytics = st.sidebar.checkbox(
+        "Export recipient analytics",
+        value=False,
+        help="Add Domains and Top Recipients sheets (recipients per domain, most frequent recipients)"
+    )
+    
     verify_mx = st.sidebar.checkbox(
         "Verify recipient domains (MX lookup)",
         value=False,
         help="Perform MX DNS lookup to ensure recipient domains accept email"
     )
     
+    incremental = st.sidebar.checkbox(
+        "Merge into existing output",
+        value=False,
+        help="Append new recipients and update counts/last-seen in the existing file instead of rewriting it"
+    )
+    
+    time_budget = st.sidebar.number_input(
+        "Time budget (minutes, 0 = none)",
+        min_value=0, value=0, step=5,
+        help="Stop the run when it takes longer; recipients fetched so far are still reported"
+    )
+    deadline = time_budget * 60 or None
+    
+    run_in_background = st.sidebar.checkbox(
+        "Run in background (job queue)",
+        value=False,
+        help="Queue the run for the worker daemon (python -m backend.cli worker) instead of running it here"
+    )
+    
     # Main controls
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
+    
+    with col3:
+        if st.button("🔎 Preview", disabled=st.session_state.running or not sender_email,
+                     help="Estimate messages and distinct recipients from a sample before a full run"):
+            preview_ctx = {
+                "sender": sender_email,
+                "preview": True,
+                "service": st.session_state.service
+            }
+            with st.spinner("Sampling mailbox..."):
+                if run_context_pipeline(preview_ctx):
+                    st.session_state.preview = preview_ctx.get("preview_result")
+                else:
+                    st.session_state.preview = {"_error": next(
+                        (e["status"] for e in listen() if str(e.get("status", "")).startswith("FAILED")),
+                        "Preview failed"
+                    )}
     
     with col1:
         if st.button("🚀 Start Execution", disabled=st.session_state.running or not sender_email or not output_path):
@@ -108,6 +194,22 @@ if st.session_state.authenticated_email:
                 st.error("Please enter a sender email")
             elif not output_path:
                 st.error("Please enter an output path")
+            elif run_in_background:
+                # The worker authenticates with the saved token itself
+                st.session_state.job_id = JobQueue().submit({
+                    "sender": sender_email,
+                    "output_path": os.path.abspath(output_path),
+                    "enable_ml": enable_ml,
+                    "verify_mx": verify_mx,
+                    "export_clusters": enable_ml and export_clusters,
+                    "export_groups": export_groups,
+                    "export_analytics": export_analytics,
+                    "incremental": incremental,
+                    "deadline": deadline,
+                })
+                st.session_state.events = []
+                st.session_state.context = {}
+                st.rerun()
             else:
                 st.session_state.running = True
                 st.session_state.events = []
@@ -118,6 +220,7 @@ if st.session_state.authenticated_email:
                     "output_path": output_path,
                     "enable_ml": enable_ml,
                     "verify_mx": verify_mx,
+                    "export_clusters": enable_ml and export_clusters,
                     "service": st.session_state.service  # Pass authenticated service
                 }
                 
@@ -129,7 +232,12 @@ if st.session_state.authenticated_email:
                         context["output_path"],
                         enable_ml=context["enable_ml"],
                         verify_mx=context["verify_mx"],
-                        service=context.get("service")
+                        service=context.get("service"),
+                        export_clusters=context["export_clusters"],
+                        incremental=incremental,
+                        export_groups=export_groups,
+                        deadline=deadline,
+                        export_analytics=export_analytics
                     )
                     st.session_state.context = result_ctx
                     st.session_state.events = events
@@ -144,9 +252,68 @@ if st.session_state.authenticated_email:
         if st.button("🔄 Reset", disabled=st.session_state.running):
             st.session_state.events = []
             st.session_state.context = {}
+            st.session_state.preview = None
+            st.session_state.job_id = None
             clear()
             st.rerun()
     
+    # Display preview estimate
+    preview = st.session_state.preview
+    if preview:
+        st.header("🔎 Preview")
+        if preview.get("_error"):
+            st.error(f"❌ {preview['_error']}")
+        else:
+            recipients = preview["recipients"]
+            domains = preview["domains"]
+            p1, p2, p3 = st.columns(3)
+            with p1:
+                st.metric("Messages (estimate)", f"~{preview['messages_estimate']:,}")
+            with p2:
+                st.metric("Distinct recipients", f"~{recipients['point_estimate']:,}")
+                st.caption(f"95% range {recipients['total_estimate'][0]:,} – {recipients['total_estimate'][1]:,}")
+            with p3:
+                st.metric("Distinct domains", f"~{domains['point_estimate']:,}")
+                st.caption(f"95% range {domains['total_estimate'][0]:,} – {domains['total_estimate'][1]:,}")
+            st.caption(
+                f"From {preview['sampled_messages']} sampled messages in {preview['seconds']}s "
+                f"({preview['quota_units']} quota units)"
+            )
+    
+    # Display background job progress
+    if st.session_state.job_id:
+        queue = JobQueue()
+        job = queue.get(st.session_state.job_id)
+        st.header(f"📦 Background Job #{st.session_state.job_id}")
+        if job is None:
+            st.error("Job not found")
+        else:
+            j1, j2, j3 = st.columns([2, 1, 1])
+            with j1:
+                st.metric("Status", job["status"])
+            with j2:
+                if st.button("🔄 Refresh", key="job_refresh"):
+                    st.rerun()
+            with j3:
+                if st.button("⛔ Cancel", key="job_cancel", disabled=job["status"] in FINISHED):
+                    queue.cancel(job["id"])
+                    st.rerun()
+            st.session_state.events = queue.events(job["id"])
+            if job["status"] == "QUEUED":
+                st.caption("Waiting for a worker: python -m backend.cli worker")
+            elif job["status"] in FINISHED:
+                summary = job["result"] or {}
+                st.session_state.context = {
+                    "excel_path": summary.get("output_path") if job["status"] in ("SUCCESS", "CANCELLED") else None,
+                    "recipient_count": (summary.get("counts") or {}).get("recipients"),
+                    "identity_count": (summary.get("counts") or {}).get("identities"),
+                    "results_run_id": summary.get("results_run_id"),
+                    "analytics": summary.get("analytics"),
+                    "cancelled": summary.get("cancelled") or (job["error"] if job["status"] == "CANCELLED" else None),
+                    "partial_recipients": (summary.get("counts") or {}).get("fetched_recipients"),
+                    "_error": job["error"] if job["status"] == "FAILED" else None,
+                }
+    
     # Display execution log
     if st.session_state.events:
         st.header("📋 Execution Log")
@@ -155,7 +322,7 @@ if st.session_state.authenticated_email:
         events_data = []
         for event in st.session_state.events:
             events_data.append({
-                "Timestamp": event.get("timestamp", "?"),
+                "Timestamp": format_timestamp(event),
                 "Order": event.get("order", "?"),
                 "Step": event.get("step", "?"),
                 "Tool": event.get("tool", "?"),
@@ -173,7 +340,11 @@ if st.session_state.authenticated_email:
         st.header("✨ Results")
         
         if context.get("excel_path"):
-            st.success("✓ Execution completed successfully")
+            if context.get("cancelled"):
+                st.warning(f"⛔ Execution cancelled ({context['cancelled']}) - "
+                           "recipients fetched before stopping were saved to a partial file")
+            else:
+                st.success("✓ Execution completed successfully")
             
             col1, col2, col3 = st.columns(3)
             
@@ -186,6 +357,52 @@ if st.session_state.authenticated_email:
             with col3:
                 if enable_ml:
                     st.metric("Identities", context.get("identity_count", 0))
+            
+            # Domain / top-recipient aggregates computed during the fetch
+            analytics = context.get("analytics")
+            if analytics and analytics.get("domains"):
+                st.subheader("📊 Traffic")
+                st.caption(f"{analytics['occurrences']:,} recipient occurrences across "
+                           f"{analytics['messages']:,} messages and {analytics['domain_count']:,} domains")
+                t1, t2 = st.columns(2)
+                with t1:
+                    df_domains = pd.DataFrame(analytics["domains"][:15])
+                    st.bar_chart(df_domains.set_index("domain")["occurrences"])
+                with t2:
+                    df_top = pd.DataFrame(analytics["top_recipients"],
+                                          columns=["rank", "recipient_email", "count", "lower_bound"])
+                    st.dataframe(df_top, use_container_width=True, hide_index=True)
+            
+            # Browse recipients from the indexed store, one page at a time
+            run_id = context.get("results_run_id")
+            if run_id:
+                st.subheader("🔍 Browse Recipients")
+                f1, f2, f3, f4 = st.columns([3, 3, 2, 1])
+                with f1:
+                    prefix = st.text_input("Starts with", key="results_prefix").strip()
+                with f2:
+                    domain_counts = load_result_domains(run_id)
+                    domain = st.selectbox(
+                        "Domain", [""] + [d for d, _ in domain_counts],
+                        format_func=lambda d: d or "All domains", key="results_domain"
+                    )
+                with f3:
+                    sort = st.selectbox("Sort by", list(SORTS), key="results_sort")
+                with f4:
+                    descending = st.checkbox("Desc", key="results_desc")
+                
+                page_size = 100
+                _, total = load_result_page(run_id, prefix, domain, sort, descending, 0, page_size)
+                pages = max(1, -(-total // page_size))
+                page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1,
+                                       key="results_page") - 1
+                df_page, total = load_result_page(run_id, prefix, domain, sort, descending, page, page_size)
+                st.dataframe(df_page, use_container_width=True, hide_index=True)
+                st.caption(f"{total:,} matching recipients")
+        elif context.get("cancelled"):
+            fetched = context.get("partial_recipients", len(context.get("emails") or []))
+            st.warning(f"⛔ Execution cancelled ({context['cancelled']}) - "
+                       f"{fetched or 0} recipients fetched before stopping, nothing exported")
         elif context.get("_error"):
             st.error(f"❌ Execution failed: {context.get('_error')}")
 else: